@@ -69,6 +69,9 @@ version = distro.version
 release = distro.version
 
 exclude_patterns = ['_build']
+if sys.version_info < (3, 5):
+    # asyncio_util can only be imported, and so documented, on Python 3.5+.
+    exclude_patterns.append('source/oauth2client.contrib.asyncio_util.rst')
 
 # -- Options for HTML output ----------------------------------------------
 
@@ -22,12 +22,16 @@ import copy
 import datetime
 import json
 import logging
+from multiprocessing import pool as multiprocessing_pool
 import os
 import shutil
 import socket
 import sys
 import tempfile
+import threading
+import weakref
 
+import httplib2
 import six
 from six.moves import http_client
 from six.moves import urllib
@@ -96,6 +100,11 @@ _WELL_KNOWN_CREDENTIALS_FILE = 'application_default_credentials.json'
 AccessTokenInfo = collections.namedtuple(
     'AccessTokenInfo', ['access_token', 'expires_in'])
 
+# The result of verifying one of the id_tokens passed to verify_id_tokens():
+# either the deserialized JSON payload or the error raised.
+IdTokenVerification = collections.namedtuple(
+    'IdTokenVerification', ['payload', 'error'])
+
 DEFAULT_ENV_NAME = 'UNKNOWN'
 
 # If set to True _get_environment avoid GCE check (_detect_gce_environment)
@@ -118,6 +127,38 @@ _DESIRED_METADATA_FLAVOR = 'Google'
 # easier testing (by replacing with a stub).
 _UTCNOW = datetime.datetime.utcnow
 
+# Default number of seconds before token_expiry at which a refresh-ahead
+# background refresh is started.
+REFRESH_AHEAD_SECS = 300
+# Seconds to wait before retrying a failed background refresh.
+_REFRESH_AHEAD_RETRY_SECS = 30
+# Minimum seconds between two background refreshes, for tokens that expire
+# as soon as they are obtained.
+_REFRESH_AHEAD_MIN_INTERVAL_SECS = 10
+# Upper bound on how long before their max-age runs out certificates used
+# by verify_id_token() are refetched in the background.
+_CERTS_REFETCH_AHEAD_SECS = 300
+# Maximum number of id_tokens verified by one task of verify_id_tokens().
+_VERIFY_ID_TOKENS_CHUNK_SIZE = 32
+# Most PEM certificates whose parsed verifiers each process keeps.
+_MAX_PEM_VERIFIERS = 64
+
+# Version of the encoding written by Credentials.to_compact_json().
+COMPACT_JSON_VERSION = 1
+# The credentials classes with a compact JSON encoding, by the tag naming
+# them in it. Classes are looked up by name so that no module has to be
+# imported before its credentials are read.
+_COMPACT_JSON_CLASSES = {
+    'oauth2': ('oauth2client_latest.client', 'OAuth2Credentials'),
+    'service_account': ('oauth2client_latest.service_account',
+                        'ServiceAccountCredentials'),
+}
+_COMPACT_JSON_TAGS = dict(
+    (path, tag) for tag, path in _COMPACT_JSON_CLASSES.items())
+# Credentials classes by the module and class names written by to_json().
+# Filled in as new_from_json() finds classes, and with the built-in ones.
+_CREDENTIALS_CLASSES = {}
+
 # NOTE: These names were previously defined in this module but have been
 #       moved into `oauth2client_latest.transport`,
 clean_headers = transport.clean_headers
@@ -283,35 +324,57 @@ class Credentials(object):
         """
         return self._to_json(self.NON_SERIALIZED_MEMBERS)
 
+    def to_compact_json(self, strip_token_response=False):
+        """Creates a compact JSON representation of an instance of Credentials.
+
+        The representation is a versioned list of the values of the
+        credentials, without their names, and is quicker to write and read
+        than the one of to_json(). Credentials types without a compact
+        encoding fall back to to_json().
+
+        Args:
+            strip_token_response: bool, whether to leave out the response to
+                                  the last token request, which the
+                                  credentials do not need to work.
+
+        Returns:
+            string, a JSON representation of this instance, suitable to pass to
+            new_from_json().
+        """
+        curr_type = self.__class__
+        tag = _COMPACT_JSON_TAGS.get(
+            (curr_type.__module__, curr_type.__name__))
+        if tag is None:
+            return self.to_json()
+        values = [COMPACT_JSON_VERSION, tag]
+        values.extend(self._to_compact(strip_token_response))
+        return json.dumps(values, separators=(',', ':'))
+
     @classmethod
     def new_from_json(cls, json_data):
         """Utility class method to instantiate a Credentials subclass from JSON.
 
-        Expects the JSON string to have been produced by to_json().
+        Expects the JSON string to have been produced by to_json() or
+        to_compact_json().
 
         Args:
-            json_data: string or bytes, JSON from to_json().
+            json_data: string or bytes, JSON from to_json() or
+                       to_compact_json().
 
         Returns:
             An instance of the subclass of Credentials that was serialized with
-            to_json().
+            to_json() or to_compact_json().
+
+        Raises:
+            ValueError if the JSON is of a newer compact encoding.
         """
         json_data_as_unicode = _helpers._from_bytes(json_data)
         data = json.loads(json_data_as_unicode)
+        if isinstance(data, list):
+            return _from_compact_json(data)
         # Find and call the right classmethod from_json() to restore
         # the object.
-        module_name = data['_module']
-        try:
-            module_obj = __import__(module_name)
-        except ImportError:
-            # In case there's an object from the old package structure,
-            # update it
-            module_name = module_name.replace('.googleapiclient', '')
-            module_obj = __import__(module_name)
-
-        module_obj = __import__(module_name,
-                                fromlist=module_name.split('.')[:-1])
-        kls = getattr(module_obj, data['_class'])
+        kls = _find_credentials_class(data['_module'], data['_class'])
         return kls.from_json(json_data_as_unicode)
 
     @classmethod
@@ -329,6 +392,75 @@ class Credentials(object):
         return Credentials()
 
 
+def _register_credentials_classes(*classes):
+    """Lets new_from_json() find credentials classes without imports."""
+    for kls in classes:
+        _CREDENTIALS_CLASSES[(kls.__module__, kls.__name__)] = kls
+
+
+def _find_credentials_class(module_name, class_name):
+    """Finds a credentials class by the names written by to_json().
+
+    Classes are imported the first time they are needed, and remembered.
+
+    Args:
+        module_name: string, the name of the module of the class.
+        class_name: string, the name of the class.
+
+    Returns:
+        The class.
+
+    Raises:
+        ImportError if the module cannot be imported.
+        AttributeError if the module has no such class.
+    """
+    key = (module_name, class_name)
+    try:
+        return _CREDENTIALS_CLASSES[key]
+    except KeyError:
+        pass
+
+    try:
+        __import__(module_name)
+    except ImportError:
+        # In case there's an object from the old package structure,
+        # update it
+        module_name = module_name.replace('.googleapiclient', '')
+        __import__(module_name)
+
+    module_obj = __import__(module_name,
+                            fromlist=module_name.split('.')[:-1])
+    kls = getattr(module_obj, class_name)
+    _CREDENTIALS_CLASSES[key] = kls
+    return kls
+
+
+def _from_compact_json(data):
+    """Instantiates Credentials from the output of to_compact_json().
+
+    Args:
+        data: list, the deserialized JSON.
+
+    Returns:
+        An instance of the subclass of Credentials that was serialized.
+
+    Raises:
+        ValueError if the encoding is of another version or names an unknown
+        credentials type.
+    """
+    version, tag = data[:2]
+    if version != COMPACT_JSON_VERSION:
+        raise ValueError(
+            'Unsupported compact credentials version: {0}'.format(version))
+    try:
+        module_name, class_name = _COMPACT_JSON_CLASSES[tag]
+    except KeyError:
+        raise ValueError(
+            'Unknown compact credentials type: {0}'.format(tag))
+    kls = _find_credentials_class(module_name, class_name)
+    return kls._from_compact(data[2:])
+
+
 class Flow(object):
     """Base class for all Flow objects."""
     pass
@@ -439,6 +571,194 @@ class Storage(object):
             self.release_lock()
 
 
+class _RefreshCall(object):
+    """A single in-flight refresh shared by every thread waiting on it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+        self.leader = threading.current_thread()
+
+
+class _RefreshFlight(object):
+    """Coalesces concurrent refreshes of a single credentials object.
+
+    The first thread to call :meth:`run` performs the refresh. Threads that
+    call :meth:`run` while that refresh is in progress block until it
+    finishes and then share its outcome: they return if it succeeded and
+    re-raise its exception if it failed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._call = None
+
+    def run(self, refresh_func, http_request, needs_refresh=None):
+        """Runs ``refresh_func(http_request)`` or joins the in-flight call.
+
+        Args:
+            refresh_func: callable, performs the refresh.
+            http_request: callable, passed through to ``refresh_func``.
+                          Ignored if another thread's refresh is joined.
+            needs_refresh: callable, (Optional) checked before starting a
+                           new refresh. If it returns False, a refresh that
+                           finished since the caller looked already did the
+                           work, so no new refresh is started.
+        """
+        with self._lock:
+            call = self._call
+            if call is None:
+                if needs_refresh is not None and not needs_refresh():
+                    return
+                call = self._call = _RefreshCall()
+                leader = True
+            else:
+                leader = False
+
+        if not leader and call.leader is threading.current_thread():
+            # Re-entered from the leader's own ``refresh_func``.
+            refresh_func(http_request)
+            return
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return
+
+        try:
+            refresh_func(http_request)
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._call = None
+            call.done.set()
+
+
+# Refresh coordination is kept outside of the credentials themselves so
+# that it never leaks into pickled or JSON serialized state.
+_refresh_flights = weakref.WeakKeyDictionary()
+_refresh_flights_lock = threading.Lock()
+
+
+def _get_refresh_flight(credentials):
+    """Gets or creates the refresh coordinator for a credentials object.
+
+    Args:
+        credentials: Credentials, the credentials being refreshed.
+
+    Returns:
+        An instance of :class:`_RefreshFlight`.
+    """
+    with _refresh_flights_lock:
+        flight = _refresh_flights.get(credentials)
+        if flight is None:
+            flight = _refresh_flights[credentials] = _RefreshFlight()
+        return flight
+
+
+class _RefreshAhead(object):
+    """Refreshes a credentials object in the background before it expires.
+
+    A daemon timer is scheduled to fire ``skew_secs`` before the
+    credentials' ``token_expiry``, or halfway through the lifetime of
+    tokens that live less than twice as long. When it fires, the
+    credentials are refreshed with ``_refresh`` (so a :class:`Storage` set
+    with ``set_store`` is consulted and written to as usual) and the next
+    refresh is scheduled, at least ``_REFRESH_AHEAD_MIN_INTERVAL_SECS``
+    later. Nothing is scheduled while the credentials are invalid. Only a
+    weak reference to the credentials is held, so the timer never keeps
+    them alive.
+    """
+
+    def __init__(self, credentials, http, skew_secs):
+        self._credentials = weakref.ref(credentials)
+        self._http = http
+        self._skew = datetime.timedelta(seconds=skew_secs)
+        self._lock = threading.Lock()
+        self._timer = None
+        self._stopped = False
+        # The access token last seen, and when it was first seen.
+        self._token = None
+        self._token_seen = None
+
+    def _delay(self, credentials):
+        """Seconds until the next refresh is due, or None if never."""
+        if credentials.invalid:
+            # Refreshing can't succeed until the credentials are replaced.
+            return None
+        if not credentials.access_token:
+            return 0
+        if not credentials.token_expiry:
+            return None
+        now = _UTCNOW()
+        if credentials.access_token != self._token:
+            self._token = credentials.access_token
+            self._token_seen = now
+        # Short-lived tokens are refreshed halfway through their lifetime
+        # rather than as soon as they are obtained.
+        lifetime = credentials.token_expiry - self._token_seen
+        skew = min(self._skew, max(lifetime, datetime.timedelta()) // 2)
+        delta = credentials.token_expiry - skew - now
+        return max(0, delta.days * 86400 + delta.seconds)
+
+    def schedule(self, delay=None):
+        """Schedules the next background refresh.
+
+        Args:
+            delay: int, seconds to wait. Defaults to the time remaining
+                   until the refresh-ahead window of the current token.
+        """
+        credentials = self._credentials()
+        if credentials is None:
+            return
+        if delay is None:
+            delay = self._delay(credentials)
+            if delay is None:
+                return
+        with self._lock:
+            if self._stopped:
+                return
+            self._timer = threading.Timer(delay, self._run)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def stop(self):
+        """Cancels any scheduled background refresh."""
+        with self._lock:
+            self._stopped = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _run(self):
+        credentials = self._credentials()
+        if credentials is None or self._stopped:
+            return
+        # The token may have been refreshed on the request path since this
+        # timer was scheduled, in which case there is nothing to do yet.
+        if self._delay(credentials) == 0:
+            http = self._http or transport.get_http_object()
+            try:
+                credentials._refresh(http.request)
+            except Exception:
+                logger.warning('Background refresh of access_token failed.',
+                               exc_info=True)
+                if not credentials.invalid:
+                    self.schedule(_REFRESH_AHEAD_RETRY_SECS)
+                return
+            delay = self._delay(credentials)
+            if delay is not None:
+                self.schedule(max(delay, _REFRESH_AHEAD_MIN_INTERVAL_SECS))
+            return
+        self.schedule()
+
+
+_refresh_aheads = weakref.WeakKeyDictionary()
+_refresh_aheads_lock = threading.Lock()
+
+
 def _update_query_params(uri, params):
     """Updates a URI with new query parameters.
 
@@ -645,6 +965,35 @@ class OAuth2Credentials(Credentials):
         retval.invalid = data['invalid']
         return retval
 
+    def _to_compact(self, strip_token_response):
+        """Lists the values of the credentials for to_compact_json()."""
+        if strip_token_response:
+            token_response = None
+        else:
+            token_response = self.token_response
+        return [self.access_token, self.client_id, self.client_secret,
+                self.refresh_token, _parse_expiry(self.token_expiry),
+                self.token_uri, self.user_agent, self.revoke_uri,
+                self.id_token, token_response, sorted(self.scopes),
+                self.token_info_uri, self.invalid]
+
+    @classmethod
+    def _from_compact(cls, values):
+        """Instantiates credentials from the values of _to_compact()."""
+        (access_token, client_id, client_secret, refresh_token, token_expiry,
+         token_uri, user_agent, revoke_uri, id_token, token_response, scopes,
+         token_info_uri, invalid) = values
+        if token_expiry is not None:
+            token_expiry = datetime.datetime.strptime(
+                token_expiry, EXPIRY_FORMAT)
+        retval = cls(
+            access_token, client_id, client_secret, refresh_token,
+            token_expiry, token_uri, user_agent, revoke_uri=revoke_uri,
+            id_token=id_token, token_response=token_response, scopes=scopes,
+            token_info_uri=token_info_uri)
+        retval.invalid = invalid
+        return retval
+
     @property
     def access_token_expired(self):
         """True if the credential is expired or invalid.
@@ -685,10 +1034,40 @@ class OAuth2Credentials(Credentials):
                    This is needed to store the latest access_token if it
                    has expired and been refreshed. This implementation uses
                    locking to check for updates before updating the
-                   access_token.
+                   access_token. If refresh-ahead is enabled, background
+                   refreshes are written back through this store as well.
         """
         self.store = store
 
+    def enable_refresh_ahead(self, http=None, skew_secs=REFRESH_AHEAD_SECS):
+        """Refresh the access_token in the background before it expires.
+
+        Once enabled, a background timer refreshes the access_token
+        ``skew_secs`` seconds before ``token_expiry``, so requests made with
+        these credentials don't have to block on a refresh. Refreshed tokens
+        are written to the Storage set with :meth:`set_store`, if any.
+
+        Args:
+            http: httplib2.Http, an http object to be used to make the refresh
+                  requests. It is only used from the background thread.
+                  Defaults to a new http object for each refresh.
+            skew_secs: int, how many seconds before expiry to refresh.
+                       Nothing is refreshed while the credentials are
+                       invalid.
+        """
+        self.disable_refresh_ahead()
+        refresh_ahead = _RefreshAhead(self, http, skew_secs)
+        with _refresh_aheads_lock:
+            _refresh_aheads[self] = refresh_ahead
+        refresh_ahead.schedule()
+
+    def disable_refresh_ahead(self):
+        """Stop refreshing the access_token in the background."""
+        with _refresh_aheads_lock:
+            refresh_ahead = _refresh_aheads.pop(self, None)
+        if refresh_ahead is not None:
+            refresh_ahead.stop()
+
     def _expires_in(self):
         """Return the number of seconds until this token expires.
 
@@ -748,6 +1127,43 @@ class OAuth2Credentials(Credentials):
     def _refresh(self, http_request):
         """Refreshes the access_token.
 
+        Concurrent calls from multiple threads on the same credentials are
+        coalesced: one thread performs the refresh and the others wait for
+        it, sharing its result or its exception.
+
+        Args:
+            http_request: callable, a callable that matches the method
+                          signature of httplib2.Http.request, used to make the
+                          refresh request.
+
+        Raises:
+            HttpAccessTokenRefreshError: When the refresh fails.
+        """
+        _get_refresh_flight(self).run(self._do_refresh, http_request)
+
+    def _refresh_if(self, http_request, needs_refresh):
+        """Refreshes the access_token if ``needs_refresh()`` still holds.
+
+        The check is made atomically with starting a refresh, so a thread
+        that decided to refresh just as another thread's refresh finished
+        does not send a second refresh request.
+
+        Args:
+            http_request: callable, a callable that matches the method
+                          signature of httplib2.Http.request, used to make the
+                          refresh request.
+            needs_refresh: callable, returns True if the access_token the
+                           caller saw still needs to be refreshed.
+
+        Raises:
+            HttpAccessTokenRefreshError: When the refresh fails.
+        """
+        _get_refresh_flight(self).run(self._refresh, http_request,
+                                      needs_refresh)
+
+    def _do_refresh(self, http_request):
+        """Refreshes the access_token, consulting the Storage first.
+
         This method first checks by reading the Storage object if available.
         If a refresh is still needed, it holds the Storage lock until the
         refresh is completed.
@@ -765,18 +1181,29 @@ class OAuth2Credentials(Credentials):
         else:
             self.store.acquire_lock()
             try:
-                new_cred = self.store.locked_get()
-
-                if (new_cred and not new_cred.invalid and
-                        new_cred.access_token != self.access_token and
-                        not new_cred.access_token_expired):
-                    logger.info('Updated access_token read from Storage')
-                    self._updateFromCredential(new_cred)
-                else:
+                if not self._locked_update_from_store():
                     self._do_refresh_request(http_request)
             finally:
                 self.store.release_lock()
 
+    def _locked_update_from_store(self):
+        """Updates from the Storage if it holds a newer, valid access_token.
+
+        The Storage lock must be held when this is called.
+
+        Returns:
+            bool, True if the credentials were updated from the Storage.
+        """
+        new_cred = self.store.locked_get()
+
+        if (new_cred and not new_cred.invalid and
+                new_cred.access_token != self.access_token and
+                not new_cred.access_token_expired):
+            logger.info('Updated access_token read from Storage')
+            self._updateFromCredential(new_cred)
+            return True
+        return False
+
     def _do_refresh_request(self, http_request):
         """Refresh the access_token using the refresh_token.
 
@@ -794,8 +1221,22 @@ class OAuth2Credentials(Credentials):
         logger.info('Refreshing access_token')
         resp, content = http_request(
             self.token_uri, method='POST', body=body, headers=headers)
+        self._process_refresh_response(resp.status, content)
+
+    def _process_refresh_response(self, status, content):
+        """Updates the credentials from a token endpoint response.
+
+        If a Storage is set, its lock must be held when this is called.
+
+        Args:
+            status: int, the HTTP status of the response.
+            content: string or bytes, the body of the response.
+
+        Raises:
+            HttpAccessTokenRefreshError: When the refresh failed.
+        """
         content = _helpers._from_bytes(content)
-        if resp.status == http_client.OK:
+        if status == http_client.OK:
             d = json.loads(content)
             self.token_response = d
             self.access_token = d['access_token']
@@ -818,7 +1259,7 @@ class OAuth2Credentials(Credentials):
             # An {'error':...} response body means the token is expired or
             # revoked, so we flag the credentials as such.
             logger.info('Failed to retrieve access token: %s', content)
-            error_msg = 'Invalid response {0}.'.format(resp['status'])
+            error_msg = 'Invalid response {0}.'.format(status)
             try:
                 d = json.loads(content)
                 if 'error' in d:
@@ -830,7 +1271,7 @@ class OAuth2Credentials(Credentials):
                         self.store.locked_put(self)
             except (TypeError, ValueError):
                 pass
-            raise HttpAccessTokenRefreshError(error_msg, status=resp.status)
+            raise HttpAccessTokenRefreshError(error_msg, status=status)
 
     def _revoke(self, http_request):
         """Revokes this credential and deletes the stored copy (if it exists).
@@ -860,10 +1301,24 @@ class OAuth2Credentials(Credentials):
         query_params = {'token': token}
         token_revoke_uri = _update_query_params(self.revoke_uri, query_params)
         resp, content = http_request(token_revoke_uri)
-        if resp.status == http_client.OK:
+        self._process_revoke_response(resp.status, content)
+
+    def _process_revoke_response(self, status, content):
+        """Invalidates the credentials from a revoke endpoint response.
+
+        Deletes the stored copy of the credentials, if any, on success.
+
+        Args:
+            status: int, the HTTP status of the response.
+            content: string or bytes, the body of the response.
+
+        Raises:
+            TokenRevokeError: If the response is not a 200 OK.
+        """
+        if status == http_client.OK:
             self.invalid = True
         else:
-            error_msg = 'Invalid response {0}.'.format(resp.status)
+            error_msg = 'Invalid response {0}.'.format(status)
             try:
                 d = json.loads(_helpers._from_bytes(content))
                 if 'error' in d:
@@ -904,12 +1359,25 @@ class OAuth2Credentials(Credentials):
         token_info_uri = _update_query_params(self.token_info_uri,
                                               query_params)
         resp, content = http_request(token_info_uri)
+        self._process_scopes_response(resp.status, content)
+
+    def _process_scopes_response(self, status, content):
+        """Updates the scopes from a token info endpoint response.
+
+        Args:
+            status: int, the HTTP status of the response.
+            content: string or bytes, the body of the response.
+
+        Raises:
+            Error: When the response is not a 200 OK, indicating the
+                   access token is invalid.
+        """
         content = _helpers._from_bytes(content)
-        if resp.status == http_client.OK:
+        if status == http_client.OK:
             d = json.loads(content)
             self.scopes = set(_helpers.string_to_scopes(d.get('scope', '')))
         else:
-            error_msg = 'Invalid response {0}.'.format(resp.status)
+            error_msg = 'Invalid response {0}.'.format(status)
             try:
                 d = json.loads(content)
                 if 'error_description' in d:
@@ -1544,6 +2012,209 @@ def _require_crypto_or_die():
         raise CryptoUnavailableError('No crypto library available')
 
 
+class _CertificateSet(object):
+    """Certificates fetched from a certs URI, parsed into verifiers.
+
+    Each certificate is parsed into a crypt.Verifier once per distinct
+    response, rather than once per verified token. The verifiers are reused
+    until the Cache-Control max-age of the certs response has passed, and
+    are refetched in the background shortly before then. Responses without
+    a max-age are not reused.
+
+    Background refetches use the http object of the latest caller: an
+    httplib2.Http is not safe to share between threads, so a new one with
+    the same timeout, proxy and CA settings is made for each refetch. Other
+    http objects, such as
+    :class:`~oauth2client_latest.contrib.urllib3_http.PooledHttp`, are
+    used as they are, so they must be safe to use from another thread.
+
+    Args:
+        cert_uri: string, URI of the certificates in JSON format.
+
+    Attributes:
+        pems: dict, the certificates in PEM format keyed by certificate ID,
+              as of the last update.
+    """
+
+    def __init__(self, cert_uri):
+        self.cert_uri = cert_uri
+        self.pems = None
+        self._content = None
+        self._verifiers = None
+        self._expiry = None
+        self._refetch_at = None
+        self._refetching = False
+        self._http = None
+        self._lock = threading.Lock()
+        # Held across a foreground fetch and parse, so that concurrent
+        # callers with no usable verifiers wait for a single fetch.
+        self._fetch_lock = threading.Lock()
+
+    def cached_verifiers(self):
+        """Returns the verifiers if they have not expired, otherwise None."""
+        certificates = self._cached_certificates()
+        if certificates is None:
+            return None
+        return certificates[1]
+
+    def _cached_certificates(self):
+        with self._lock:
+            if self._expiry is None or _UTCNOW() >= self._expiry:
+                return None
+            return self.pems, self._verifiers
+
+    def update(self, status, headers, content):
+        """Updates the verifiers from a response of the certs URI.
+
+        Args:
+            status: int, the HTTP status of the certs response.
+            headers: dict, the headers of the certs response.
+            content: string or bytes, the body of the certs response.
+
+        Returns:
+            dict, crypt.Verifier objects keyed by certificate ID.
+
+        Raises:
+            VerifyJwtTokenError: if the certs could not be retrieved.
+        """
+        return self._update(status, headers, content)[1]
+
+    def _update(self, status, headers, content):
+        if status != http_client.OK:
+            raise VerifyJwtTokenError('Status code: {0}'.format(status))
+        content = _helpers._to_bytes(content)
+        pems, verifiers = self.pems, self._verifiers
+        if content != self._content:
+            pems = json.loads(_helpers._from_bytes(content))
+            verifiers = dict(
+                (key, crypt.Verifier.from_string(pem, is_x509_cert=True))
+                for key, pem in six.iteritems(pems))
+
+        max_age = _certs_max_age(headers)
+        now = _UTCNOW()
+        with self._lock:
+            self._content = content
+            self.pems = pems
+            self._verifiers = verifiers
+            self._expiry = now + datetime.timedelta(seconds=max_age)
+            self._refetch_at = self._expiry - datetime.timedelta(
+                seconds=min(_CERTS_REFETCH_AHEAD_SECS, max_age / 10.0))
+        return pems, verifiers
+
+    def get_verifiers(self, http):
+        """Returns the verifiers, fetching the certificates if needed.
+
+        Args:
+            http: httplib2.Http, an http object used to fetch the
+                  certificates.
+
+        Returns:
+            dict, crypt.Verifier objects keyed by certificate ID.
+
+        Raises:
+            VerifyJwtTokenError: if the certs could not be retrieved.
+        """
+        return self.get_certificates(http)[1]
+
+    def get_certificates(self, http):
+        """Returns the certificates, fetching them if needed.
+
+        Args:
+            http: httplib2.Http, an http object used to fetch the
+                  certificates.
+
+        Returns:
+            tuple, the certificates in PEM format and as crypt.Verifier
+            objects, both keyed by certificate ID and from the same
+            response.
+
+        Raises:
+            VerifyJwtTokenError: if the certs could not be retrieved.
+        """
+        self._http = http
+        certificates = self._cached_certificates()
+        if certificates is not None:
+            self._maybe_refetch()
+            return certificates
+        with self._fetch_lock:
+            # Another caller may have fetched while this one waited.
+            certificates = self._cached_certificates()
+            if certificates is not None:
+                return certificates
+            resp, content = http.request(self.cert_uri)
+            return self._update(resp.status, resp, content)
+
+    def _maybe_refetch(self):
+        with self._lock:
+            if self._refetching or _UTCNOW() < self._refetch_at:
+                return
+            self._refetching = True
+        thread = threading.Thread(target=self._refetch)
+        thread.daemon = True
+        thread.start()
+
+    def _refetch(self):
+        try:
+            http = _background_http(self._http)
+            resp, content = http.request(self.cert_uri)
+            self.update(resp.status, resp, content)
+        except Exception:
+            logger.exception('Background refetch of %s failed', self.cert_uri)
+        finally:
+            with self._lock:
+                self._refetching = False
+
+
+def _background_http(http):
+    """Gets an http object like ``http`` for use from a background thread.
+
+    Args:
+        http: httplib2.Http or an object with a compatible request() method.
+
+    Returns:
+        A new httplib2.Http with the same settings if ``http`` is one,
+        otherwise ``http`` itself.
+    """
+    if not isinstance(http, httplib2.Http):
+        return http
+    return httplib2.Http(
+        timeout=http.timeout, proxy_info=http.proxy_info,
+        ca_certs=http.ca_certs,
+        disable_ssl_certificate_validation=(
+            http.disable_ssl_certificate_validation))
+
+
+def _certs_max_age(headers):
+    """Gets the Cache-Control max-age of a certs response.
+
+    Args:
+        headers: dict, the response headers, keyed by lower-case name.
+
+    Returns:
+        int, the max-age in seconds, 0 if there is none.
+    """
+    cache_control = _helpers._to_bytes(headers.get('cache-control', ''))
+    match = transport._MAX_AGE_RE.search(cache_control)
+    if match is None:
+        return 0
+    return int(match.group(1))
+
+
+# Certificate sets used by verify_id_token(), keyed by certs URI.
+_certificate_sets = {}
+_certificate_sets_lock = threading.Lock()
+
+
+def _get_certificate_set(cert_uri):
+    """Gets the _CertificateSet for a certs URI, creating it if needed."""
+    with _certificate_sets_lock:
+        certificate_set = _certificate_sets.get(cert_uri)
+        if certificate_set is None:
+            certificate_set = _CertificateSet(cert_uri)
+            _certificate_sets[cert_uri] = certificate_set
+        return certificate_set
+
+
 @_helpers.positional(2)
 def verify_id_token(id_token, audience, http=None,
                     cert_uri=ID_TOKEN_VERIFICATION_CERTS):
@@ -1552,11 +2223,17 @@ def verify_id_token(id_token, audience, http=None,
     This function requires PyOpenSSL and because of that it does not work on
     App Engine.
 
+    The certificates are parsed once and reused for as long as the
+    Cache-Control max-age of the certs response allows.
+
     Args:
         id_token: string, A Signed JWT.
         audience: string, The audience 'aud' that the token should be for.
         http: httplib2.Http, instance to use to make the HTTP request. Callers
-              should supply an instance that has caching enabled.
+              should supply an instance that has caching enabled. The
+              certificates are refetched in the background with a new
+              httplib2.Http with the same settings, or with ``http`` itself
+              if it is not an httplib2.Http.
         cert_uri: string, URI of the certificates in JSON format to
                   verify the JWT against.
 
@@ -1571,12 +2248,147 @@ def verify_id_token(id_token, audience, http=None,
     if http is None:
         http = transport.get_cached_http()
 
-    resp, content = http.request(cert_uri)
-    if resp.status == http_client.OK:
-        certs = json.loads(_helpers._from_bytes(content))
-        return crypt.verify_signed_jwt_with_certs(id_token, certs, audience)
-    else:
-        raise VerifyJwtTokenError('Status code: {0}'.format(resp.status))
+    verifiers = _get_certificate_set(cert_uri).get_verifiers(http)
+    return crypt.verify_signed_jwt_with_certs(id_token, verifiers, audience)
+
+
+@_helpers.positional(2)
+def verify_id_tokens(id_tokens, audience, http=None,
+                     cert_uri=ID_TOKEN_VERIFICATION_CERTS, pool=None):
+    """Verifies many signed JWT id_tokens.
+
+    The certificates are fetched once for all of the tokens. The tokens are
+    grouped by the certificate ID in their header and verified in chunks
+    on ``pool``, so that each chunk only needs the certificates of its
+    group.
+
+    Args:
+        id_tokens: iterable, Signed JWTs.
+        audience: string, The audience 'aud' that the tokens should be for.
+        http: httplib2.Http, instance to use to make the HTTP request. Callers
+              should supply an instance that has caching enabled. The
+              certificates are refetched in the background with a new
+              httplib2.Http with the same settings, or with ``http`` itself
+              if it is not an httplib2.Http.
+        cert_uri: string, URI of the certificates in JSON format to
+                  verify the JWTs against.
+        pool: multiprocessing.pool.ThreadPool or multiprocessing.Pool, the
+              pool the signatures are checked on. A process pool is sent
+              the certificates in PEM format, which each worker process
+              parses once and keeps.
+              Defaults to a new ThreadPool with one thread per CPU, which
+              is closed afterwards.
+
+    Returns:
+        list, an IdTokenVerification for each of the id_tokens, in order.
+
+    Raises:
+        CryptoUnavailableError: if no crypto library is available.
+        VerifyJwtTokenError: if the certs could not be retrieved.
+    """
+    _require_crypto_or_die()
+    if http is None:
+        http = transport.get_cached_http()
+    id_tokens = list(id_tokens)
+
+    pems, certs = _get_certificate_set(cert_uri).get_certificates(http)
+    if (isinstance(pool, multiprocessing_pool.Pool) and
+            not isinstance(pool, multiprocessing_pool.ThreadPool)):
+        certs = pems
+
+    results = [None] * len(id_tokens)
+    # Each token is split and its header decoded once, here; the chunks
+    # are sent the segments and key ID rather than the token.
+    groups = {}
+    for index, id_token in enumerate(id_tokens):
+        try:
+            segments = crypt._split_jwt(id_token)
+        except (crypt.AppIdentityError, ValueError) as error:
+            results[index] = IdTokenVerification(payload=None, error=error)
+            continue
+        key_id = crypt._get_key_id(segments[0])
+        if key_id not in certs:
+            key_id = None
+        groups.setdefault(key_id, []).append((index, segments))
+
+    chunks = []
+    for key_id, tokens in six.iteritems(groups):
+        chunk_certs = certs if key_id is None else {key_id: certs[key_id]}
+        for start in range(0, len(tokens), _VERIFY_ID_TOKENS_CHUNK_SIZE):
+            chunk = tokens[start:start + _VERIFY_ID_TOKENS_CHUNK_SIZE]
+            chunks.append(([index for index, _ in chunk],
+                           [segments for _, segments in chunk],
+                           key_id, chunk_certs, audience))
+
+    own_pool = pool is None
+    if own_pool:
+        pool = multiprocessing_pool.ThreadPool()
+    try:
+        chunk_results = pool.map(_verify_id_token_chunk,
+                                 [chunk[1:] for chunk in chunks])
+    finally:
+        if own_pool:
+            pool.close()
+            pool.join()
+
+    for chunk, chunk_result in zip(chunks, chunk_results):
+        for index, result in zip(chunk[0], chunk_result):
+            results[index] = result
+    return results
+
+
+def _verify_id_token_chunk(args):
+    """Verifies a chunk of id_tokens for verify_id_tokens().
+
+    Args:
+        args: tuple, the header, payload and signature segments of each
+              id_token, their key ID or None, the certificates in PEM
+              format or as verifiers keyed by certificate ID, and the
+              audience.
+
+    Returns:
+        list, an IdTokenVerification for each of the id_tokens.
+    """
+    id_tokens, key_id, certs, audience = args
+    verifiers = dict(
+        (key, _pem_verifier(cert)
+         if isinstance(cert, (six.text_type, six.binary_type)) else cert)
+        for key, cert in six.iteritems(certs))
+    results = []
+    for header, payload, signature in id_tokens:
+        try:
+            payload = crypt._verify_jwt_segments(
+                header, payload, signature, key_id, verifiers, audience)
+        except (crypt.AppIdentityError, TypeError, ValueError) as error:
+            # Malformed tokens can fail to decode before they are verified.
+            results.append(IdTokenVerification(payload=None, error=error))
+        else:
+            results.append(IdTokenVerification(payload=payload, error=None))
+    return results
+
+
+# Verifiers parsed from PEM certificates by _pem_verifier(), so that each
+# process of a process pool parses each certificate once.
+_pem_verifiers = {}
+
+
+def _pem_verifier(pem):
+    """Gets a crypt.Verifier for a PEM certificate, parsing it only once.
+
+    Args:
+        pem: string or bytes, an X.509 certificate in PEM format.
+
+    Returns:
+        crypt.Verifier, the verifier for the certificate.
+    """
+    verifier = _pem_verifiers.get(pem)
+    if verifier is None:
+        if len(_pem_verifiers) >= _MAX_PEM_VERIFIERS:
+            # The certificates have been rotated many times; start over.
+            _pem_verifiers.clear()
+        verifier = crypt.Verifier.from_string(pem, is_x509_cert=True)
+        _pem_verifiers[pem] = verifier
+    return verifier
 
 
 def _extract_id_token(id_token):
@@ -2130,3 +2942,8 @@ def flow_from_clientsecrets(filename, scope, redirect_uri=None,
     else:
         raise UnknownClientSecretsFlowError(
             'This OAuth 2.0 flow is unsupported: {0!r}'.format(client_type))
+
+
+_register_credentials_classes(
+    Credentials, OAuth2Credentials, AccessTokenCredentials,
+    GoogleCredentials, AssertionCredentials)
@@ -52,24 +52,71 @@ def get(http_request, path, root=METADATA_ROOT, recursive=None):
         http_client.HTTPException if an error corrured while
         retrieving metadata.
     """
-    url = urlparse.urljoin(root, path)
-    url = _helpers._add_query_parameter(url, 'recursive', recursive)
+    url = _get_url(path, root, recursive)
 
     response, content = http_request(
         url,
         headers=METADATA_HEADERS
     )
 
-    if response.status == http_client.OK:
+    return _process_response(url, response.status, response, content)
+
+
+def _get_url(path, root=METADATA_ROOT, recursive=None):
+    """Builds the URL of a metadata server resource.
+
+    Args:
+        path: A string indicating the resource to retrieve.
+        root: A string indicating the full path to the metadata server root.
+        recursive: A boolean indicating whether to do a recursive query of
+            metadata.
+
+    Returns:
+        The URL as a string.
+    """
+    url = urlparse.urljoin(root, path)
+    return _helpers._add_query_parameter(url, 'recursive', recursive)
+
+
+def _process_response(url, status, headers, content):
+    """Decodes a metadata server response.
+
+    Args:
+        url: A string, the URL the response was retrieved from.
+        status: An int, the HTTP status of the response.
+        headers: A dictionary of the (lower-cased) response headers.
+        content: The body of the response as a string or bytes.
+
+    Returns:
+        A dictionary if the metadata server returned JSON, otherwise a string.
+
+    Raises:
+        http_client.HTTPException if the response is not a 200 OK.
+    """
+    if status == http_client.OK:
         decoded = _helpers._from_bytes(content)
-        if response['content-type'] == 'application/json':
+        if headers['content-type'] == 'application/json':
             return json.loads(decoded)
         else:
             return decoded
     else:
         raise http_client.HTTPException(
             'Failed to retrieve {0} from the Google Compute Engine'
-            'metadata service. Response:\n{1}'.format(url, response))
+            'metadata service. Response:\n{1}'.format(url, headers))
+
+
+def _token_from_response(token_json):
+    """Extracts the access token and its expiry from a token resource.
+
+    Args:
+        token_json: A dictionary, the decoded token resource.
+
+    Returns:
+         A tuple of (access token, token expiration).
+    """
+    token_expiry = client._UTCNOW() + datetime.timedelta(
+        seconds=token_json['expires_in'])
+    return token_json['access_token'], token_expiry
 
 
 def get_service_account_info(http_request, service_account='default'):
@@ -117,6 +164,4 @@ def get_token(http_request, service_account='default'):
     token_json = get(
         http_request,
         'instance/service-accounts/{0}/token'.format(service_account))
-    token_expiry = client._UTCNOW() + datetime.timedelta(
-        seconds=token_json['expires_in'])
-    return token_json['access_token'], token_expiry
+    return _token_from_response(token_json)
@@ -0,0 +1,370 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Utilities for using credentials from asyncio applications.
+
+This module provides coroutine versions of the credential operations that
+make HTTP requests, so that asyncio applications neither block the event loop
+nor have to push them into an executor. It requires Python 3.5 or newer.
+
+Instead of an ``httplib2.Http`` object, every coroutine takes an async
+``request`` callable with the following signature:
+
+.. code-block:: python
+
+    async def request(uri, method='GET', body=None, headers=None):
+        ...
+        return status, response_headers, content
+
+where ``status`` is the HTTP status as an int, ``response_headers`` is a
+dictionary with lower-cased header names and ``content`` is the response
+body. :func:`aiohttp_request` adapts an ``aiohttp.ClientSession`` to this
+interface.
+
+Usage
+=====
+
+.. code-block:: python
+
+    from oauth2client_latest.contrib import asyncio_util
+
+    async with aiohttp.ClientSession() as session:
+        request = asyncio_util.aiohttp_request(session)
+        authed_request = asyncio_util.authorize(credentials, request)
+        status, headers, content = await authed_request(
+            'https://www.googleapis.com/drive/v3/files')
+
+Concurrent refreshes of the same credentials, including the ones triggered
+by :func:`authorize`, are coalesced into a single request to the token
+endpoint. If the credentials have a :class:`oauth2client_latest.client.Storage`
+set, it is consulted before refreshing and written to afterwards, as with the
+synchronous methods. The Storage lock is never held across an ``await``.
+"""
+
+import asyncio
+import functools
+import logging
+import threading
+import weakref
+
+from six.moves import http_client
+
+from oauth2client_latest import client
+from oauth2client_latest import crypt
+from oauth2client_latest import service_account
+from oauth2client_latest import transport
+from oauth2client_latest.contrib import _metadata
+from oauth2client_latest.contrib import gce
+
+
+logger = logging.getLogger(__name__)
+
+# In-flight refreshes, keyed by event loop and then by credentials. A future
+# can only be awaited in its own loop, so refreshes in different loops, e.g.
+# in different threads, aren't shared.
+_refreshes = weakref.WeakKeyDictionary()
+_refreshes_lock = threading.Lock()
+
+
+def _loop_refreshes(loop):
+    """Returns the in-flight refreshes of an event loop."""
+    with _refreshes_lock:
+        refreshes = _refreshes.get(loop)
+        if refreshes is None:
+            refreshes = weakref.WeakKeyDictionary()
+            _refreshes[loop] = refreshes
+        return refreshes
+
+
+def aiohttp_request(session):
+    """Adapts an ``aiohttp.ClientSession`` to an async request callable.
+
+    Args:
+        session: An ``aiohttp.ClientSession`` used to make the requests.
+
+    Returns:
+        An async request callable.
+    """
+    async def request(uri, method='GET', body=None, headers=None):
+        async with session.request(method, uri, data=body,
+                                   headers=headers) as response:
+            content = await response.read()
+            response_headers = dict(
+                (key.lower(), value)
+                for key, value in response.headers.items())
+            return response.status, response_headers, content
+
+    return request
+
+
+def authorize(credentials, request):
+    """Wraps an async request callable to authorize requests.
+
+    This is the asyncio equivalent of
+    :meth:`oauth2client_latest.client.OAuth2Credentials.authorize`. Missing or
+    expiring access tokens are refreshed before a request is sent, and
+    requests rejected with one of
+    :data:`oauth2client_latest.transport.REFRESH_STATUS_CODES` are retried
+    after refreshing.
+
+    Args:
+        credentials: Credentials, the credentials used to authorize requests.
+        request: An async request callable used both for the requests and
+                 for refreshing the credentials.
+
+    Returns:
+        An async request callable with a ``credentials`` attribute.
+    """
+    async def authorized_request(uri, method='GET', body=None, headers=None):
+        if transport._token_needs_refresh(credentials):
+            await refresh(credentials, request)
+
+        headers = transport._initialize_headers(headers)
+        sent_token = credentials.access_token
+        credentials.apply(headers)
+        transport._apply_user_agent(headers, credentials.user_agent)
+
+        status, response_headers, content = await request(
+            uri, method, body, headers)
+
+        max_refresh_attempts = 2
+        for refresh_attempt in range(max_refresh_attempts):
+            if status not in transport.REFRESH_STATUS_CODES:
+                break
+            logger.info('Refreshing due to a %s (attempt %s/%s)',
+                        status, refresh_attempt + 1, max_refresh_attempts)
+            if credentials.access_token == sent_token:
+                await refresh(credentials, request)
+            sent_token = credentials.access_token
+            credentials.apply(headers)
+            status, response_headers, content = await request(
+                uri, method, body, headers)
+
+        return status, response_headers, content
+
+    authorized_request.credentials = credentials
+    return authorized_request
+
+
+def _call_with_store_lock(credentials, func, *args):
+    """Calls ``func`` while holding the credentials' Storage lock, if any."""
+    store = credentials.store
+    if store is None:
+        return func(*args)
+    store.acquire_lock()
+    try:
+        return func(*args)
+    finally:
+        store.release_lock()
+
+
+async def refresh(credentials, request):
+    """Refreshes the access_token of the credentials.
+
+    Concurrent calls for the same credentials await a single shared refresh.
+    Cancelling one caller does not cancel the refresh for the others.
+
+    Args:
+        credentials: Credentials, the credentials to refresh.
+        request: An async request callable used to make the refresh request.
+
+    Raises:
+        HttpAccessTokenRefreshError: When the refresh fails.
+    """
+    loop = asyncio.get_event_loop()
+    refreshes = _loop_refreshes(loop)
+    future = refreshes.get(credentials)
+    if future is None:
+        future = asyncio.ensure_future(_refresh(credentials, request),
+                                       loop=loop)
+        refreshes[credentials] = future
+        future.add_done_callback(
+            functools.partial(_refresh_done, refreshes, credentials))
+    await asyncio.shield(future)
+
+
+def _refresh_done(refreshes, credentials, future):
+    if refreshes.get(credentials) is future:
+        del refreshes[credentials]
+    if not future.cancelled():
+        # Retrieve the exception so it isn't reported as unhandled if every
+        # caller was cancelled.
+        future.exception()
+
+
+async def _refresh(credentials, request):
+    if isinstance(credentials, gce.AppAssertionCredentials):
+        await _refresh_gce(credentials, request)
+    elif isinstance(credentials, (client.AccessTokenCredentials,
+                                  service_account._JWTAccessCredentials)):
+        # These never make a request to refresh.
+        credentials._refresh(None)
+    else:
+        await _refresh_oauth2(credentials, request)
+
+
+async def _refresh_oauth2(credentials, request):
+    if credentials.store is not None:
+        if _call_with_store_lock(credentials,
+                                 credentials._locked_update_from_store):
+            return
+
+    logger.info('Refreshing access_token')
+    status, unused_headers, content = await request(
+        credentials.token_uri, 'POST',
+        credentials._generate_refresh_request_body(),
+        credentials._generate_refresh_request_headers())
+    _call_with_store_lock(credentials, credentials._process_refresh_response,
+                          status, content)
+
+
+async def _refresh_gce(credentials, request):
+    try:
+        await _retrieve_gce_info(credentials, request)
+        credentials.access_token, credentials.token_expiry = (
+            await _get_metadata_token(
+                request, service_account=credentials.service_account_email))
+    except http_client.HTTPException as err:
+        raise client.HttpAccessTokenRefreshError(str(err))
+
+
+async def _retrieve_gce_info(credentials, request):
+    if credentials.invalid:
+        info = await _get_metadata(
+            request, 'instance/service-accounts/{0}/'.format(
+                credentials.service_account_email or 'default'),
+            recursive=True)
+        credentials.invalid = False
+        credentials.service_account_email = info['email']
+        credentials.scopes = info['scopes']
+
+
+async def get_access_token(credentials, request):
+    """Returns the access token and its expiration information.
+
+    The access token is refreshed first if it is missing or expiring.
+
+    Args:
+        credentials: Credentials, the credentials to get an access token for.
+        request: An async request callable used to make the refresh request.
+
+    Returns:
+        An :class:`oauth2client_latest.client.AccessTokenInfo`.
+    """
+    if transport._token_needs_refresh(credentials):
+        await refresh(credentials, request)
+    return client.AccessTokenInfo(access_token=credentials.access_token,
+                                  expires_in=credentials._expires_in())
+
+
+async def revoke(credentials, request):
+    """Revokes the credentials and deletes the stored copy, if any.
+
+    Revokes the refresh_token if there is one, otherwise the access_token.
+
+    Args:
+        credentials: Credentials, the credentials to revoke.
+        request: An async request callable used to make the revoke request.
+
+    Raises:
+        TokenRevokeError: If the revoke request does not return a 200 OK.
+    """
+    if isinstance(credentials, service_account._JWTAccessCredentials):
+        # JWT access tokens can't be revoked.
+        return
+    token = credentials.refresh_token or credentials.access_token
+    logger.info('Revoking token')
+    token_revoke_uri = client._update_query_params(
+        credentials.revoke_uri, {'token': token})
+    status, unused_headers, content = await request(
+        token_revoke_uri, 'GET', None, None)
+    credentials._process_revoke_response(status, content)
+
+
+async def retrieve_scopes(credentials, request):
+    """Retrieves the canonical set of scopes for the access token.
+
+    Args:
+        credentials: Credentials, the credentials to retrieve scopes for.
+        request: An async request callable used to make the request.
+
+    Returns:
+        A set of strings containing the canonical list of scopes.
+
+    Raises:
+        Error: When the request fails, indicating the access token is invalid.
+    """
+    if isinstance(credentials, gce.AppAssertionCredentials):
+        await _retrieve_gce_info(credentials, request)
+        return credentials.scopes
+    logger.info('Refreshing scopes')
+    token_info_uri = client._update_query_params(
+        credentials.token_info_uri,
+        {'access_token': credentials.access_token, 'fields': 'scope'})
+    status, unused_headers, content = await request(
+        token_info_uri, 'GET', None, None)
+    credentials._process_scopes_response(status, content)
+    return credentials.scopes
+
+
+async def _get_metadata(request, path, root=_metadata.METADATA_ROOT,
+                        recursive=None):
+    """Fetches a resource from the metadata server.
+
+    See :func:`oauth2client_latest.contrib._metadata.get`.
+    """
+    url = _metadata._get_url(path, root, recursive)
+    status, headers, content = await request(
+        url, 'GET', None, dict(_metadata.METADATA_HEADERS))
+    return _metadata._process_response(url, status, headers, content)
+
+
+async def _get_metadata_token(request, service_account='default'):
+    """Fetches an access token from the metadata server.
+
+    See :func:`oauth2client_latest.contrib._metadata.get_token`.
+    """
+    token_json = await _get_metadata(
+        request, 'instance/service-accounts/{0}/token'.format(service_account))
+    return _metadata._token_from_response(token_json)
+
+
+async def verify_id_token(id_token, audience, request,
+                          cert_uri=client.ID_TOKEN_VERIFICATION_CERTS):
+    """Verifies a signed JWT id_token.
+
+    See :func:`oauth2client_latest.client.verify_id_token`. The parsed
+    certificates are shared with it.
+
+    Args:
+        id_token: string, A Signed JWT.
+        audience: string, The audience 'aud' that the token should be for.
+        request: An async request callable used to fetch the certificates.
+        cert_uri: string, URI of the certificates in JSON format to
+                  verify the JWT against.
+
+    Returns:
+        The deserialized JSON in the JWT.
+
+    Raises:
+        oauth2client_latest.crypt.AppIdentityError: if the JWT fails to verify.
+        CryptoUnavailableError: if no crypto library is available.
+    """
+    client._require_crypto_or_die()
+    certificate_set = client._get_certificate_set(cert_uri)
+    verifiers = certificate_set.cached_verifiers()
+    if verifiers is None:
+        status, headers, content = await request(cert_uri, 'GET', None, None)
+        verifiers = certificate_set.update(status, headers, content)
+    return crypt.verify_signed_jwt_with_certs(id_token, verifiers, audience)
@@ -230,6 +230,7 @@ from django.core import exceptions
 from django.core import urlresolvers
 from six.moves.urllib import parse
 
+from oauth2client_latest import client
 from oauth2client_latest import clientsecrets
 from oauth2client_latest import transport
 from oauth2client_latest.contrib import dictionary_storage
@@ -327,6 +328,8 @@ class OAuth2Settings(object):
                     attach the UserOAuth2 object to the Django request object.
       client_id: The OAuth2 Client ID.
       client_secret: The OAuth2 Client Secret.
+      storage_model_class: The Django model class that stores the
+                           credentials, or None to use the session.
     """
 
     def __init__(self, settings_instance):
@@ -347,11 +350,23 @@ class OAuth2Settings(object):
                   'SessionMiddleware\'.')
         (self.storage_model, self.storage_model_user_property,
          self.storage_model_credentials_property) = _get_storage_model()
+        self._storage_model_class = None
+
+    @property
+    def storage_model_class(self):
+        # The model module usually imports this package for its
+        # CredentialsField, so it can only be imported once first needed.
+        if self.storage_model and self._storage_model_class is None:
+            module_name, class_name = self.storage_model.rsplit('.', 1)
+            module = importlib.import_module(module_name)
+            self._storage_model_class = getattr(module, class_name)
+        return self._storage_model_class
 
 
 oauth2_settings = OAuth2Settings(django.conf.settings)
 
 _CREDENTIALS_KEY = 'google_oauth2_credentials'
+_STORAGE_REQUEST_ATTRIBUTE = '_google_oauth2_storage'
 
 
 def get_storage(request):
@@ -364,14 +379,11 @@ def get_storage(request):
     Returns:
        An :class:`oauth2.client.Storage` object.
     """
-    storage_model = oauth2_settings.storage_model
+    storage_model_class = oauth2_settings.storage_model_class
     user_property = oauth2_settings.storage_model_user_property
     credentials_property = oauth2_settings.storage_model_credentials_property
 
-    if storage_model:
-        module_name, class_name = storage_model.rsplit('.', 1)
-        module = importlib.import_module(module_name)
-        storage_model_class = getattr(module, class_name)
+    if storage_model_class:
         return storage.DjangoORMStorage(storage_model_class,
                                         user_property,
                                         request.user,
@@ -382,6 +394,72 @@ def get_storage(request):
             request.session, key=_CREDENTIALS_KEY)
 
 
+class _RequestStorage(client.Storage):
+    """Remembers the credentials of a storage for the length of a request.
+
+    The credentials are loaded at most once, and kept up to date with the
+    credentials written through this storage, including refreshed ones.
+
+    Args:
+        storage: The :class:`oauth2client_latest.client.Storage` of the
+                 request.
+        user: The user of the request the storage belongs to.
+    """
+
+    def __init__(self, storage, user):
+        super(_RequestStorage, self).__init__()
+        self.storage = storage
+        self.user = user
+        self._loaded = False
+        self._credentials = None
+
+    def acquire_lock(self):
+        self.storage.acquire_lock()
+
+    def release_lock(self):
+        self.storage.release_lock()
+
+    def get(self):
+        if self._loaded:
+            return self._credentials
+        return super(_RequestStorage, self).get()
+
+    def locked_get(self):
+        credentials = self.storage.locked_get()
+        if getattr(credentials, 'set_store', None) is not None:
+            credentials.set_store(self)
+        self._loaded = True
+        self._credentials = credentials
+        return credentials
+
+    def locked_put(self, credentials):
+        self.storage.locked_put(credentials)
+        self._loaded = True
+        self._credentials = credentials
+
+    def locked_delete(self):
+        self.storage.locked_delete()
+        self._loaded = True
+        self._credentials = None
+
+
+def _get_request_storage(request):
+    """Gets the storage of a request, creating it for a new request or user.
+
+    Args:
+        request: Reference to the current request object.
+
+    Returns:
+        A :class:`_RequestStorage` wrapping the storage of ``get_storage``.
+    """
+    user = getattr(request, 'user', None)
+    request_storage = getattr(request, _STORAGE_REQUEST_ATTRIBUTE, None)
+    if request_storage is None or request_storage.user is not user:
+        request_storage = _RequestStorage(get_storage(request), user)
+        setattr(request, _STORAGE_REQUEST_ATTRIBUTE, request_storage)
+    return request_storage
+
+
 def _redirect_with_params(url_name, *args, **kwargs):
     """Helper method to create a redirect response with URL params.
 
@@ -405,7 +483,7 @@ def _credentials_from_request(request):
     # ORM storage requires a logged in user
     if (oauth2_settings.storage_model is None or
             request.user.is_authenticated()):
-        return get_storage(request).get()
+        return _get_request_storage(request).get()
     else:
         return None
 
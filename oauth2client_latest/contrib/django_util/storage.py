@@ -14,9 +14,26 @@
 
 """Contains a storage module that stores credentials using the Django ORM."""
 
+from django.db import models
+from django.db import transaction
+
 from oauth2client_latest import client
 
 
+# Most rows changed by one UPDATE in put_many(), so that the statement stays
+# within SQLite's limit on bound parameters.
+_MAX_KEYS_PER_UPDATE = 300
+
+
+def _key_to_python(model_class, key_name, key_value):
+    """Normalizes a key value to the value the ORM returns for the key.
+
+    Model instances, such as users, are replaced by their primary key.
+    """
+    field = model_class._meta.get_field(key_name)
+    return field.to_python(getattr(key_value, 'pk', key_value))
+
+
 class DjangoORMStorage(client.Storage):
     """Store and retrieve a single credential to and from the Django datastore.
 
@@ -54,14 +71,15 @@ class DjangoORMStorage(client.Storage):
 
         """
         query = {self.key_name: self.key_value}
-        entities = self.model_class.objects.filter(**query)
-        if len(entities) > 0:
-            credential = getattr(entities[0], self.property_name)
+        entity = self.model_class.objects.filter(**query).only(
+            self.property_name).first()
+        if entity is not None:
+            credential = getattr(entity, self.property_name)
             if getattr(credential, 'set_store', None) is not None:
                 credential.set_store(self)
-            return credential
         else:
-            return None
+            credential = None
+        return credential
 
     def locked_put(self, credentials):
         """Write a Credentials to the Django datastore.
@@ -79,3 +97,81 @@ class DjangoORMStorage(client.Storage):
         """Delete Credentials from the datastore."""
         query = {self.key_name: self.key_value}
         self.model_class.objects.filter(**query).delete()
+
+    @classmethod
+    def get_many(cls, model_class, key_name, key_values, property_name):
+        """Retrieve the credentials stored for many keys in one query.
+
+        Args:
+            model_class: db.Model model class.
+            key_name: string, key name for the entities that have the
+                      credentials.
+            key_values: iterable of key values, such as users.
+            property_name: string, name of the property that is a
+                           CredentialsProperty.
+
+        Returns:
+            dict, the credentials of each key value that has some stored,
+            with a storage for that key value set on them.
+        """
+        key_values = dict(
+            (_key_to_python(model_class, key_name, key_value), key_value)
+            for key_value in key_values)
+        if not key_values:
+            return {}
+        rows = model_class.objects.filter(
+            **{key_name + '__in': list(key_values)}).values_list(
+                key_name, property_name)
+
+        results = {}
+        for key, credential in rows:
+            if credential is None:
+                continue
+            key_value = key_values[key]
+            store = cls(model_class, key_name, key_value, property_name)
+            if getattr(credential, 'set_store', None) is not None:
+                credential.set_store(store)
+            results[key_value] = credential
+        return results
+
+    @classmethod
+    def put_many(cls, model_class, key_name, credentials, property_name):
+        """Write the credentials of many keys in one transaction.
+
+        Existing entities are updated with one ``UPDATE ... CASE``
+        statement per 300 keys, and missing ones created with
+        ``bulk_create``.
+
+        Args:
+            model_class: db.Model model class.
+            key_name: string, key name for the entities that have the
+                      credentials.
+            credentials: dict, the Credentials to store for each key value.
+            property_name: string, name of the property that is a
+                           CredentialsProperty.
+        """
+        key_values = dict(
+            (_key_to_python(model_class, key_name, key_value), key_value)
+            for key_value in credentials)
+        if not key_values:
+            return
+        with transaction.atomic():
+            existing = set(model_class.objects.filter(
+                **{key_name + '__in': list(key_values)}).values_list(
+                    key_name, flat=True))
+            field = model_class._meta.get_field(property_name)
+            existing_keys = list(existing)
+            for start in range(0, len(existing_keys), _MAX_KEYS_PER_UPDATE):
+                chunk = existing_keys[start:start + _MAX_KEYS_PER_UPDATE]
+                model_class.objects.filter(
+                    **{key_name + '__in': chunk}).update(**{
+                        property_name: models.Case(*[
+                            models.When(then=models.Value(
+                                credentials[key_values[key]],
+                                output_field=field), **{key_name: key})
+                            for key in chunk], output_field=field)})
+            model_class.objects.bulk_create([
+                model_class(**{key_name: key_value,
+                               property_name: credentials[key_value]})
+                for key, key_value in key_values.items()
+                if key not in existing])
@@ -22,7 +22,6 @@ in the configured storage."""
 import hashlib
 import json
 import os
-import pickle
 
 from django import http
 from django import shortcuts
@@ -33,7 +32,6 @@ from six.moves.urllib import parse
 
 from oauth2client_latest import client
 from oauth2client_latest.contrib import django_util
-from oauth2client_latest.contrib.django_util import get_storage
 from oauth2client_latest.contrib.django_util import signals
 
 _CSRF_KEY = 'google_oauth2_csrf_token'
@@ -43,6 +41,9 @@ _FLOW_KEY = 'google_oauth2_flow_{0}'
 def _make_flow(request, scopes, return_url=None):
     """Creates a Web Server Flow
 
+    Only the scopes of the flow are stored in the session, from which
+    ``_get_flow_for_token`` builds the flow again.
+
     Args:
         request: A Django request object.
         scopes: the request oauth2 scopes.
@@ -62,7 +63,25 @@ def _make_flow(request, scopes, return_url=None):
         'return_url': return_url,
     })
 
-    flow = client.OAuth2WebServerFlow(
+    flow = _build_flow(request, scopes, state)
+
+    flow_key = _FLOW_KEY.format(csrf_token)
+    request.session[flow_key] = json.dumps({'scope': flow.scope})
+    return flow
+
+
+def _build_flow(request, scopes, state):
+    """Creates a Web Server Flow for the configured client.
+
+    Args:
+        request: A Django request object.
+        scopes: the request oauth2 scopes.
+        state: string, the state passed through the authorization server.
+
+    Returns:
+        An OAuth2 flow object.
+    """
+    return client.OAuth2WebServerFlow(
         client_id=django_util.oauth2_settings.client_id,
         client_secret=django_util.oauth2_settings.client_secret,
         scope=scopes,
@@ -70,10 +89,6 @@ def _make_flow(request, scopes, return_url=None):
         redirect_uri=request.build_absolute_uri(
             urlresolvers.reverse("google_oauth:callback")))
 
-    flow_key = _FLOW_KEY.format(csrf_token)
-    request.session[flow_key] = pickle.dumps(flow)
-    return flow
-
 
 def _get_flow_for_token(csrf_token, request):
     """ Looks up the flow in session to recover information about requested
@@ -88,8 +103,15 @@ def _get_flow_for_token(csrf_token, request):
         The OAuth2 Flow object associated with this flow based on the
         CSRF token.
     """
-    flow_pickle = request.session.get(_FLOW_KEY.format(csrf_token), None)
-    return None if flow_pickle is None else pickle.loads(flow_pickle)
+    flow_state = request.session.get(_FLOW_KEY.format(csrf_token), None)
+    if flow_state is None:
+        return None
+    try:
+        scope = json.loads(flow_state)['scope']
+    except (TypeError, ValueError, KeyError):
+        # Such as a flow pickled into the session by an older version.
+        return None
+    return _build_flow(request, scope, request.GET.get('state'))
 
 
 def oauth2_callback(request):
@@ -146,7 +168,7 @@ def oauth2_callback(request):
         return http.HttpResponseBadRequest(
             'An error has occurred: {0}'.format(exchange_error))
 
-    get_storage(request).put(credentials)
+    django_util._get_request_storage(request).put(credentials)
 
     signals.oauth2_authorized.send(sender=signals.oauth2_authorized,
                                    request=request, credentials=credentials)
@@ -178,7 +200,7 @@ def oauth2_authorize(request):
                 settings.LOGIN_URL, parse.quote(request.get_full_path())))
         # This checks for the case where we ended up here because of a logged
         # out user but we had credentials for it in the first place
-        elif get_storage(request).get() is not None:
+        elif django_util._get_request_storage(request).get() is not None:
             return redirect(return_url)
 
     scopes = request.GET.getlist('scopes', django_util.oauth2_settings.scopes)
@@ -166,7 +166,6 @@ from functools import wraps
 import hashlib
 import json
 import os
-import pickle
 
 try:
     from flask import Blueprint
@@ -195,16 +194,23 @@ _FLOW_KEY = 'google_oauth2_flow_{0}'
 _CSRF_KEY = 'google_oauth2_csrf_token'
 
 
-def _get_flow_for_token(csrf_token):
-    """Retrieves the flow instance associated with a given CSRF token from
-    the Flask session."""
-    flow_pickle = session.pop(
+def _get_flow_state_for_token(csrf_token):
+    """Retrieves the flow state associated with a given CSRF token from
+    the Flask session.
+
+    The state is a dictionary holding the ``scope`` of the flow and the
+    ``kwargs`` it was created with.
+    """
+    flow_state = session.pop(
         _FLOW_KEY.format(csrf_token), None)
 
-    if flow_pickle is None:
+    if flow_state is None:
+        return None
+    try:
+        return json.loads(flow_state)
+    except (TypeError, ValueError):
+        # Such as a flow pickled into the session by an older version.
         return None
-    else:
-        return pickle.loads(flow_pickle)
 
 
 class UserOAuth2(object):
@@ -335,13 +341,23 @@ class UserOAuth2(object):
             'return_url': return_url
         })
 
+        extra_scopes = kwargs.pop('scopes', [])
+        scopes = set(self.scopes).union(set(extra_scopes))
+
+        flow = self._build_flow(scopes, state, kwargs)
+
+        # Only what cannot be rebuilt from the configuration is stored.
+        flow_key = _FLOW_KEY.format(csrf_token)
+        session[flow_key] = json.dumps({'scope': flow.scope, 'kwargs': kwargs})
+
+        return flow
+
+    def _build_flow(self, scopes, state, kwargs):
+        """Creates a Web Server Flow with the configured flow kwargs."""
         kw = self.flow_kwargs.copy()
         kw.update(kwargs)
 
-        extra_scopes = kw.pop('scopes', [])
-        scopes = set(self.scopes).union(set(extra_scopes))
-
-        flow = client.OAuth2WebServerFlow(
+        return client.OAuth2WebServerFlow(
             client_id=self.client_id,
             client_secret=self.client_secret,
             scope=scopes,
@@ -349,11 +365,6 @@ class UserOAuth2(object):
             redirect_uri=url_for('oauth2.callback', _external=True),
             **kw)
 
-        flow_key = _FLOW_KEY.format(csrf_token)
-        session[flow_key] = pickle.dumps(flow)
-
-        return flow
-
     def _create_blueprint(self):
         bp = Blueprint('oauth2', __name__)
         bp.add_url_rule('/oauth2authorize', 'authorize', self.authorize_view)
@@ -410,11 +421,14 @@ class UserOAuth2(object):
         if client_csrf != server_csrf:
             return 'Invalid request state', httplib.BAD_REQUEST
 
-        flow = _get_flow_for_token(server_csrf)
+        flow_state = _get_flow_state_for_token(server_csrf)
 
-        if flow is None:
+        if flow_state is None:
             return 'Invalid request state', httplib.BAD_REQUEST
 
+        flow = self._build_flow(
+            flow_state['scope'], encoded_state, flow_state['kwargs'])
+
         # Exchange the auth code for credentials.
         try:
             credentials = flow.step2_exchange(code)
@@ -0,0 +1,511 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Memory-mapped credential storage.
+
+This module provides :class:`MmapFileStorage`, which stores credentials for
+many keys in a single file that every process maps into memory. It is meant
+for hosts running many, often short-lived, processes that use the same
+credentials: reading them takes no locks and no system calls once the file
+is mapped, and reading only the access token doesn't parse anything.
+
+The file has a fixed layout: a header followed by ``num_slots`` slots of the
+same size. Each slot belongs to one key and holds the access token, its
+expiry and the JSON representation of the credentials. Writers take an
+interprocess lock and bump a per-slot sequence number before and after
+changing a slot. Readers copy the slot and retry if the sequence number was
+odd, i.e. a write was in progress, or changed while they were reading.
+
+Usage
+=====
+
+.. code-block:: python
+
+    from oauth2client_latest.contrib import mmap_file_storage
+
+    storage = mmap_file_storage.MmapFileStorage('credentials.cache', key)
+    storage.put(credentials)
+
+    # In any process on the host:
+    credentials = storage.get()
+    # Or, without building the credentials:
+    token_info = storage.get_access_token()
+"""
+
+import calendar
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+
+import fasteners
+
+from oauth2client_latest import _helpers
+from oauth2client_latest import client
+
+
+#: Number of slots, i.e. the most keys, in a newly created file.
+DEFAULT_NUM_SLOTS = 64
+
+#: Longest access token, in bytes, that fits in a slot.
+ACCESS_TOKEN_MAX_BYTES = 2048
+
+#: Longest JSON representation of credentials, in bytes, that fits in a
+#: slot.
+CREDENTIALS_JSON_MAX_BYTES = 14336
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b'OA2CMMAP'
+_FILE_VERSION = 1
+# Magic, file version, number of slots, slot size.
+_HEADER = struct.Struct('<8sIII')
+# Sequence number, SHA-1 digest of the key, flags, access token expiry in
+# seconds since the epoch (0 if it doesn't expire), access token length,
+# JSON generation and JSON length. The access token and the JSON follow.
+_SLOT_HEADER = struct.Struct('<Q20sBdHII')
+_SEQUENCE = struct.Struct('<Q')
+_SLOT_SIZE = (_SLOT_HEADER.size + ACCESS_TOKEN_MAX_BYTES +
+              CREDENTIALS_JSON_MAX_BYTES)
+_USED = 1
+_HAS_CREDENTIALS = 2
+# Consecutive reads of a slot seeing a write in progress before a reader
+# takes the lock instead.
+_MAX_READ_ATTEMPTS = 1000
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def _key_digest(key):
+    return hashlib.sha1(_helpers._to_bytes(key)).digest()
+
+
+def _expiry_to_seconds(token_expiry):
+    if token_expiry is None:
+        return 0
+    return (calendar.timegm(token_expiry.utctimetuple()) +
+            token_expiry.microsecond / 1e6)
+
+
+class _Slot(object):
+    """A consistent copy of one slot."""
+
+    def __init__(self, key_digest, flags, expiry, access_token,
+                 json_generation, credentials_json):
+        self.key_digest = key_digest
+        self.flags = flags
+        self.expiry = expiry
+        self.access_token = access_token
+        self.json_generation = json_generation
+        self.credentials_json = credentials_json
+
+
+class _MmapFileBackend(object):
+    """Maps a credentials file into memory and reads and writes its slots.
+
+    Each process has only one instance of this backend per file, shared by
+    all threads.
+    """
+
+    def __init__(self, filename, num_slots):
+        self._filename = filename
+        # Number of slots if this process creates the file.
+        self._new_num_slots = num_slots
+        self._process_lock = fasteners.InterProcessLock(
+            '{0}.lock'.format(filename))
+        self._thread_lock = threading.Lock()
+        # Serializes mapping the file, which readers do without the lock.
+        self._map_lock = threading.Lock()
+        self._mmap = None
+        self._num_slots = None
+        # Slot index by key, as slots are never reassigned.
+        self._slots = {}
+        # (JSON generation, credentials) by key.
+        self._credentials = {}
+
+    def acquire_lock(self):
+        self._thread_lock.acquire()
+        self._process_lock.acquire()
+
+    def release_lock(self):
+        self._process_lock.release()
+        self._thread_lock.release()
+
+    def _map(self, create=False):
+        """Maps the file.
+
+        The file never shrinks, so that processes that already mapped it
+        never read past its end.
+
+        Args:
+            create: bool, whether to create or overwrite the file if it
+                    doesn't exist or isn't valid. Requires the lock.
+
+        Returns:
+            True if the file is mapped.
+        """
+        if self._mmap is not None:
+            return True
+        with self._map_lock:
+            if self._mmap is not None:
+                return True
+            return self._map_file(create)
+
+    def _map_file(self, create):
+        """Maps the file. Requires the map lock."""
+        flags = os.O_RDWR | getattr(os, 'O_BINARY', 0)
+        if create:
+            flags |= os.O_CREAT
+        try:
+            # Credentials are secret, so only the owner may read a new file.
+            fd = os.open(self._filename, flags, 0o600)
+        except OSError:
+            if not create:
+                return False
+            raise
+
+        with os.fdopen(fd, 'r+b') as credentials_file:
+            header = credentials_file.read(_HEADER.size)
+            credentials_file.seek(0, os.SEEK_END)
+            file_size = credentials_file.tell()
+            valid = False
+            if len(header) == _HEADER.size:
+                magic, version, num_slots, slot_size = _HEADER.unpack(header)
+                valid = (magic == _MAGIC and version == _FILE_VERSION and
+                         slot_size == _SLOT_SIZE and num_slots > 0 and
+                         file_size >= _HEADER.size + num_slots * _SLOT_SIZE)
+            if not valid:
+                if not create:
+                    return False
+                if file_size:
+                    logger.warning(
+                        'Credentials cache file {0} is not valid, will '
+                        'overwrite.'.format(self._filename))
+                num_slots = self._new_num_slots
+                size = _HEADER.size + num_slots * _SLOT_SIZE
+                credentials_file.truncate(max(size, file_size))
+                credentials_file.seek(0)
+                credentials_file.write(b'\0' * size)
+                credentials_file.seek(0)
+                credentials_file.write(_HEADER.pack(
+                    _MAGIC, _FILE_VERSION, num_slots, _SLOT_SIZE))
+                credentials_file.flush()
+
+            self._num_slots = num_slots
+            self._mmap = mmap.mmap(credentials_file.fileno(),
+                                   _HEADER.size + num_slots * _SLOT_SIZE)
+        return True
+
+    def _slot_offset(self, index):
+        return _HEADER.size + index * _SLOT_SIZE
+
+    def _read_slot(self, index, with_json=False, locked=False):
+        """Copies a slot, retrying while it's being written.
+
+        Args:
+            index: int, the index of the slot.
+            with_json: bool, whether to copy the JSON representation too.
+            locked: bool, whether the caller holds the lock, so that no
+                    write can be in progress.
+
+        Returns:
+            A :class:`_Slot`.
+        """
+        offset = self._slot_offset(index)
+        token_offset = offset + _SLOT_HEADER.size
+        json_offset = token_offset + ACCESS_TOKEN_MAX_BYTES
+        for unused_attempt in range(_MAX_READ_ATTEMPTS):
+            (sequence, key_digest, flags, expiry, token_length,
+             json_generation, json_length) = _SLOT_HEADER.unpack_from(
+                 self._mmap, offset)
+            if sequence % 2 and not locked:
+                continue
+            access_token = self._mmap[token_offset:token_offset +
+                                      min(token_length,
+                                          ACCESS_TOKEN_MAX_BYTES)]
+            credentials_json = None
+            if with_json:
+                credentials_json = self._mmap[json_offset:json_offset +
+                                              min(json_length,
+                                                  CREDENTIALS_JSON_MAX_BYTES)]
+            if (locked or
+                    _SEQUENCE.unpack_from(self._mmap, offset)[0] == sequence):
+                if sequence % 2:
+                    # Left half written by a writer that died. The key
+                    # keeps the slot, but its credentials are lost.
+                    flags &= _USED
+                return _Slot(key_digest, flags, expiry, access_token,
+                             json_generation, credentials_json)
+
+        # A writer died in the middle of a write, or is very slow. Writers
+        # hold the lock, so wait for it.
+        self.acquire_lock()
+        try:
+            return self._read_slot(index, with_json, locked=True)
+        finally:
+            self.release_lock()
+
+    def _write_slot(self, index, key_digest, flags, access_token,
+                    expiry, json_generation, credentials_json):
+        """Overwrites a slot. Requires the lock."""
+        offset = self._slot_offset(index)
+        token_offset = offset + _SLOT_HEADER.size
+        json_offset = token_offset + ACCESS_TOKEN_MAX_BYTES
+        sequence = _SEQUENCE.unpack_from(self._mmap, offset)[0]
+        # An odd sequence number is left by a writer that died.
+        sequence += 1 + sequence % 2
+        _SEQUENCE.pack_into(self._mmap, offset, sequence)
+        self._mmap[token_offset:token_offset + len(access_token)] = (
+            access_token)
+        self._mmap[json_offset:json_offset + len(credentials_json)] = (
+            credentials_json)
+        _SLOT_HEADER.pack_into(
+            self._mmap, offset, sequence, key_digest, flags, expiry,
+            len(access_token), json_generation, len(credentials_json))
+        _SEQUENCE.pack_into(self._mmap, offset, sequence + 1)
+
+    def _find_slot(self, key, create=False, locked=False):
+        """Finds the slot of a key.
+
+        Args:
+            key: string, the key.
+            create: bool, whether to assign a free slot to the key if it has
+                    none. Requires the lock.
+            locked: bool, whether the caller holds the lock.
+
+        Returns:
+            int, the index of the slot, or None if the key has none.
+
+        Raises:
+            ValueError: if a slot is needed but all of them are taken.
+        """
+        index = self._slots.get(key)
+        if index is not None:
+            return index
+
+        key_digest = _key_digest(key)
+        start = struct.unpack('<I', key_digest[:4])[0] % self._num_slots
+        for probe in range(self._num_slots):
+            index = (start + probe) % self._num_slots
+            slot = self._read_slot(index, locked=locked or create)
+            if slot.flags & _USED:
+                if slot.key_digest == key_digest:
+                    self._slots[key] = index
+                    return index
+            elif create:
+                self._write_slot(index, key_digest, _USED, b'', 0, 0, b'')
+                self._slots[key] = index
+                return index
+            else:
+                return None
+
+        if create:
+            raise ValueError(
+                'Credentials cache file {0} has no free slot for another '
+                'key.'.format(self._filename))
+        return None
+
+    def _read_credentials_slot(self, key, with_json=False, locked=False):
+        if not self._map():
+            return None
+        index = self._find_slot(key, locked=locked)
+        if index is None:
+            return None
+        slot = self._read_slot(index, with_json=with_json, locked=locked)
+        if not slot.flags & _HAS_CREDENTIALS:
+            return None
+        return slot
+
+    def get(self, key, locked=False):
+        """Gets the credentials of a key.
+
+        Takes no locks. The credentials are only built from their JSON
+        representation when it changed since this process last read them.
+
+        Args:
+            key: string, the key.
+            locked: bool, whether the caller holds the lock.
+
+        Returns:
+            An instance of :class:`oauth2client_latest.client.Credentials` or
+            `None`.
+        """
+        slot = self._read_credentials_slot(key, locked=locked)
+        if slot is None:
+            return None
+        cached = self._credentials.get(key)
+        if cached is not None and cached[0] == slot.json_generation:
+            return cached[1]
+
+        slot = self._read_credentials_slot(key, with_json=True, locked=locked)
+        if slot is None:
+            return None
+        credentials = client.Credentials.new_from_json(
+            slot.credentials_json)
+        self._credentials[key] = (slot.json_generation, credentials)
+        return credentials
+
+    def get_access_token(self, key):
+        """Gets the access token of a key, without building credentials.
+
+        Returns:
+            An :class:`oauth2client_latest.client.AccessTokenInfo`, or None
+            if there is no access token or it has expired.
+        """
+        slot = self._read_credentials_slot(key)
+        if slot is None or not slot.access_token:
+            return None
+        if not slot.expiry:
+            expires_in = None
+        else:
+            expires_in = int(
+                slot.expiry - _expiry_to_seconds(client._UTCNOW()))
+            if expires_in <= 0:
+                return None
+        return client.AccessTokenInfo(
+            access_token=_helpers._from_bytes(slot.access_token),
+            expires_in=expires_in)
+
+    def locked_put(self, key, credentials):
+        self._map(create=True)
+        access_token = _helpers._to_bytes(credentials.access_token or '')
+        credentials_json = _helpers._to_bytes(credentials.to_json())
+        if len(access_token) > ACCESS_TOKEN_MAX_BYTES:
+            raise ValueError('Access token too long for the credentials '
+                             'cache file.')
+        if len(credentials_json) > CREDENTIALS_JSON_MAX_BYTES:
+            raise ValueError('Credentials too long for the credentials '
+                             'cache file.')
+
+        index = self._find_slot(key, create=True)
+        slot = self._read_slot(index, with_json=True, locked=True)
+        json_generation = slot.json_generation
+        if (not slot.flags & _HAS_CREDENTIALS or
+                slot.credentials_json != credentials_json):
+            json_generation += 1
+        self._write_slot(
+            index, _key_digest(key), _USED | _HAS_CREDENTIALS, access_token,
+            _expiry_to_seconds(credentials.token_expiry), json_generation,
+            credentials_json)
+        self._credentials[key] = (json_generation, credentials)
+
+    def locked_delete(self, key):
+        self._credentials.pop(key, None)
+        if not self._map():
+            return
+        index = self._find_slot(key, locked=True)
+        if index is None:
+            return
+        slot = self._read_slot(index, locked=True)
+        self._write_slot(index, _key_digest(key), _USED, b'', 0,
+                         slot.json_generation + 1, b'')
+
+
+def _get_backend(filename, num_slots):
+    """Gets or creates the backend of a file.
+
+    Args:
+        filename: The path to the credentials file.
+        num_slots: int, the number of slots if the file has to be created.
+
+    Returns:
+        An instance of :class:`_MmapFileBackend`.
+    """
+    filename = os.path.abspath(filename)
+
+    with _backends_lock:
+        if filename not in _backends:
+            _backends[filename] = _MmapFileBackend(filename, num_slots)
+        return _backends[filename]
+
+
+class MmapFileStorage(client.Storage):
+    """Memory-mapped credential storage.
+
+    Args:
+        filename: The path to the file where credentials will be stored.
+        key: An arbitrary string used to uniquely identify this set of
+            credentials, as for :class:`.MultiprocessFileStorage` in
+            :mod:`oauth2client_latest.contrib.multiprocess_file_storage`.
+        num_slots: int, the most keys the file can hold, if this creates it.
+    """
+
+    def __init__(self, filename, key, num_slots=DEFAULT_NUM_SLOTS):
+        self._key = key
+        self._backend = _get_backend(filename, num_slots)
+
+    def acquire_lock(self):
+        self._backend.acquire_lock()
+
+    def release_lock(self):
+        self._backend.release_lock()
+
+    def get(self):
+        """Retrieves the current credentials from the store.
+
+        Unlike the other methods of
+        :class:`oauth2client_latest.client.Storage`, this takes no locks.
+
+        Returns:
+            An instance of :class:`oauth2client_latest.client.Credentials` or
+            `None`.
+        """
+        credential = self._backend.get(self._key)
+
+        if credential is not None:
+            credential.set_store(self)
+
+        return credential
+
+    def locked_get(self):
+        """Retrieves the current credentials from the store.
+
+        Returns:
+            An instance of :class:`oauth2client_latest.client.Credentials` or
+            `None`.
+        """
+        credential = self._backend.get(self._key, locked=True)
+
+        if credential is not None:
+            credential.set_store(self)
+
+        return credential
+
+    def get_access_token(self):
+        """Gets the stored access token without building the credentials.
+
+        Returns:
+            An :class:`oauth2client_latest.client.AccessTokenInfo`, or None
+            if there is no access token or it has expired.
+        """
+        return self._backend.get_access_token(self._key)
+
+    def locked_put(self, credentials):
+        """Writes the given credentials to the store.
+
+        Args:
+            credentials: an instance of
+                :class:`oauth2client_latest.client.Credentials`.
+
+        Raises:
+            ValueError: if the credentials don't fit in the file.
+        """
+        self._backend.locked_put(self._key, credentials)
+
+    def locked_delete(self):
+        """Deletes the current credentials from the store."""
+        self._backend.locked_delete(self._key)
@@ -38,6 +38,15 @@ Process & thread safety guarantees the following behavior:
       credentials are refreshed again it will retry locking and writing as
       normal.
 
+Writes append a record for the changed key to the end of the file instead of
+rewriting every credential in it. The file is rewritten with one record per
+key once the superseded records outnumber the live ones. Files written in
+the older single JSON document format are read as before and converted on the
+first write.
+
+This module requires ``fasteners`` 0.16 or later, for its interprocess
+reader/writer lock.
+
 Usage
 =====
 
@@ -92,6 +101,10 @@ from oauth2client_latest import client
 #: interprocess lock before falling back to read-only mode.
 INTERPROCESS_LOCK_DEADLINE = 1
 
+#: Once the credentials file holds this many records, and at least twice as
+#: many records as credentials, it is compacted instead of appended to.
+COMPACTION_MIN_RECORDS = 100
+
 logger = logging.getLogger(__name__)
 _backends = {}
 _backends_lock = threading.Lock()
@@ -112,10 +125,41 @@ def _create_file_if_needed(filename):
         return True
 
 
-def _load_credentials_file(credentials_file):
-    """Load credentials from the given file handle.
+def _file_stamp(credentials_file):
+    """Returns a marker that changes whenever an open file is modified.
+
+    The marker is the file's inode, size and modification time. Appending a
+    record always changes the size, and replacing the file changes the inode.
+    """
+    stat = os.fstat(credentials_file.fileno())
+    return (stat.st_ino, stat.st_size,
+            getattr(stat, 'st_mtime_ns', stat.st_mtime))
+
+
+def _decode_credential(encoded_credential):
+    """Builds credentials from their base64 encoded JSON representation."""
+    credential_json = base64.b64decode(encoded_credential)
+    return client.Credentials.new_from_json(credential_json)
+
+
+def _encode_credential(credential):
+    """Returns the base64 encoded JSON representation of credentials."""
+    return _helpers._from_bytes(base64.b64encode(
+        _helpers._to_bytes(credential.to_json())))
+
+
+def _read_credentials_file(credentials_file):
+    """Reads credentials from the given file handle.
+
+    The current format is a log of JSON records, one per line. The first
+    line is a header, and each following line sets or deletes the
+    credentials of one key, later lines taking precedence:
 
-    The file is expected to be in this format:
+        {"file_version": 3}
+        {"key": "key", "credential": "base64 encoded json representation"}
+        {"key": "key", "deleted": true}
+
+    Files in the previous format, a single JSON object, are also read:
 
         {
             "file_version": 2,
@@ -131,31 +175,94 @@ def _load_credentials_file(credentials_file):
         credentials_file: An open file handle.
 
     Returns:
-        A dictionary mapping user-defined keys to an instance of
-        :class:`oauth2client_latest.client.Credentials`.
+        A tuple of a dictionary mapping user-defined keys to the base64
+        encoded JSON representation of their credentials, and the number of
+        records in the file, or None if the file is not in the current
+        format and has to be rewritten before records can be appended.
     """
+    credentials_file.seek(0)
+    contents = credentials_file.read()
+    lines = contents.split('\n')
     try:
-        credentials_file.seek(0)
-        data = json.load(credentials_file)
-    except Exception:
-        logger.warning(
-            'Credentials file could not be loaded, will ignore and '
-            'overwrite.')
-        return {}
-
-    if data.get('file_version') != 2:
-        logger.warning(
-            'Credentials file is not version 2, will ignore and '
-            'overwrite.')
-        return {}
+        header = json.loads(lines[0])
+    except ValueError:
+        header = None
+
+    if isinstance(header, dict) and header.get('file_version') == 3:
+        encoded_credentials = {}
+        num_records = 0
+        for line in lines[1:]:
+            if not line.strip():
+                continue
+            num_records += 1
+            try:
+                record = json.loads(line)
+                key = record['key']
+                if record.get('deleted'):
+                    encoded_credentials.pop(key, None)
+                else:
+                    encoded_credentials[key] = record['credential']
+            except Exception:
+                # E.g. a record partially written by a process that died.
+                logger.warning('Invalid record in credentials file, ignoring.')
+    else:
+        num_records = None
+        try:
+            data = json.loads(contents)
+        except Exception:
+            logger.warning(
+                'Credentials file could not be loaded, will ignore and '
+                'overwrite.')
+            return {}, None
 
+        if data.get('file_version') != 2:
+            logger.warning(
+                'Credentials file is not version 2, will ignore and '
+                'overwrite.')
+            return {}, None
+        encoded_credentials = data.get('credentials', {})
+
+    return encoded_credentials, num_records
+
+
+def _read_changes(credentials_file, file_stamp):
+    """Reads credentials from a file, unless it is unchanged.
+
+    Args:
+        credentials_file: An open file handle.
+        file_stamp: The _file_stamp() of the file when it was last read.
+
+    Returns:
+        None if the file has the given stamp, otherwise a tuple of its
+        _file_stamp() and the result of :func:`_read_credentials_file`.
+    """
+    new_file_stamp = _file_stamp(credentials_file)
+    if new_file_stamp == file_stamp:
+        # Nothing has changed since this process last read or wrote it.
+        return None
+    encoded_credentials, num_records = _read_credentials_file(
+        credentials_file)
+    return new_file_stamp, encoded_credentials, num_records
+
+
+def _load_credentials_file(credentials_file):
+    """Load credentials from the given file handle.
+
+    Refer to :func:`_read_credentials_file` for the format.
+
+    Args:
+        credentials_file: An open file handle.
+
+    Returns:
+        A dictionary mapping user-defined keys to an instance of
+        :class:`oauth2client_latest.client.Credentials`.
+    """
+    encoded_credentials = _read_credentials_file(credentials_file)[0]
     credentials = {}
 
-    for key, encoded_credential in iteritems(data.get('credentials', {})):
+    for key, encoded_credential in iteritems(encoded_credentials):
         try:
-            credential_json = base64.b64decode(encoded_credential)
-            credential = client.Credentials.new_from_json(credential_json)
-            credentials[key] = credential
+            credentials[key] = _decode_credential(encoded_credential)
         except:
             logger.warning(
                 'Invalid credential {0} in file, ignoring.'.format(key))
@@ -164,66 +271,247 @@ def _load_credentials_file(credentials_file):
 
 
 def _write_credentials_file(credentials_file, credentials):
-    """Writes credentials to a file.
+    """Writes credentials to a file, replacing its contents.
 
-    Refer to :func:`_load_credentials_file` for the format.
+    Refer to :func:`_read_credentials_file` for the format.
 
     Args:
         credentials_file: An open file handle, must be read/write.
         credentials: A dictionary mapping user-defined keys to an instance of
-            :class:`oauth2client_latest.client.Credentials`.
+            :class:`oauth2client_latest.client.Credentials`, or to the base64
+            encoded JSON representation of one as read from a file.
     """
-    data = {'file_version': 2, 'credentials': {}}
-
-    for key, credential in iteritems(credentials):
-        credential_json = credential.to_json()
-        encoded_credential = _helpers._from_bytes(base64.b64encode(
-            _helpers._to_bytes(credential_json)))
-        data['credentials'][key] = encoded_credential
-
     credentials_file.seek(0)
-    json.dump(data, credentials_file)
+    json.dump({'file_version': 3}, credentials_file)
+    for key, credential in iteritems(credentials):
+        if isinstance(credential, client.Credentials):
+            credential = _encode_credential(credential)
+        _write_record(credentials_file, key, credential)
     credentials_file.truncate()
 
 
+def _append_credential(credentials_file, key, credential):
+    """Appends a record for one key to a file.
+
+    Args:
+        credentials_file: An open file handle, must be read/write and in the
+            current format.
+        key: The user-defined key of the credentials.
+        credential: An instance of
+            :class:`oauth2client_latest.client.Credentials`, or None to
+            record that the credentials were deleted.
+
+    Returns:
+        The base64 encoded JSON representation of the credentials written,
+        or None.
+    """
+    credentials_file.seek(0, os.SEEK_END)
+    if credential is not None:
+        credential = _encode_credential(credential)
+    _write_record(credentials_file, key, credential)
+    return credential
+
+
+def _write_record(credentials_file, key, encoded_credential):
+    if encoded_credential is None:
+        record = {'key': key, 'deleted': True}
+    else:
+        record = {'key': key, 'credential': encoded_credential}
+    # Records start rather than end with a newline, so that one appended
+    # after a partially written record still starts on a line of its own.
+    credentials_file.write('\n')
+    json.dump(record, credentials_file)
+
+
+class _ReadWriteLock(object):
+    """Thread lock held either shared by readers or by a single writer.
+
+    Waiting writers go before new readers, so that a steady stream of
+    readers doesn't keep a writer waiting forever.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writing = False
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        with self._condition:
+            while self._writing or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._condition:
+            self._readers -= 1
+            if not self._readers:
+                self._condition.notify_all()
+
+    def acquire(self):
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writing = True
+
+    def release(self):
+        with self._condition:
+            self._writing = False
+            self._condition.notify_all()
+
+
 class _MultiprocessStorageBackend(object):
     """Thread-local backend for multiprocess storage.
 
     Each process has only one instance of this backend per file. All threads
     share a single instance of this backend. This ensures that all threads
     use the same thread lock and process lock when accessing the file.
+
+    Both locks are reader/writer locks. Writing, and refreshing credentials
+    through the :class:`oauth2client_latest.client.Storage` lock, takes them
+    exclusively. Reading with :meth:`get` takes them shared, so that readers
+    in all threads and processes only wait for writers.
     """
 
     def __init__(self, filename):
         self._file = None
         self._filename = filename
-        self._process_lock = fasteners.InterProcessLock(
+        self._process_lock = fasteners.InterProcessReaderWriterLock(
             '{0}.lock'.format(filename))
-        self._thread_lock = threading.Lock()
+        self._thread_lock = _ReadWriteLock()
+        # Serializes the readers holding the shared locks when they count
+        # themselves or update the credentials in memory. Reading and
+        # decoding the file happen outside of it.
+        self._reader_lock = threading.Lock()
+        self._readers = 0
+        self._process_read_locked = False
         self._read_only = False
+        # Credentials are only decoded from the encoded form read from the
+        # file when their key is first used, as each file may be shared by
+        # many tools and users.
         self._credentials = {}
+        self._encoded_credentials = {}
+        # Number of records in the file, or None if it must be rewritten.
+        self._num_records = None
+        # _file_stamp() of the file when its credentials were last loaded or
+        # written by this process.
+        self._file_stamp = None
 
-    def _load_credentials(self):
-        """(Re-)loads the credentials from the file."""
-        if not self._file:
+    def _load_credentials(self, credentials_file=None):
+        """(Re-)loads the credentials from the file.
+
+        Args:
+            credentials_file: An open file handle to read instead of the one
+                opened by :meth:`acquire_lock`.
+        """
+        credentials_file = credentials_file or self._file
+        if not credentials_file:
             return
 
-        loaded_credentials = _load_credentials_file(self._file)
-        self._credentials.update(loaded_credentials)
+        changes = _read_changes(credentials_file, self._file_stamp)
+        if changes is not None:
+            self._apply_changes(*changes)
+
+    def _apply_changes(self, file_stamp, encoded_credentials, num_records):
+        """Updates the credentials in memory from a read of the file.
+
+        Args:
+            file_stamp: The _file_stamp() of the file that was read.
+            encoded_credentials: A dictionary mapping keys to the base64
+                encoded JSON representation of their credentials.
+            num_records: The number of records in the file, or None.
+        """
+        for key in list(self._encoded_credentials):
+            if key not in encoded_credentials:
+                # Deleted by another process.
+                del self._encoded_credentials[key]
+        for key in list(self._credentials):
+            if key not in encoded_credentials:
+                del self._credentials[key]
+        for key, encoded_credential in iteritems(encoded_credentials):
+            if self._encoded_credentials.get(key) != encoded_credential:
+                # Changed in the file, decode again when next used.
+                self._encoded_credentials[key] = encoded_credential
+                self._credentials.pop(key, None)
+        self._num_records = num_records
+        self._file_stamp = file_stamp
 
         logger.debug('Read credential file')
 
-    def _write_credentials(self):
+    def _get_credentials(self, key):
+        """Gets the credentials of a key, decoding them if needed."""
+        credentials = self._credentials.get(key)
+        encoded_credential = self._encoded_credentials.get(key)
+        if credentials is None and encoded_credential is not None:
+            credentials = self._decode(key, encoded_credential)
+            self._store_decoded(key, encoded_credential, credentials)
+        return credentials
+
+    def _decode(self, key, encoded_credential):
+        """Decodes the credentials of a key, or returns None if invalid."""
+        try:
+            return _decode_credential(encoded_credential)
+        except Exception:
+            logger.warning(
+                'Invalid credential {0} in file, ignoring.'.format(key))
+            return None
+
+    def _store_decoded(self, key, encoded_credential, credentials):
+        """Keeps decoded credentials, or forgets invalid ones.
+
+        Nothing changes if the key was updated since it was decoded.
+
+        Returns:
+            The credentials of the key in memory.
+        """
+        if self._encoded_credentials.get(key) != encoded_credential:
+            return credentials
+        if credentials is None:
+            del self._encoded_credentials[key]
+            return None
+        return self._credentials.setdefault(key, credentials)
+
+    def _write_credentials(self, key):
+        """Writes the credentials of one key to the file.
+
+        Args:
+            key: The key of the credentials that changed. The credentials
+                 are deleted from the file if the key is not in memory.
+        """
         if self._read_only:
             logger.debug('In read-only mode, not writing credentials.')
             return
 
-        _write_credentials_file(self._file, self._credentials)
-        logger.debug('Wrote credential file {0}.'.format(self._filename))
+        self._encoded_credentials.pop(key, None)
+        credentials = self._encoded_credentials.copy()
+        credentials.update(self._credentials)
+        max_records = max(COMPACTION_MIN_RECORDS, 2 * len(credentials))
+        if self._num_records is None or self._num_records >= max_records:
+            # Rewriting the file writes every credential held in memory as
+            # it is, as it may have changed since it was read, e.g. by a put
+            # in read-only mode.
+            _write_credentials_file(self._file, credentials)
+            self._num_records = len(credentials)
+            logger.debug('Wrote credential file {0}.'.format(self._filename))
+        else:
+            # Appending only writes the credentials of the changed key.
+            encoded_credential = _append_credential(
+                self._file, key, self._credentials.get(key))
+            if encoded_credential is not None:
+                self._encoded_credentials[key] = encoded_credential
+            self._num_records += 1
+            logger.debug('Appended to credential file {0}.'.format(
+                self._filename))
+
+        self._file.flush()
+        self._file_stamp = _file_stamp(self._file)
 
     def acquire_lock(self):
         self._thread_lock.acquire()
-        locked = self._process_lock.acquire(timeout=INTERPROCESS_LOCK_DEADLINE)
+        locked = self._process_lock.acquire_write_lock(
+            timeout=INTERPROCESS_LOCK_DEADLINE)
 
         if locked:
             _create_file_if_needed(self._filename)
@@ -249,10 +537,70 @@ class _MultiprocessStorageBackend(object):
             self._file = None
 
         if not self._read_only:
-            self._process_lock.release()
+            self._process_lock.release_write_lock()
 
         self._thread_lock.release()
 
+    def _acquire_read_lock(self):
+        self._thread_lock.acquire_read()
+        with self._reader_lock:
+            if not self._readers:
+                # The first reader takes the process lock for all of them.
+                self._process_read_locked = (
+                    self._process_lock.acquire_read_lock(
+                        timeout=INTERPROCESS_LOCK_DEADLINE))
+                if not self._process_read_locked:
+                    logger.warning(
+                        'Failed to obtain interprocess lock for reading '
+                        'credentials, reading without it.')
+            self._readers += 1
+
+    def _release_read_lock(self):
+        with self._reader_lock:
+            self._readers -= 1
+            if not self._readers and self._process_read_locked:
+                self._process_lock.release_read_lock()
+                self._process_read_locked = False
+        self._thread_lock.release_read()
+
+    def get(self, key):
+        """Gets credentials, holding the locks shared.
+
+        Args:
+            key: The key of the credentials.
+
+        Returns:
+            An instance of :class:`oauth2client_latest.client.Credentials` or
+            `None`.
+        """
+        self._acquire_read_lock()
+        try:
+            with self._reader_lock:
+                file_stamp = self._file_stamp
+            try:
+                credentials_file = open(self._filename, 'r')
+            except (IOError, OSError):
+                changes = None
+            else:
+                with credentials_file:
+                    changes = _read_changes(credentials_file, file_stamp)
+
+            with self._reader_lock:
+                # Skipped if another reader updated them meanwhile.
+                if changes is not None and self._file_stamp == file_stamp:
+                    self._apply_changes(*changes)
+                credentials = self._credentials.get(key)
+                encoded_credential = self._encoded_credentials.get(key)
+            if credentials is not None or encoded_credential is None:
+                return credentials
+
+            credentials = self._decode(key, encoded_credential)
+            with self._reader_lock:
+                return self._store_decoded(key, encoded_credential,
+                                           credentials)
+        finally:
+            self._release_read_lock()
+
     def _refresh_predicate(self, credentials):
         if credentials is None:
             return True
@@ -265,7 +613,7 @@ class _MultiprocessStorageBackend(object):
 
     def locked_get(self, key):
         # Check if the credential is already in memory.
-        credentials = self._credentials.get(key, None)
+        credentials = self._get_credentials(key)
 
         # Use the refresh predicate to determine if the entire store should be
         # reloaded. This basically checks if the credentials are invalid
@@ -274,19 +622,19 @@ class _MultiprocessStorageBackend(object):
         # In that case, this process won't needlessly refresh the credentials.
         if self._refresh_predicate(credentials):
             self._load_credentials()
-            credentials = self._credentials.get(key, None)
+            credentials = self._get_credentials(key)
 
         return credentials
 
     def locked_put(self, key, credentials):
         self._load_credentials()
         self._credentials[key] = credentials
-        self._write_credentials()
+        self._write_credentials(key)
 
     def locked_delete(self, key):
         self._load_credentials()
         self._credentials.pop(key, None)
-        self._write_credentials()
+        self._write_credentials(key)
 
 
 def _get_backend(filename):
@@ -328,6 +676,25 @@ class MultiprocessFileStorage(client.Storage):
     def release_lock(self):
         self._backend.release_lock()
 
+    def get(self):
+        """Retrieves the current credentials from the store.
+
+        Unlike the other methods of
+        :class:`oauth2client_latest.client.Storage`, this doesn't take the
+        lock exclusively, so reading credentials doesn't wait for other
+        threads and processes reading them.
+
+        Returns:
+            An instance of :class:`oauth2client_latest.client.Credentials` or
+            `None`.
+        """
+        credential = self._backend.get(self._key)
+
+        if credential is not None:
+            credential.set_store(self)
+
+        return credential
+
     def locked_get(self):
         """Retrieves the current credentials from the store.
 
@@ -20,12 +20,14 @@ Configuration
 =============
 
 In order to use this storage, you'll need to create table
-with :class:`oauth2client_latest.contrib.sqlalchemy.CredentialsType` column.
-It's recommended to either put this column on some sort of user info
+with :class:`oauth2client_latest.contrib.sqlalchemy.CredentialsJSONType` or
+:class:`oauth2client_latest.contrib.sqlalchemy.CredentialsType` column. The
+former stores the JSON representation of the credentials, the latter pickles
+them. It's recommended to either put this column on some sort of user info
 table or put the column in a table with a belongs-to relationship to
 a user info table.
 
-Here's an example of a simple table with a :class:`CredentialsType`
+Here's an example of a simple table with a :class:`CredentialsJSONType`
 column that's related to a user table by the `user_id` key.
 
 .. code-block:: python
@@ -34,7 +36,7 @@ column that's related to a user table by the `user_id` key.
     from sqlalchemy.ext.declarative import declarative_base
     from sqlalchemy.orm import relationship
 
-    from oauth2client_latest.contrib.sqlalchemy import CredentialsType
+    from oauth2client_latest.contrib.sqlalchemy import CredentialsJSONType
 
 
     Base = declarative_base()
@@ -44,7 +46,7 @@ column that's related to a user table by the `user_id` key.
         __tablename__ = 'credentials'
 
         user_id = Column(Integer, ForeignKey('user.id'))
-        credentials = Column(CredentialsType)
+        credentials = Column(CredentialsJSONType)
 
 
     class User(Base):
@@ -88,15 +90,37 @@ We will reuse tables defined above.
     # Delete
     storage.delete()
 
+To read or write the credentials of many users at once, e.g. to refresh
+them in bulk, use :func:`get_many` and :func:`put_many`. They take a
+handful of statements however many users there are. The credentials
+returned by :func:`get_many` have no storage set, so refreshing them
+writes nothing until :func:`put_many` saves them all:
+
+.. code-block:: python
+
+    from oauth2client_latest.contrib.sqlalchemy import get_many, put_many
+
+    credentials = get_many(session, Credentials, 'user_id', user_ids,
+                           'credentials')
+    for user_credentials in credentials.values():
+        user_credentials.refresh(http)
+    put_many(session, Credentials, 'user_id', credentials, 'credentials')
+    session.commit()
+
 """
 
 from __future__ import absolute_import
 
+import sqlalchemy
 import sqlalchemy.types
 
 from oauth2client_latest import client
 
 
+# Most keys in one IN clause, within SQLite's limit on bound parameters.
+_MAX_KEYS_PER_QUERY = 500
+
+
 class CredentialsType(sqlalchemy.types.PickleType):
     """Type representing credentials.
 
@@ -104,15 +128,140 @@ class CredentialsType(sqlalchemy.types.PickleType):
     """
 
 
+class CredentialsJSONType(sqlalchemy.types.TypeDecorator):
+    """Type representing credentials, stored as their JSON representation.
+
+    Unlike :class:`CredentialsType`, the stored credentials don't depend on
+    the pickled layout of the credentials classes.
+    """
+
+    impl = sqlalchemy.types.Text
+    # The type has no state, so statements using it can be cached.
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return value.to_json()
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return client.Credentials.new_from_json(value)
+
+
+def _chunks(values):
+    for start in range(0, len(values), _MAX_KEYS_PER_QUERY):
+        yield values[start:start + _MAX_KEYS_PER_QUERY]
+
+
+def _columns(model_class, key_name, property_name):
+    columns = sqlalchemy.inspect(model_class).columns
+    return columns[key_name], columns[property_name]
+
+
+def get_many(session, model_class, key_name, key_values, property_name,
+             with_storage=False):
+    """Retrieves the credentials of many entities.
+
+    Issues one query per 500 keys.
+
+    Args:
+        session: An instance of :class:`sqlalchemy.orm.Session`.
+        model_class: SQLAlchemy declarative mapping.
+        key_name: string, key name for the entities that have the
+                  credentials.
+        key_values: iterable, key values of the entities.
+        property_name: A string indicating which property on the
+                       ``model_class`` stores the credentials.
+        with_storage: bool, whether to set a :class:`Storage` on each of
+                      the credentials. Each refresh then reads and writes
+                      its own row, so leave it off when the credentials
+                      are saved with :func:`put_many`.
+
+    Returns:
+        A dictionary mapping key values to instances of
+        :class:`oauth2client_latest.client.Credentials`. Keys without
+        credentials are left out.
+    """
+    key_column, property_column = _columns(model_class, key_name,
+                                           property_name)
+    result = {}
+    for chunk in _chunks(list(set(key_values))):
+        rows = session.query(key_column, property_column).filter(
+            key_column.in_(chunk))
+        for key_value, credential in rows:
+            if credential is None:
+                continue
+            if with_storage and hasattr(credential, 'set_store'):
+                credential.set_store(Storage(session, model_class, key_name,
+                                             key_value, property_name))
+            result[key_value] = credential
+    return result
+
+
+def put_many(session, model_class, key_name, credentials, property_name):
+    """Writes the credentials of many entities.
+
+    Updates the existing entities and inserts the missing ones, with one
+    query per 500 keys to find the existing ones, then one ``executemany``
+    of each of UPDATE and INSERT. The statements
+    bypass the ORM, so entities already loaded into the session aren't
+    updated. As with :class:`Storage`, committing the session is up to the
+    caller.
+
+    Args:
+        session: An instance of :class:`sqlalchemy.orm.Session`.
+        model_class: SQLAlchemy declarative mapping.
+        key_name: string, key name for the entities that have the
+                  credentials.
+        credentials: A dictionary mapping key values to instances of
+                     :class:`oauth2client_latest.client.Credentials`.
+        property_name: A string indicating which property on the
+                       ``model_class`` stores the credentials.
+    """
+    key_column, property_column = _columns(model_class, key_name,
+                                           property_name)
+    existing = set()
+    for chunk in _chunks(list(credentials)):
+        rows = session.query(key_column).filter(key_column.in_(chunk))
+        existing.update(key_value for key_value, in rows)
+
+    updates = [{'_key': key_value, '_credentials': credentials[key_value]}
+               for key_value in existing]
+    inserts = [{key_column.key: key_value,
+                property_column.key: credential}
+               for key_value, credential in credentials.items()
+               if key_value not in existing]
+    if updates:
+        session.execute(
+            key_column.table.update().where(
+                key_column == sqlalchemy.bindparam('_key')).values(
+                    {property_column: sqlalchemy.bindparam('_credentials')}),
+            updates)
+    if inserts:
+        session.execute(key_column.table.insert(), inserts)
+
+
 class Storage(client.Storage):
     """Store and retrieve a single credential to and from SQLAlchemy.
     This helper presumes the Credentials
     have been stored as a Credentials column
     on a db model class.
+
+    With ``select_for_update``, the Storage lock is the row of the entity:
+    the credentials are read with ``SELECT ... FOR UPDATE`` while the lock
+    is held, and releasing the lock commits the session. When several
+    servers refresh the same credentials at once, only the first one asks
+    for a new access token, and the others read it from the database. The
+    session should then be used for nothing else, so that committing it
+    doesn't commit unrelated changes. Databases without ``FOR UPDATE``,
+    such as SQLite, lock the whole database on the first write instead, so
+    there refreshes aren't deduplicated across servers.
     """
 
     def __init__(self, session, model_class, key_name,
-                 key_value, property_name):
+                 key_value, property_name, select_for_update=False):
         """Constructor for Storage.
 
         Args:
@@ -124,6 +273,8 @@ class Storage(client.Storage):
                            ``model_class`` to store the credentials.
                            This property must be a
                            :class:`CredentialsType` column.
+            select_for_update: bool, whether to lock the row of the entity
+                               as the Storage lock.
         """
         super(Storage, self).__init__()
 
@@ -132,6 +283,41 @@ class Storage(client.Storage):
         self.key_name = key_name
         self.key_value = key_value
         self.property_name = property_name
+        self.select_for_update = select_for_update
+        self._row_locked = False
+
+    def acquire_lock(self):
+        """Acquires the Storage lock.
+
+        With ``select_for_update``, the row is locked by the next
+        :meth:`locked_get`, until :meth:`release_lock` commits.
+        """
+        super(Storage, self).acquire_lock()
+        self._row_locked = self.select_for_update
+
+    def release_lock(self):
+        """Releases the Storage lock.
+
+        With ``select_for_update``, commits the session to unlock the row.
+        """
+        try:
+            if self._row_locked:
+                self._row_locked = False
+                self.session.commit()
+        finally:
+            super(Storage, self).release_lock()
+
+    def get(self):
+        """Retrieve stored credential.
+
+        Unlike refreshing credentials, this doesn't lock the row.
+
+        Returns:
+            A :class:`oauth2client_latest.Credentials` instance or `None`.
+        """
+        if self.select_for_update:
+            return self.locked_get()
+        return super(Storage, self).get()
 
     def locked_get(self):
         """Retrieve stored credential.
@@ -141,6 +327,10 @@ class Storage(client.Storage):
         """
         filters = {self.key_name: self.key_value}
         query = self.session.query(self.model_class).filter_by(**filters)
+        if self._row_locked:
+            # The entity may already be in the session, loaded before
+            # another server changed the credentials.
+            query = query.with_for_update().populate_existing()
         entity = query.first()
 
         if entity:
@@ -0,0 +1,366 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Keeps the access tokens of many credentials fresh.
+
+Services acting on behalf of many users end up with one credentials object
+per user and scope set, each refreshing itself on demand when a request
+finds its token expired. :class:`TokenBroker` instead holds all of them,
+keyed by anything hashable (e.g. a ``(user_id, scopes)`` tuple), and
+refreshes each one shortly before its token expires. Refreshes are ordered
+by expiry, limited to a maximum rate against the token endpoint and run a
+batch at a time on a small thread pool, so that a burst of tokens expiring
+together doesn't turn into a burst of requests.
+
+Refreshes go through the credentials' usual refresh path, so credentials
+with a :class:`oauth2client_latest.client.Storage` set, such as the ones
+returned by ``Storage.get()`` for the SQLAlchemy or Django storages, are
+read from and written back to their storage as usual. Refreshes run on
+several threads at once, so the storages must be safe to use from any of
+them: e.g. give SQLAlchemy storages a ``scoped_session``, which hands each
+thread its own session, rather than a single session.
+
+Usage
+=====
+
+.. code-block:: python
+
+    from sqlalchemy.orm import scoped_session, sessionmaker
+
+    from oauth2client_latest.contrib import token_broker
+
+    session = scoped_session(sessionmaker(bind=engine))
+    broker = token_broker.TokenBroker(max_refreshes_per_sec=20)
+    for user_id in user_ids:
+        storage = Storage(session, CredentialsModel, 'user_id', user_id,
+                          'credentials')
+        broker.add((user_id, SCOPES), storage.get())
+    broker.start()
+
+    access_token = broker.get_access_token((user_id, SCOPES)).access_token
+"""
+
+import datetime
+import heapq
+import itertools
+import logging
+from multiprocessing import pool
+import threading
+import time
+
+from oauth2client_latest import client
+from oauth2client_latest import transport
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before retrying a failed refresh.
+RETRY_SECS = 30
+# Minimum seconds between two refreshes of the same credentials, for tokens
+# that expire as soon as they are obtained.
+_MIN_REFRESH_INTERVAL_SECS = 10
+# Longest the background thread sleeps before checking for due refreshes.
+_MAX_SLEEP_SECS = 60
+
+
+class _RateLimiter(object):
+    """Token bucket allowing ``rate`` operations per second on average.
+
+    Args:
+        rate: float, operations per second.
+        burst: int, the most operations allowed at once.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.time()
+
+    def _fill(self):
+        now = time.time()
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, count):
+        """Takes up to ``count`` operations from the bucket.
+
+        Returns:
+            int, the number of operations allowed now.
+        """
+        self._fill()
+        allowed = min(count, int(self._tokens))
+        self._tokens -= allowed
+        return allowed
+
+    def delay(self):
+        """Seconds until the next operation is allowed."""
+        self._fill()
+        if self._tokens >= 1:
+            return 0
+        return (1 - self._tokens) / self.rate
+
+
+class TokenBroker(object):
+    """Holds many credentials and refreshes them before they expire.
+
+    Args:
+        http: An ``httplib2.Http`` compatible object used for all refreshes.
+              It must be safe to use from several threads, e.g. a
+              :class:`oauth2client_latest.contrib.urllib3_http.PooledHttp`.
+              Defaults to a new object from
+              :func:`oauth2client_latest.transport.get_http_object` per
+              refresh.
+        refresh_ahead_secs: int, how long before their tokens expire
+                            credentials are refreshed.
+        max_refreshes_per_sec: float, the most refresh requests made per
+                               second on average.
+        max_batch_size: int, the most refreshes run at once.
+    """
+
+    def __init__(self, http=None, refresh_ahead_secs=client.REFRESH_AHEAD_SECS,
+                 max_refreshes_per_sec=10, max_batch_size=10):
+        self._http = http
+        self._refresh_ahead = datetime.timedelta(seconds=refresh_ahead_secs)
+        self._rate_limiter = _RateLimiter(max_refreshes_per_sec,
+                                          max_batch_size)
+        self.max_batch_size = max_batch_size
+        self._credentials = {}
+        # Heap of (due, sequence number, key). An entry is stale unless it
+        # is the one recorded for its key in _scheduled.
+        self._heap = []
+        self._scheduled = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self._pool = None
+
+    def __len__(self):
+        return len(self._credentials)
+
+    def __contains__(self, key):
+        return key in self._credentials
+
+    def add(self, key, credentials):
+        """Adds credentials, replacing any held under the same key.
+
+        Args:
+            key: hashable, the key to get the access token by.
+            credentials: OAuth2Credentials, the credentials to refresh.
+        """
+        with self._lock:
+            self._credentials[key] = credentials
+            self._schedule(key, credentials)
+        self._wakeup.set()
+
+    def remove(self, key):
+        """Removes credentials. Does nothing if there are none for the key.
+
+        Args:
+            key: hashable, the key the credentials were added with.
+        """
+        with self._lock:
+            self._credentials.pop(key, None)
+            self._scheduled.pop(key, None)
+
+    def get_credentials(self, key):
+        """Gets the credentials held for a key.
+
+        Raises:
+            KeyError: if there are no credentials for the key.
+        """
+        return self._credentials[key]
+
+    def get_access_token(self, key):
+        """Gets the access token for a key.
+
+        The token is normally already fresh. If it is missing or expiring,
+        e.g. because background refreshes are not running, the credentials
+        are refreshed first, waiting for the rate limit if needed.
+
+        Args:
+            key: hashable, the key the credentials were added with.
+
+        Returns:
+            An :class:`oauth2client_latest.client.AccessTokenInfo`.
+
+        Raises:
+            KeyError: if there are no credentials for the key.
+            HttpAccessTokenRefreshError: if the refresh fails.
+        """
+        credentials = self._credentials[key]
+        if transport._token_needs_refresh(credentials):
+            self._wait_for_rate_limit()
+            self._refresh(key, credentials)
+        return client.AccessTokenInfo(access_token=credentials.access_token,
+                                      expires_in=credentials._expires_in())
+
+    def _wait_for_rate_limit(self):
+        """Blocks until the rate limit allows one more refresh."""
+        while True:
+            with self._lock:
+                if self._rate_limiter.acquire(1):
+                    return
+                delay = self._rate_limiter.delay()
+            time.sleep(delay)
+
+    def _schedule(self, key, credentials, due=None, not_before=None):
+        """Schedules the next refresh of credentials. Requires the lock.
+
+        Args:
+            key: hashable, the key the credentials were added with.
+            credentials: OAuth2Credentials, the credentials.
+            due: datetime, when to refresh. Defaults to refresh_ahead_secs
+                 before the token expires, or halfway through the remaining
+                 lifetime of tokens expiring sooner, or now if there is no
+                 token.
+            not_before: datetime, the earliest time to refresh.
+        """
+        if due is None:
+            now = client._UTCNOW()
+            if not credentials.access_token or credentials.invalid:
+                due = now
+            elif credentials.token_expiry is None:
+                self._scheduled.pop(key, None)
+                return
+            else:
+                remaining = max(credentials.token_expiry - now,
+                                datetime.timedelta())
+                due = credentials.token_expiry - min(self._refresh_ahead,
+                                                     remaining // 2)
+        if not_before is not None:
+            due = max(due, not_before)
+        entry = (due, next(self._counter), key)
+        self._scheduled[key] = entry
+        heapq.heappush(self._heap, entry)
+
+    def _pop_due(self, now):
+        """Pops the keys that are due, as far as the rate limit allows.
+
+        Requires the lock.
+
+        Returns:
+            list, (key, credentials) pairs to refresh now.
+        """
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            key = entry[2]
+            if self._scheduled.get(key) is entry:
+                due.append(entry)
+        allowed = self._rate_limiter.acquire(
+            min(len(due), self.max_batch_size))
+        # Push back what can't be refreshed yet, keeping its place.
+        for entry in due[allowed:]:
+            heapq.heappush(self._heap, entry)
+        batch = []
+        for entry in due[:allowed]:
+            key = entry[2]
+            del self._scheduled[key]
+            batch.append((key, self._credentials[key]))
+        return batch
+
+    def _next_delay(self, now):
+        """Seconds until the next refresh can run. Requires the lock."""
+        while self._heap and self._scheduled.get(
+                self._heap[0][2]) is not self._heap[0]:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        delta = self._heap[0][0] - now
+        delay = max(0, delta.days * 86400 + delta.seconds +
+                    delta.microseconds / 1e6)
+        return max(delay, self._rate_limiter.delay())
+
+    def _refresh(self, key, credentials):
+        http = self._http or transport.get_http_object()
+        try:
+            credentials._refresh(http.request)
+        finally:
+            with self._lock:
+                if self._credentials.get(key) is credentials:
+                    self._schedule(
+                        key, credentials, not_before=client._UTCNOW() +
+                        datetime.timedelta(
+                            seconds=_MIN_REFRESH_INTERVAL_SECS))
+
+    def _refresh_in_background(self, key_and_credentials):
+        key, credentials = key_and_credentials
+        try:
+            self._refresh(key, credentials)
+        except Exception:
+            logger.warning('Background refresh of %r failed.', key,
+                           exc_info=True)
+            with self._lock:
+                if (self._credentials.get(key) is credentials and
+                        not credentials.invalid):
+                    self._schedule(key, credentials, client._UTCNOW() +
+                                   datetime.timedelta(seconds=RETRY_SECS))
+                else:
+                    self._scheduled.pop(key, None)
+
+    def refresh_due(self):
+        """Refreshes the credentials that are due, as the rate limit allows.
+
+        This is called by the background thread started with start(), but
+        can also be called directly, e.g. from an existing scheduler.
+
+        Returns:
+            float, seconds until more credentials are due or the rate limit
+            allows more refreshes, or None if nothing is scheduled.
+        """
+        with self._lock:
+            batch = self._pop_due(client._UTCNOW())
+        if len(batch) == 1 or (batch and self._pool is None):
+            for key_and_credentials in batch:
+                self._refresh_in_background(key_and_credentials)
+        elif batch:
+            self._pool.map(self._refresh_in_background, batch)
+        with self._lock:
+            return self._next_delay(client._UTCNOW())
+
+    def start(self):
+        """Starts refreshing in a background daemon thread."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopped = False
+            self._pool = pool.ThreadPool(self.max_batch_size)
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """Stops the background thread started with start()."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._stopped = True
+        self._wakeup.set()
+        if thread is not None:
+            thread.join()
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.clear()
+            delay = self.refresh_due()
+            if delay is None:
+                delay = _MAX_SLEEP_SECS
+            self._wakeup.wait(min(delay, _MAX_SLEEP_SECS))
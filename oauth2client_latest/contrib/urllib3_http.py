@@ -0,0 +1,136 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Thread-safe HTTP objects with connection pooling, built on urllib3.
+
+``httplib2.Http`` objects keep a single connection per host and can't be
+shared between threads, so multi-threaded applications end up creating an
+``Http`` object, and a new TLS connection, per thread or per request.
+
+:class:`PooledHttp` has the same ``request()`` method as ``httplib2.Http``,
+so it can be used anywhere an ``httplib2.Http`` object is accepted:
+``credentials.authorize()``, ``credentials.refresh()``,
+:func:`oauth2client_latest.client.verify_id_token` and so on. Its requests go
+through a ``urllib3.PoolManager`` which is safe to use from many threads at
+once and keeps connections alive between requests. By default, every
+:class:`PooledHttp` object shares a single module-level pool.
+
+Usage
+=====
+
+.. code-block:: python
+
+    from oauth2client_latest.contrib import urllib3_http
+
+    http = credentials.authorize(urllib3_http.PooledHttp())
+    resp, content = http.request('https://www.googleapis.com/drive/v3/files')
+
+``authorize()`` replaces the ``request()`` method of the object it is given,
+so create a :class:`PooledHttp` for each set of credentials; they are cheap
+and share connections. To use pooled connections wherever this library
+creates an HTTP object itself, e.g. in
+:meth:`oauth2client_latest.client.OAuth2Credentials.get_access_token`, set the
+factory used by :func:`oauth2client_latest.transport.get_http_object`:
+
+.. code-block:: python
+
+    from oauth2client_latest import transport
+
+    transport.set_http_factory(urllib3_http.PooledHttp)
+"""
+
+import threading
+
+import httplib2
+import six
+import urllib3
+
+from oauth2client_latest import _helpers
+
+
+# Number of connections kept alive per host by the shared pool.
+POOL_MAXSIZE = 10
+
+_pool_manager = None
+_pool_manager_lock = threading.Lock()
+
+
+def _get_pool_manager():
+    """Returns the module-level PoolManager, creating it if needed."""
+    global _pool_manager
+    with _pool_manager_lock:
+        if _pool_manager is None:
+            _pool_manager = urllib3.PoolManager(maxsize=POOL_MAXSIZE)
+        return _pool_manager
+
+
+class PooledHttp(object):
+    """An ``httplib2.Http`` stand-in sending requests through a pool.
+
+    Args:
+        pool_manager: urllib3.PoolManager, the pool to send requests through.
+                      Defaults to a pool shared by all PooledHttp objects.
+        timeout: float, socket timeout in seconds for each request. Defaults
+                 to no timeout.
+    """
+
+    def __init__(self, pool_manager=None, timeout=None):
+        if pool_manager is None:
+            pool_manager = _get_pool_manager()
+        self.pool_manager = pool_manager
+        self.timeout = timeout
+
+    def request(self, uri, method='GET', body=None, headers=None,
+                redirections=httplib2.DEFAULT_MAX_REDIRECTS,
+                connection_type=None):
+        """Makes an HTTP request.
+
+        Takes the same arguments as ``httplib2.Http.request()``, except that
+        ``connection_type`` is ignored. Errors raised by urllib3 are not
+        translated, except for too many redirects.
+
+        Returns:
+            A tuple of an ``httplib2.Response`` and the response body as
+            bytes.
+
+        Raises:
+            httplib2.RedirectLimit: if the response is still a redirect
+                                    after ``redirections`` redirects.
+        """
+        if headers is not None:
+            headers = dict((_helpers._from_bytes(key),
+                            _helpers._from_bytes(value))
+                           for key, value in six.iteritems(headers))
+        if self.timeout is None:
+            timeout = urllib3.Timeout.DEFAULT_TIMEOUT
+        else:
+            timeout = self.timeout
+        response = self.pool_manager.urlopen(
+            method, uri, body=body, headers=headers,
+            retries=urllib3.Retry(connect=1, read=False,
+                                  redirect=redirections,
+                                  raise_on_redirect=False),
+            timeout=timeout)
+
+        info = dict((key.lower(), value)
+                    for key, value in six.iteritems(response.headers))
+        info['status'] = str(response.status)
+        resp, content = httplib2.Response(info), response.data
+        if response.get_redirect_location():
+            # urllib3 returns the last redirect once it has followed as many
+            # as allowed, where httplib2 raises.
+            raise httplib2.RedirectLimit(
+                'Redirected more times than redirection_limit allows.',
+                resp, content)
+        return resp, content
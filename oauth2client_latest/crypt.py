@@ -19,6 +19,8 @@ import json
 import logging
 import time
 
+import six
+
 from oauth2client_latest import _helpers
 from oauth2client_latest import _pure_python_crypt
 
@@ -108,14 +110,18 @@ def _verify_signature(message, signature, certs):
     Args:
         message: string or bytes, The message to verify.
         signature: string or bytes, The signature on the message.
-        certs: iterable, certificates in PEM format.
+        certs: iterable, certificates in PEM format or verifiers already
+               created from them.
 
     Raises:
         AppIdentityError: If none of the certificates can verify the message
                           against the signature.
     """
-    for pem in certs:
-        verifier = Verifier.from_string(pem, is_x509_cert=True)
+    for cert in certs:
+        if isinstance(cert, (six.text_type, six.binary_type)):
+            verifier = Verifier.from_string(cert, is_x509_cert=True)
+        else:
+            verifier = cert
         if verifier.verify(message, signature):
             return
 
@@ -123,6 +129,29 @@ def _verify_signature(message, signature, certs):
     raise AppIdentityError('Invalid token signature')
 
 
+def _get_key_id(header):
+    """Gets the key ID from an encoded JWT header.
+
+    Args:
+        header: bytes, The base64url encoded header segment of a JWT.
+
+    Returns:
+        string, The ``'kid'`` field of the header, or None if the header
+        can't be parsed or has no string ``'kid'``.
+    """
+    try:
+        header_dict = json.loads(
+            _helpers._from_bytes(_helpers._urlsafe_b64decode(header)))
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(header_dict, dict):
+        return None
+    key_id = header_dict.get('kid')
+    if not isinstance(key_id, six.string_types):
+        return None
+    return key_id
+
+
 def _check_audience(payload_dict, audience):
     """Checks audience field from a JWT payload.
 
@@ -211,7 +240,8 @@ def verify_signed_jwt_with_certs(jwt, certs, audience=None):
 
     Args:
         jwt: string, A JWT.
-        certs: dict, Dictionary where values of public keys in PEM format.
+        certs: dict, Dictionary where values of public keys in PEM format,
+               or Verifier objects created from them.
         audience: string, The audience, 'aud', that this JWT should contain. If
                   None then the JWT's 'aud' parameter is not verified.
 
@@ -221,13 +251,54 @@ def verify_signed_jwt_with_certs(jwt, certs, audience=None):
     Raises:
         AppIdentityError: if any checks are failed.
     """
+    header, payload, signature = _split_jwt(jwt)
+    return _verify_jwt_segments(header, payload, signature,
+                                _get_key_id(header), certs, audience)
+
+
+def _split_jwt(jwt):
+    """Splits a JWT into its encoded segments.
+
+    Args:
+        jwt: string, A JWT.
+
+    Returns:
+        tuple, the base64url encoded header, payload and signature segments,
+        as bytes.
+
+    Raises:
+        AppIdentityError: if the JWT does not have three segments.
+    """
     jwt = _helpers._to_bytes(jwt)
 
     if jwt.count(b'.') != 2:
         raise AppIdentityError(
             'Wrong number of segments in token: {0}'.format(jwt))
 
-    header, payload, signature = jwt.split(b'.')
+    return tuple(jwt.split(b'.'))
+
+
+def _verify_jwt_segments(header, payload, signature, key_id, certs,
+                         audience):
+    """Verifies a JWT already split by _split_jwt().
+
+    Args:
+        header: bytes, the encoded header segment.
+        payload: bytes, the encoded payload segment.
+        signature: bytes, the encoded signature segment.
+        key_id: string, the key ID from the header, as returned by
+                _get_key_id(), or None.
+        certs: dict, Dictionary where values of public keys in PEM format,
+               or Verifier objects created from them.
+        audience: string, The audience, 'aud', that this JWT should contain. If
+                  None then the JWT's 'aud' parameter is not verified.
+
+    Returns:
+        dict, The deserialized JSON payload in the JWT.
+
+    Raises:
+        AppIdentityError: if any checks are failed.
+    """
     message_to_sign = header + b'.' + payload
     signature = _helpers._urlsafe_b64decode(signature)
 
@@ -238,8 +309,12 @@ def verify_signed_jwt_with_certs(jwt, certs, audience=None):
     except:
         raise AppIdentityError('Can\'t parse token: {0}'.format(payload_bytes))
 
-    # Verify that the signature matches the message.
-    _verify_signature(message_to_sign, signature, certs.values())
+    # Verify that the signature matches the message, only trying the
+    # certificate named in the header when there is one.
+    if key_id in certs:
+        _verify_signature(message_to_sign, signature, [certs[key_id]])
+    else:
+        _verify_signature(message_to_sign, signature, certs.values())
 
     # Verify the issued at and created times in the payload.
     _verify_time_range(payload_dict)
@@ -18,7 +18,10 @@ Utilities for making it easier to work with OAuth 2.0
 credentials.
 """
 
+import logging
 import os
+import stat
+import tempfile
 import threading
 
 from oauth2client_latest import _helpers
@@ -27,13 +30,131 @@ from oauth2client_latest import client
 
 __author__ = 'jcgregorio@google.com (Joe Gregorio)'
 
+logger = logging.getLogger(__name__)
+
+#: The default amount of time, in seconds, to wait for the interprocess lock
+#: before falling back to read-only mode.
+INTERPROCESS_LOCK_DEADLINE = 1
+
+
+def _replace_file(source, destination):
+    """Renames a file over another one, atomically where possible."""
+    if hasattr(os, 'replace'):
+        os.replace(source, destination)
+    elif os.name == 'nt' and os.path.exists(destination):  # pragma: NO COVER
+        # Windows can't rename over an existing file before Python 3.3.
+        os.unlink(destination)
+        os.rename(source, destination)
+    else:  # pragma: NO COVER
+        os.rename(source, destination)
+
+
+def _fsync_directory(directory):
+    """Flushes a rename in a directory to disk, where the OS allows it."""
+    if os.name != 'posix':  # pragma: NO COVER
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _copy_owner(file_stat, filename):
+    """Gives a file the owner and group of another file, if it can.
+
+    Args:
+        file_stat: os.stat_result of the file whose owner to copy.
+        filename: string, the path of the file to change.
+
+    Returns:
+        bool, whether the file has the same owner and group.
+    """
+    new_stat = os.stat(filename)
+    if (new_stat.st_uid, new_stat.st_gid) == (file_stat.st_uid,
+                                              file_stat.st_gid):
+        return True
+    if not hasattr(os, 'chown'):  # pragma: NO COVER
+        return False
+    try:
+        os.chown(filename, file_stat.st_uid, file_stat.st_gid)
+    except OSError:
+        return False
+    return True
+
 
 class Storage(client.Storage):
-    """Store and retrieve a single credential to and from a file."""
+    """Store and retrieve a single credential to and from a file.
+
+    Credentials are written to a temporary file that then replaces the
+    file, so that readers in other processes see either the old or the new
+    credentials, never a partially written file. The new file keeps the
+    mode and owner of the old one. The file is written in place instead if
+    it has other hard links, or if its directory isn't writable or its
+    owner can't be kept.
+
+    By default, the Storage lock is only shared by the threads of a process,
+    so processes using the same file each refresh credentials when they
+    expire. With ``interprocess_lock``, it's also shared with other
+    processes, so that only one of them refreshes and the others read the
+    new access token from the file. This requires the ``fasteners`` package.
+    A process that can't get the lock within ``lock_timeout`` seconds goes
+    ahead without it in read-only mode: it may refresh the credentials as
+    well, but won't write them to the file.
 
-    def __init__(self, filename):
+    Args:
+        filename: string, the path to the file.
+        fsync_interval: float, how to flush writes to disk. By default they
+                        are left to the OS. If 0, every write is flushed
+                        before it returns. Otherwise, writes are flushed in
+                        the background at most once per this many seconds,
+                        so that a crash may lose the writes of the last
+                        interval.
+        interprocess_lock: bool, whether to lock the file against other
+                           processes too, using a ``.lock`` file next to it.
+        lock_timeout: float, the most seconds to wait for the interprocess
+                      lock.
+    """
+
+    def __init__(self, filename, fsync_interval=None,
+                 interprocess_lock=False,
+                 lock_timeout=INTERPROCESS_LOCK_DEADLINE):
         super(Storage, self).__init__(lock=threading.Lock())
         self._filename = filename
+        self._fsync_interval = fsync_interval
+        self._fsync_lock = threading.Lock()
+        self._fsync_timer = None
+        self._process_lock = None
+        if interprocess_lock:
+            import fasteners
+            self._process_lock = fasteners.InterProcessLock(
+                '{0}.lock'.format(filename))
+        self._lock_timeout = lock_timeout
+        self._read_only = False
+
+    def acquire_lock(self):
+        """Acquires the Storage lock, and the interprocess lock if enabled.
+
+        Falls back to read-only mode if the interprocess lock can't be
+        acquired in time.
+        """
+        super(Storage, self).acquire_lock()
+        if self._process_lock is None:
+            return
+        self._read_only = not self._process_lock.acquire(
+            timeout=self._lock_timeout)
+        if self._read_only:
+            logger.warning(
+                'Failed to obtain interprocess lock for %s. If the '
+                'credentials are being refreshed, this process may refresh '
+                'them as well.', self._filename)
+
+    def release_lock(self):
+        """Releases the locks acquired by acquire_lock()."""
+        if self._process_lock is not None and not self._read_only:
+            self._process_lock.release()
+        self._read_only = False
+        super(Storage, self).release_lock()
 
     def locked_get(self):
         """Retrieve Credential from file.
@@ -61,18 +182,30 @@ class Storage(client.Storage):
 
         return credentials
 
-    def _create_file_if_needed(self):
-        """Create an empty file if necessary.
-
-        This method will not initialize the file. Instead it implements a
-        simple version of "touch" to ensure the file has been created.
-        """
-        if not os.path.exists(self._filename):
-            old_umask = os.umask(0o177)
+    def _fsync(self):
+        """Flushes the file and its directory to disk."""
+        with self._fsync_lock:
+            self._fsync_timer = None
+        try:
+            fd = os.open(self._filename, os.O_RDONLY)
             try:
-                open(self._filename, 'a+b').close()
+                os.fsync(fd)
             finally:
-                os.umask(old_umask)
+                os.close(fd)
+            _fsync_directory(os.path.dirname(os.path.abspath(self._filename)))
+        except OSError:
+            logger.warning('Failed to flush %s to disk.', self._filename,
+                           exc_info=True)
+
+    def _schedule_fsync(self):
+        """Flushes the file to disk within fsync_interval seconds."""
+        with self._fsync_lock:
+            if self._fsync_timer is not None:
+                return
+            self._fsync_timer = threading.Timer(self._fsync_interval,
+                                                self._fsync)
+            self._fsync_timer.daemon = True
+            self._fsync_timer.start()
 
     def locked_put(self, credentials):
         """Write Credentials to file.
@@ -83,11 +216,71 @@ class Storage(client.Storage):
         Raises:
             IOError if the file is a symbolic link.
         """
-        self._create_file_if_needed()
-        _helpers.validate_file(self._filename)
-        f = open(self._filename, 'w')
-        f.write(credentials.to_json())
-        f.close()
+        if self._read_only:
+            logger.debug('In read-only mode, not writing credentials.')
+            return
+
+        if os.path.lexists(self._filename):
+            _helpers.validate_file(self._filename)
+            file_stat = os.stat(self._filename)
+        else:
+            file_stat = None
+        content = credentials.to_json()
+        directory = os.path.dirname(os.path.abspath(self._filename))
+
+        # Replacing the file would detach it from its other hard links.
+        if ((file_stat is None or file_stat.st_nlink == 1) and
+                self._replace(content, directory, file_stat)):
+            if self._fsync_interval == 0:
+                _fsync_directory(directory)
+        else:
+            with open(self._filename, 'w') as f:
+                self._write(f, content)
+
+        if self._fsync_interval:
+            self._schedule_fsync()
+
+    def _write(self, f, content):
+        """Writes to a file, flushing it to disk if every write should be."""
+        f.write(content)
+        if self._fsync_interval == 0:
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _replace(self, content, directory, file_stat):
+        """Replaces the file with a new one holding the content.
+
+        Args:
+            content: string, the content of the new file.
+            directory: string, the directory of the file.
+            file_stat: os.stat_result of the file, or None if there is none.
+
+        Returns:
+            bool, False if the file exists but couldn't be replaced because
+            its directory isn't writable or its owner couldn't be kept.
+        """
+        try:
+            # Created readable and writable by the owner only.
+            fd, temp_filename = tempfile.mkstemp(
+                prefix='.{0}.'.format(os.path.basename(self._filename)),
+                suffix='.tmp', dir=directory)
+        except OSError:
+            if file_stat is None:
+                raise
+            return False
+        try:
+            with os.fdopen(fd, 'w') as f:
+                self._write(f, content)
+            if file_stat is not None:
+                if not _copy_owner(file_stat, temp_filename):
+                    os.unlink(temp_filename)
+                    return False
+                os.chmod(temp_filename, stat.S_IMODE(file_stat.st_mode))
+            _replace_file(temp_filename, self._filename)
+        except Exception:
+            os.unlink(temp_filename)
+            raise
+        return True
 
     def locked_delete(self):
         """Delete Credentials file.
@@ -95,4 +288,8 @@ class Storage(client.Storage):
         Args:
             credentials: Credentials, the credentials to store.
         """
+        if self._read_only:
+            logger.debug('In read-only mode, not deleting credentials.')
+            return
+
         os.unlink(self._filename)
@@ -18,7 +18,9 @@ import base64
 import copy
 import datetime
 import json
+import threading
 import time
+import weakref
 
 import oauth2client_latest
 from oauth2client_latest import _helpers
@@ -37,6 +39,16 @@ to .pem format:
     >   openssl pkcs12 -nodes -nocerts -passin pass:notasecret | \
     >   openssl rsa > key.pem
 """
+# Maximum number of audiences _JWTAccessCredentials keep a signed token for.
+_AUDIENCE_TOKENS_MAX_ENTRIES = 100
+# Cached audience tokens expiring within this many seconds are replaced by
+# a newly signed token before they are sent.
+_AUDIENCE_TOKEN_REFRESH_SECS = 300
+
+# Signed tokens of _JWTAccessCredentials keyed by audience. Kept outside of
+# the credentials so that they are never serialized with them.
+_audience_tokens = weakref.WeakKeyDictionary()
+_audience_tokens_lock = threading.Lock()
 
 
 class ServiceAccountCredentials(client.AssertionCredentials):
@@ -92,6 +104,13 @@ class ServiceAccountCredentials(client.AssertionCredentials):
     _private_key_pkcs12 = None
     _private_key_password = None
 
+    # Members in the compact JSON encoding, in order.
+    _COMPACT_MEMBERS = (
+        '_service_account_email', '_scopes', '_private_key_id', 'client_id',
+        '_user_agent', '_kwargs', 'invalid', 'access_token', 'token_uri',
+        'revoke_uri', 'token_expiry', '_private_key_pkcs8_pem', _PKCS12_KEY,
+        '_private_key_password')
+
     def __init__(self,
                  service_account_email,
                  signer,
@@ -419,6 +438,28 @@ class ServiceAccountCredentials(client.AssertionCredentials):
             'client_id': self.client_id,
         }
 
+    def _to_compact(self, strip_token_response):
+        """Lists the values of the credentials for to_compact_json().
+
+        The values are those read by :meth:`from_json`, in the order of
+        ``_COMPACT_MEMBERS``.
+        """
+        to_serialize = dict(
+            (member, getattr(self, member))
+            for member in self._COMPACT_MEMBERS)
+        to_serialize['token_expiry'] = client._parse_expiry(
+            to_serialize['token_expiry'])
+        pkcs12_val = to_serialize[_PKCS12_KEY]
+        if pkcs12_val is not None:
+            to_serialize[_PKCS12_KEY] = base64.b64encode(pkcs12_val).decode(
+                'ascii')
+        return [to_serialize[member] for member in self._COMPACT_MEMBERS]
+
+    @classmethod
+    def _from_compact(cls, values):
+        """Instantiates credentials from the values of _to_compact()."""
+        return cls.from_json(dict(zip(cls._COMPACT_MEMBERS, values)))
+
     @classmethod
     def from_json(cls, json_data):
         """Deserialize a JSON-serialized instance.
@@ -654,6 +695,57 @@ class _JWTAccessCredentials(ServiceAccountCredentials):
     def _refresh(self, http_request):
         self.access_token, self.token_expiry = self._create_token()
 
+    def _get_audience_cache(self):
+        """Gets the cache of signed tokens by audience, creating it if needed.
+
+        Returns:
+            transport.MemoryCache, (token, expiry) tuples keyed by audience.
+        """
+        with _audience_tokens_lock:
+            cache = _audience_tokens.get(self)
+            if cache is None:
+                cache = transport.MemoryCache(
+                    max_entries=_AUDIENCE_TOKENS_MAX_ENTRIES)
+                _audience_tokens[self] = cache
+            return cache
+
+    def _get_audience_token(self, audience):
+        """Gets a signed token with the given audience.
+
+        Tokens are cached per audience and reused until they are about to
+        expire, rather than signing a new one for every request.
+
+        Args:
+            audience: string, the 'aud' claim of the token.
+
+        Returns:
+            string, the signed token.
+        """
+        cache = self._get_audience_cache()
+        cached = cache.get(audience)
+        if cached is not None:
+            token, expiry = cached
+            remaining = expiry - client._UTCNOW()
+            if remaining > datetime.timedelta(
+                    seconds=_AUDIENCE_TOKEN_REFRESH_SECS):
+                return token
+        token, expiry = self._create_token({'aud': audience})
+        cache.set(audience, (token, expiry))
+        return token
+
+    def _invalidate_audience_token(self, audience, token):
+        """Drops a cached audience token, e.g. after it was rejected.
+
+        Args:
+            audience: string, the 'aud' claim of the token.
+            token: string, the rejected token. The cache entry is only
+                   dropped if it still holds this token.
+        """
+        cache = self._get_audience_cache()
+        cached = cache.get(audience)
+        if cached is not None and cached[0] == token:
+            cache.delete(audience)
+
     def _create_token(self, additional_claims=None):
         now = client._UTCNOW()
         lifetime = datetime.timedelta(seconds=self._MAX_TOKEN_LIFETIME_SECS)
@@ -670,3 +762,7 @@ class _JWTAccessCredentials(ServiceAccountCredentials):
         jwt = crypt.make_signed_jwt(self._signer, payload,
                                     key_id=self._private_key_id)
         return jwt.decode('ascii'), expiry
+
+
+client._register_credentials_classes(
+    ServiceAccountCredentials, _JWTAccessCredentials)
@@ -13,6 +13,9 @@
 # limitations under the License.
 
 import logging
+import re
+import threading
+import time
 
 import httplib2
 import six
@@ -27,22 +30,128 @@ _STREAM_PROPERTIES = ('read', 'seek', 'tell')
 
 # Google Data client libraries may need to set this to [401, 403].
 REFRESH_STATUS_CODES = (http_client.UNAUTHORIZED,)
+# Access tokens expiring within this many seconds are refreshed before a
+# request is sent, rather than after the request is rejected.
+EXPIRY_MARGIN_SECS = 10
+# Callable used by get_http_object() instead of httplib2.Http, if set.
+_HTTP_FACTORY = None
+# Arguments of httplib2.Http(), in order, so positional arguments can be
+# passed to a factory by name.
+_HTTPLIB2_ARGS = (
+    'cache', 'timeout', 'proxy_info', 'ca_certs',
+    'disable_ssl_certificate_validation', 'tls_maximum_version',
+    'tls_minimum_version')
+# Keyword arguments of httplib2.Http() which are not passed to a factory.
+_HTTPLIB2_ONLY_KWARGS = frozenset(_HTTPLIB2_ARGS) - frozenset(['timeout'])
+
+
+# Maximum number of responses kept by a MemoryCache by default.
+MEMORY_CACHE_MAX_ENTRIES = 100
+
+_MAX_AGE_RE = re.compile(br'\bmax-age\s*=\s*"?(\d+)', re.IGNORECASE)
+# Fields of the linked list entries kept by MemoryCache.
+_PREV, _NEXT, _KEY, _VALUE, _EXPIRY = range(5)
+
+
+def _cache_max_age(value):
+    """Gets the Cache-Control max-age of a response cached by httplib2.
+
+    Args:
+        value: bytes, the cached response, i.e. the status line, the
+               headers and the body as written by httplib2.
+
+    Returns:
+        int, the max-age in seconds, or None if there is none.
+    """
+    if not isinstance(value, six.binary_type):
+        return None
+    headers = value.split(b'\r\n\r\n', 1)[0]
+    for line in headers.split(b'\r\n'):
+        name, _, field = line.partition(b':')
+        if name.strip().lower() == b'cache-control':
+            match = _MAX_AGE_RE.search(field)
+            if match:
+                return int(match.group(1))
+    return None
 
 
 class MemoryCache(object):
-    """httplib2 Cache implementation which only caches locally."""
+    """httplib2 Cache implementation which only caches locally.
+
+    The cache is thread-safe and bounded: once it holds ``max_entries``
+    responses, the least recently used one is evicted to make room. Responses
+    with a Cache-Control max-age are also dropped once it has passed.
 
-    def __init__(self):
-        self.cache = {}
+    Attributes:
+        hits: int, the number of get() calls that returned a value.
+        misses: int, the number of get() calls that returned None.
+        evictions: int, the number of entries dropped because the cache
+                   was full or because they expired.
+    """
+
+    def __init__(self, max_entries=MEMORY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+        # Circular doubly linked list, least recently used entry first.
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None, None]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _unlink(self, entry):
+        entry[_PREV][_NEXT] = entry[_NEXT]
+        entry[_NEXT][_PREV] = entry[_PREV]
+
+    def _append(self, entry):
+        last = self._root[_PREV]
+        entry[_PREV] = last
+        entry[_NEXT] = self._root
+        last[_NEXT] = entry
+        self._root[_PREV] = entry
 
     def get(self, key):
-        return self.cache.get(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[_EXPIRY] is not None:
+                if entry[_EXPIRY] <= time.time():
+                    self._unlink(entry)
+                    del self._entries[key]
+                    self.evictions += 1
+                    entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._unlink(entry)
+            self._append(entry)
+            self.hits += 1
+            return entry[_VALUE]
 
     def set(self, key, value):
-        self.cache[key] = value
+        max_age = _cache_max_age(value)
+        expiry = None if max_age is None else time.time() + max_age
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._unlink(entry)
+            while self._entries and len(self._entries) >= self.max_entries:
+                oldest = self._root[_NEXT]
+                self._unlink(oldest)
+                del self._entries[oldest[_KEY]]
+                self.evictions += 1
+            entry = [None, None, key, value, expiry]
+            self._append(entry)
+            self._entries[key] = entry
 
     def delete(self, key):
-        self.cache.pop(key, None)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._unlink(entry)
 
 
 def get_cached_http():
@@ -61,6 +170,14 @@ def get_cached_http():
 def get_http_object(*args, **kwargs):
     """Return a new HTTP object.
 
+    The object is created by the factory passed to set_http_factory(),
+    or is an httplib2.Http if no factory has been set.
+
+    The arguments are those of httplib2.Http(). A factory is passed them
+    too, as keyword arguments, except for those that only apply to
+    httplib2, such as ``cache`` or ``ca_certs``, which are dropped with a
+    warning.
+
     Args:
         *args: tuple, The positional arguments to be passed when
                contructing a new HTTP object.
@@ -68,9 +185,53 @@ def get_http_object(*args, **kwargs):
                   contructing a new HTTP object.
 
     Returns:
-        httplib2.Http, an HTTP object.
+        An httplib2.Http, or the object created by the factory, which has a
+        request() method compatible with httplib2.Http.request().
+
+    Raises:
+        TypeError: if a factory is set and more positional arguments are
+                   given than httplib2.Http() takes, or an argument is given
+                   both positionally and by keyword.
     """
-    return httplib2.Http(*args, **kwargs)
+    if _HTTP_FACTORY is None:
+        return httplib2.Http(*args, **kwargs)
+    if len(args) > len(_HTTPLIB2_ARGS):
+        raise TypeError('get_http_object() takes at most {0} positional '
+                        'arguments ({1} given)'.format(len(_HTTPLIB2_ARGS),
+                                                       len(args)))
+    for name, value in zip(_HTTPLIB2_ARGS, args):
+        if name in kwargs:
+            raise TypeError('get_http_object() got multiple values for '
+                            'argument {0!r}'.format(name))
+        kwargs[name] = value
+    dropped = _HTTPLIB2_ONLY_KWARGS.intersection(kwargs)
+    if dropped:
+        _LOGGER.warning('Ignoring httplib2.Http arguments %s, which the '
+                        'HTTP factory does not take.',
+                        ', '.join(sorted(dropped)))
+        kwargs = dict((key, value) for key, value in six.iteritems(kwargs)
+                      if key not in dropped)
+    return _HTTP_FACTORY(**kwargs)
+
+
+def set_http_factory(factory):
+    """Sets the factory used by get_http_object() to create HTTP objects.
+
+    This changes the HTTP object used wherever one is not passed in
+    explicitly, e.g. when refreshing in
+    oauth2client_latest.client.OAuth2Credentials.get_access_token().
+
+    Args:
+        factory: callable, creates an object with a request() method
+                 compatible with httplib2.Http.request(), such as
+                 oauth2client_latest.contrib.urllib3_http.PooledHttp.
+                 It is called with the arguments given to
+                 get_http_object(), all by keyword, less those that only
+                 httplib2.Http() takes. Pass None to go back to using
+                 httplib2.Http.
+    """
+    global _HTTP_FACTORY
+    _HTTP_FACTORY = factory
 
 
 def _initialize_headers(headers):
@@ -134,18 +295,38 @@ def clean_headers(headers):
     return clean
 
 
+def _token_needs_refresh(credentials):
+    """Checks if credentials should be refreshed before making a request.
+
+    Args:
+        credentials: Credentials, the credentials used to identify
+                     the authenticated user.
+
+    Returns:
+        bool, True if the access token is missing, expired or invalid, or if
+        it will expire within ``EXPIRY_MARGIN_SECS``.
+    """
+    if not credentials.access_token or credentials.access_token_expired:
+        return True
+    expires_in = credentials._expires_in()
+    return expires_in is not None and expires_in < EXPIRY_MARGIN_SECS
+
+
 def wrap_http_for_auth(credentials, http):
     """Prepares an HTTP object's request method for auth.
 
-    Wraps HTTP requests with logic to catch auth failures (typically
-    identified via a 401 status code). In the event of failure, tries
-    to refresh the token used and then retry the original request.
+    Wraps HTTP requests with logic to refresh missing or expiring tokens
+    before sending and to catch auth failures (typically identified via a
+    401 status code), such as tokens revoked on the server. In the event of
+    failure, tries to refresh the token used and then retry the original
+    request.
 
     Args:
         credentials: Credentials, the credentials used to identify
                      the authenticated user.
         http: httplib2.Http, an http object to be used to make
-              auth requests.
+              auth requests. Any object with a compatible request()
+              method can be used instead.
     """
     orig_request_method = http.request
 
@@ -156,11 +337,19 @@ def wrap_http_for_auth(credentials, http):
         if not credentials.access_token:
             _LOGGER.info('Attempting refresh to obtain '
                          'initial access_token')
-            credentials._refresh(orig_request_method)
+            credentials._refresh_if(
+                orig_request_method,
+                lambda: _token_needs_refresh(credentials))
+        elif _token_needs_refresh(credentials):
+            _LOGGER.info('Refreshing access_token before it expires')
+            credentials._refresh_if(
+                orig_request_method,
+                lambda: _token_needs_refresh(credentials))
 
         # Clone and modify the request headers to add the appropriate
         # Authorization header.
         headers = _initialize_headers(headers)
+        sent_token = credentials.access_token
         credentials.apply(headers)
         _apply_user_agent(headers, credentials.user_agent)
 
@@ -183,7 +372,12 @@ def wrap_http_for_auth(credentials, http):
             _LOGGER.info('Refreshing due to a %s (attempt %s/%s)',
                          resp.status, refresh_attempt + 1,
                          max_refresh_attempts)
-            credentials._refresh(orig_request_method)
+            # Another thread may already have refreshed the token this
+            # request was rejected with; if so, just retry with the new one.
+            credentials._refresh_if(
+                orig_request_method,
+                lambda: credentials.access_token == sent_token)
+            sent_token = credentials.access_token
             credentials.apply(headers)
             if body_stream_position is not None:
                 body.seek(body_stream_position)
@@ -232,17 +426,22 @@ def wrap_http_for_jwt_access(credentials, http):
                                                 headers, redirections,
                                                 connection_type)
         else:
-            # If we don't have an 'aud' (audience) claim,
-            # create a 1-time token with the uri root as the audience
+            # If we don't have an 'aud' (audience) claim, use a token with
+            # the uri root as the audience, signed once and reused until it
+            # is about to expire.
             headers = _initialize_headers(headers)
             _apply_user_agent(headers, credentials.user_agent)
             uri_root = uri.split('?', 1)[0]
-            token, unused_expiry = credentials._create_token({'aud': uri_root})
+            token = credentials._get_audience_token(uri_root)
 
             headers['Authorization'] = 'Bearer ' + token
-            return orig_request_method(uri, method, body,
-                                       clean_headers(headers),
-                                       redirections, connection_type)
+            resp, content = orig_request_method(uri, method, body,
+                                                clean_headers(headers),
+                                                redirections, connection_type)
+            if resp.status in REFRESH_STATUS_CODES:
+                # Don't reuse a token the server has rejected.
+                credentials._invalidate_audience_token(uri_root, token)
+            return resp, content
 
     # Replace the request method with our own closure.
     http.request = new_request
@@ -0,0 +1,100 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Times credentials serialization round trips.
+
+Compares to_json() with to_compact_json(), with and without the token
+response, each read back with Credentials.new_from_json(). The service
+account credentials are signed with the key in tests/data. Run from the
+repository root:
+
+    $ python scripts/benchmark_credentials_serialization.py \\
+        [--round-trips 10000]
+"""
+
+import argparse
+import datetime
+import time
+
+from oauth2client_latest import client
+from oauth2client_latest import crypt
+from oauth2client_latest import service_account
+
+
+_PRIVATE_KEY_FILE = 'tests/data/privatekey.pem'
+
+
+def _oauth2_credentials():
+    token_response = {
+        'access_token': 'access_token',
+        'expires_in': 3600,
+        'id_token': 'header.' + 'payload' * 100 + '.signature',
+        'refresh_token': 'refresh_token',
+        'token_type': 'Bearer',
+    }
+    return client.OAuth2Credentials(
+        'access_token', 'client_id', 'client_secret', 'refresh_token',
+        datetime.datetime.utcnow() + datetime.timedelta(hours=1),
+        'https://example.com/token', 'user_agent',
+        revoke_uri='https://example.com/revoke',
+        id_token={'sub': '123', 'email': 'user@example.com'},
+        token_response=token_response,
+        scopes=['email', 'profile'])
+
+
+def _service_account_credentials():
+    with open(_PRIVATE_KEY_FILE, 'rb') as key_file:
+        private_key = key_file.read()
+    credentials = service_account.ServiceAccountCredentials(
+        'service@example.com', crypt.Signer.from_string(private_key),
+        scopes=['email'], private_key_id='key_id', client_id='client_id')
+    credentials._private_key_pkcs8_pem = private_key.decode('ascii')
+    return credentials
+
+
+def _time(credentials, to_json, round_trips):
+    serialized = to_json(credentials)
+    start = time.time()
+    for _ in range(round_trips):
+        client.Credentials.new_from_json(to_json(credentials))
+    elapsed = time.time() - start
+    return round_trips / elapsed, len(serialized)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--round-trips', type=int, default=10000)
+    args = parser.parse_args()
+
+    encodings = (
+        ('to_json', lambda credentials: credentials.to_json()),
+        ('compact', lambda credentials: credentials.to_compact_json()),
+        ('stripped', lambda credentials: credentials.to_compact_json(
+            strip_token_response=True)),
+    )
+    print('{0:<16} {1:<9} {2:>14} {3:>7}'.format(
+        'credentials', 'encoding', 'round trips/s', 'bytes'))
+    for name, credentials, round_trips in (
+            ('oauth2', _oauth2_credentials(), args.round_trips),
+            # Loading the private key dominates, so fewer are enough.
+            ('service_account', _service_account_credentials(),
+             max(1, args.round_trips // 10))):
+        for encoding, to_json in encodings:
+            rate, size = _time(credentials, to_json, round_trips)
+            print('{0:<16} {1:<9} {2:>14.0f} {3:>7}'.format(
+                name, encoding, rate, size))
+
+
+if __name__ == '__main__':
+    main()
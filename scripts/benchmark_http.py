@@ -0,0 +1,114 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compares httplib2 with the pooled urllib3 HTTP object under threads.
+
+Every thread sends authorized requests to a local keep-alive HTTP server.
+Run from the repository root:
+
+    $ python scripts/benchmark_http.py [--threads 32] [--requests 200]
+"""
+
+import argparse
+import datetime
+import threading
+import time
+
+import httplib2
+from six.moves import BaseHTTPServer
+from six.moves import socketserver
+
+from oauth2client_latest import client
+from oauth2client_latest.contrib import urllib3_http
+
+
+class _Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _make_credentials():
+    return client.OAuth2Credentials(
+        'access_token', 'client_id', 'client_secret', 'refresh_token',
+        datetime.datetime.utcnow() + datetime.timedelta(hours=1),
+        'http://localhost/token', None)
+
+
+def _run(name, make_http, scope, url, num_threads, num_requests):
+    """Times the requests, with an HTTP object per request, thread or run."""
+    credentials = _make_credentials()
+    shared_http = credentials.authorize(make_http())
+
+    def worker():
+        http = credentials.authorize(make_http())
+        for _ in range(num_requests):
+            if scope == 'request':
+                http = credentials.authorize(make_http())
+            elif scope == 'run':
+                http = shared_http
+            resp, unused_content = http.request(url)
+            assert resp.status == 200
+
+    threads = [threading.Thread(target=worker) for _ in range(num_threads)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    total = num_threads * num_requests
+    print('{0:<36} {1:>8.0f} req/s'.format(name, total / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=200,
+                        help='requests per thread')
+    args = parser.parse_args()
+
+    server = _Server(('localhost', 0), _Handler)
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+    url = 'http://localhost:{0}/'.format(server.server_address[1])
+    urllib3_http.POOL_MAXSIZE = args.threads
+
+    print('{0} threads x {1} requests'.format(args.threads, args.requests))
+    _run('httplib2.Http per request', httplib2.Http, 'request', url,
+         args.threads, args.requests)
+    _run('httplib2.Http per thread', httplib2.Http, 'thread', url,
+         args.threads, args.requests)
+    _run('PooledHttp shared by all threads', urllib3_http.PooledHttp, 'run',
+         url, args.threads, args.requests)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Counts the JWT signatures made for requests without an 'aud' claim.
+
+Compares signing a token for every request, as wrap_http_for_jwt_access()
+used to, with the per-audience token cache. No requests leave the process.
+Run from the repository root:
+
+    $ python scripts/benchmark_jwt_access.py [--requests 10000]
+"""
+
+import argparse
+import os
+import time
+
+from oauth2client_latest import crypt
+from oauth2client_latest import service_account
+
+
+_PRIVATE_KEY = os.path.join(
+    os.path.dirname(__file__), '..', 'tests', 'data', 'privatekey.pem')
+_URIS = (
+    'https://pubsub.googleapis.com/v1/projects/p/topics',
+    'https://storage.googleapis.com/storage/v1/b',
+)
+
+
+class _CountingSigner(object):
+
+    def __init__(self, signer):
+        self._signer = signer
+        self.signatures = 0
+
+    def sign(self, message):
+        self.signatures += 1
+        return self._signer.sign(message)
+
+
+class _Http(object):
+
+    def request(self, uri, method='GET', body=None, headers=None,
+                redirections=None, connection_type=None):
+        return _Response(), b''
+
+
+class _Response(dict):
+    status = 200
+
+
+def _make_credentials():
+    with open(_PRIVATE_KEY, 'rb') as file_obj:
+        signer = _CountingSigner(crypt.Signer.from_string(file_obj.read()))
+    credentials = service_account._JWTAccessCredentials(
+        'benchmark@example.com', signer, private_key_id='key')
+    return credentials, signer
+
+
+def _report(name, signer, num_requests, elapsed):
+    print('{0:<22} {1:>6} signatures {2:>8.0f} req/s'.format(
+        name, signer.signatures, num_requests / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=10000)
+    args = parser.parse_args()
+    print('{0} requests to {1} audiences'.format(args.requests, len(_URIS)))
+
+    credentials, signer = _make_credentials()
+    start = time.time()
+    for i in range(args.requests):
+        # What every request used to do.
+        credentials._create_token({'aud': _URIS[i % len(_URIS)]})
+    _report('Signed per request', signer, args.requests, time.time() - start)
+
+    credentials, signer = _make_credentials()
+    http = credentials.authorize(_Http())
+    start = time.time()
+    for i in range(args.requests):
+        http.request(_URIS[i % len(_URIS)])
+    _report('Cached per audience', signer, args.requests,
+            time.time() - start)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Times MultiprocessFileStorage.get() as the number of stored keys grows.
+
+Compares re-reading the whole credentials file on every get(), as the
+storage used to, with skipping the read while the file is unchanged.
+Run from the repository root:
+
+    $ python scripts/benchmark_multiprocess_file_storage.py [--gets 1000]
+"""
+
+import argparse
+import datetime
+import os
+import shutil
+import tempfile
+import time
+
+from oauth2client_latest import client
+from oauth2client_latest.contrib import multiprocess_file_storage
+
+
+_NUM_KEYS = (1, 10, 100, 1000)
+
+
+def _make_credentials():
+    return client.OAuth2Credentials(
+        'access_token', 'client_id', 'client_secret', 'refresh_token',
+        datetime.datetime.utcnow() + datetime.timedelta(hours=1),
+        'https://example.com/token', 'user_agent')
+
+
+def _fill(filename, num_keys):
+    credentials = dict(
+        (str(i), _make_credentials()) for i in range(num_keys))
+    with open(filename, 'w') as credentials_file:
+        multiprocess_file_storage._write_credentials_file(
+            credentials_file, credentials)
+
+
+def _time_gets(filename, num_gets, reload_every_time):
+    store = multiprocess_file_storage.MultiprocessFileStorage(filename, '0')
+    backend = store._backend
+    store.get()
+    start = time.time()
+    for _ in range(num_gets):
+        if reload_every_time:
+            backend._file_stamp = None
+        store.get()
+    return (time.time() - start) / num_gets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--gets', type=int, default=1000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        print('{0:>6} {1:>14} {2:>14}'.format(
+            'keys', 'reload (us)', 'unchanged (us)'))
+        for num_keys in _NUM_KEYS:
+            filename = os.path.join(directory, str(num_keys))
+            _fill(filename, num_keys)
+            reload_secs = _time_gets(filename, args.gets, True)
+            unchanged_secs = _time_gets(filename, args.gets, False)
+            print('{0:>6} {1:>14.1f} {2:>14.1f}'.format(
+                num_keys, reload_secs * 1e6, unchanged_secs * 1e6))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
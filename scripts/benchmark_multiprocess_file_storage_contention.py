@@ -0,0 +1,115 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Times MultiprocessFileStorage reads from many processes and threads.
+
+Every thread of every process reads valid credentials from the same file,
+either taking the storage lock exclusively, as get() used to, or shared.
+Run from the repository root:
+
+    $ python scripts/benchmark_multiprocess_file_storage_contention.py \\
+        [--processes 4] [--threads 4] [--gets 500]
+"""
+
+import argparse
+import datetime
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from oauth2client_latest import client
+from oauth2client_latest.contrib import multiprocess_file_storage
+
+
+def _make_credentials():
+    return client.OAuth2Credentials(
+        'access_token', 'client_id', 'client_secret', 'refresh_token',
+        datetime.datetime.utcnow() + datetime.timedelta(hours=1),
+        'https://example.com/token', 'user_agent')
+
+
+def _exclusive_get(store):
+    return client.Storage.get(store)
+
+
+def _shared_get(store):
+    return store.get()
+
+
+def _process(filename, get, num_threads, num_gets, ready, start):
+    store = multiprocess_file_storage.MultiprocessFileStorage(filename, 'key')
+    get(store)
+
+    def worker():
+        for _ in range(num_gets):
+            assert get(store) is not None
+
+    threads = [threading.Thread(target=worker) for _ in range(num_threads)]
+    ready.release()
+    start.wait()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def _run(name, filename, get, args):
+    ready = multiprocessing.Semaphore(0)
+    start = multiprocessing.Event()
+    processes = [
+        multiprocessing.Process(target=_process, args=(
+            filename, get, args.threads, args.gets, ready, start))
+        for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        ready.acquire()
+
+    start_time = time.time()
+    start.set()
+    for process in processes:
+        process.join()
+    elapsed = time.time() - start_time
+    total = args.processes * args.threads * args.gets
+    print('{0:<10} {1:>8.0f} gets/s'.format(name, total / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4,
+                        help='threads per process')
+    parser.add_argument('--gets', type=int, default=500,
+                        help='gets per thread')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, 'credentials')
+        multiprocess_file_storage.MultiprocessFileStorage(
+            filename, 'key').put(_make_credentials())
+
+        print('{0} processes x {1} threads x {2} gets'.format(
+            args.processes, args.threads, args.gets))
+        _run('Exclusive', filename, _exclusive_get, args)
+        _run('Shared', filename, _shared_get, args)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
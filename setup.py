@@ -23,6 +23,7 @@ import sys
 
 from setuptools import find_packages
 from setuptools import setup
+from setuptools.command.build_py import build_py
 
 import oauth2client_latest
 
@@ -41,6 +42,24 @@ install_requires = [
     'six>=1.6.1',
 ]
 
+# Modules using syntax that older Pythons can't compile.
+PY35_MODULES = (
+    ('oauth2client_latest.contrib', 'asyncio_util'),
+)
+
+
+class BuildPy(build_py):
+    """Leaves out the modules that need a newer Python than this one."""
+
+    def find_package_modules(self, package, package_dir):
+        modules = build_py.find_package_modules(self, package, package_dir)
+        if sys.version_info >= (3, 5):
+            return modules
+        return [(module_package, module, filename)
+                for module_package, module, filename in modules
+                if (module_package, module) not in PY35_MODULES]
+
+
 long_desc = """The oauth2client_latest is a client library for OAuth 2.0."""
 
 version = oauth2client_latest.__version__
@@ -54,6 +73,7 @@ setup(
     url="http://github.com/google/oauth2client_latest/",
     install_requires=install_requires,
     packages=find_packages(),
+    cmdclass={'build_py': BuildPy},
     license="Apache 2.0",
     keywords="google oauth 2.0 http client",
     classifiers=[
@@ -0,0 +1,163 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-process asyncio HTTP server and client used by the asyncio tests.
+
+Requires Python 3.5 or newer.
+"""
+
+import asyncio
+
+from six.moves import urllib
+
+
+class StubServer(object):
+    """Minimal HTTP/1.1 server answering from a table of canned responses.
+
+    Every request is recorded in ``requests`` as a dictionary with the
+    ``method``, ``path``, ``query``, ``headers`` and ``body``.
+
+    Args:
+        responses: dict, maps a path to a ``(status, headers, body)`` tuple,
+                   or to a callable taking the recorded request and returning
+                   such a tuple, or a coroutine resolving to one.
+    """
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+        self._server = None
+
+    @property
+    def port(self):
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self):
+        self._server = await asyncio.start_server(
+            self._handle, 'localhost', 0)
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        request_line = await reader.readline()
+        method, target, unused_version = request_line.decode(
+            'ascii').split(' ', 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, value = line.decode('latin-1').split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+        parts = urllib.parse.urlsplit(target)
+        request = {
+            'method': method,
+            'path': parts.path,
+            'query': dict(urllib.parse.parse_qsl(parts.query)),
+            'headers': headers,
+            'body': body,
+        }
+        self.requests.append(request)
+
+        response = self.responses.get(parts.path, (404, {}, b''))
+        if callable(response):
+            response = response(request)
+            if asyncio.iscoroutine(response):
+                response = await response
+        status, response_headers, content = response
+
+        writer.write('HTTP/1.1 {0} Stub\r\n'.format(status).encode('ascii'))
+        response_headers = dict(response_headers)
+        response_headers['content-length'] = str(len(content))
+        response_headers['connection'] = 'close'
+        for name, value in response_headers.items():
+            writer.write('{0}: {1}\r\n'.format(name, value).encode('latin-1'))
+        writer.write(b'\r\n' + content)
+        await writer.drain()
+        writer.close()
+
+
+def make_request(server):
+    """Creates an async request callable that sends everything to ``server``.
+
+    The scheme and host of the requested URI are ignored, so that any URI,
+    including the metadata server's, can be served by the stub.
+    """
+    async def request(uri, method='GET', body=None, headers=None):
+        parts = urllib.parse.urlsplit(uri)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        body = body or b''
+
+        reader, writer = await asyncio.open_connection(
+            'localhost', server.port)
+        lines = ['{0} {1} HTTP/1.1'.format(method, target),
+                 'host: localhost',
+                 'content-length: {0}'.format(len(body))]
+        for name, value in (headers or {}).items():
+            lines.append('{0}: {1}'.format(name, value))
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        writer.write(body)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        status = int(status_line.split(b' ')[1])
+        response_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, value = line.decode('latin-1').split(':', 1)
+            response_headers[name.strip().lower()] = value.strip()
+        content = await reader.read()
+        writer.close()
+        return status, response_headers, content
+
+    return request
+
+
+class _FakeAiohttpResponse(object):
+
+    def __init__(self, status, headers, content):
+        self.status = status
+        self.headers = headers
+        self._content = content
+
+    async def read(self):
+        return self._content
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *unused_exc_info):
+        return False
+
+
+class FakeAiohttpSession(object):
+    """Stand-in for ``aiohttp.ClientSession`` returning a canned response."""
+
+    def __init__(self, status, headers, content):
+        self._response = _FakeAiohttpResponse(status, headers, content)
+        self.requests = []
+
+    def request(self, method, url, **kwargs):
+        self.requests.append((method, url, kwargs))
+        return self._response
@@ -15,12 +15,17 @@
 """Tests for the DjangoORM storage class."""
 
 # Mock a Django environment
+import contextlib
 import datetime
 
-from django.db import models
+from django.contrib.auth.models import User
+from django.db import connection, models
 import mock
 import unittest2
 
+from tests.contrib.django_util import TestWithDjangoEnvironment
+from tests.contrib.django_util.models import CredentialsModel
+
 from oauth2client_latest import GOOGLE_TOKEN_URI
 from oauth2client_latest.client import OAuth2Credentials
 from oauth2client_latest.contrib.django_util.models import CredentialsField
@@ -28,6 +33,31 @@ from oauth2client_latest.contrib.django_util.storage import (
     DjangoORMStorage as Storage)
 
 
+def _objects_mock(entity):
+    """Mocks a model manager whose query finds ``entity``."""
+    object_mock = mock.Mock()
+    object_mock.filter.return_value.only.return_value.first.return_value = (
+        entity)
+    return object_mock
+
+
+@contextlib.contextmanager
+def _count_queries():
+    """Records the queries run on the default database.
+
+    ``TestCase.assertNumQueries`` cannot be used here, as other tests swap
+    out the Django settings it reconnects signals with.
+    """
+    queries = []
+    connection.force_debug_cursor = True
+    connection.queries_log.clear()
+    try:
+        yield queries
+    finally:
+        connection.force_debug_cursor = False
+        queries.extend(connection.queries_log)
+
+
 class TestStorage(unittest2.TestCase):
     def setUp(self):
         access_token = 'foo'
@@ -58,12 +88,7 @@ class TestStorage(unittest2.TestCase):
     @mock.patch('django.db.models')
     def test_locked_get(self, djangoModel):
         fake_model_with_credentials = FakeCredentialsModelMock()
-        entities = [
-            fake_model_with_credentials
-        ]
-        filter_mock = mock.Mock(return_value=entities)
-        object_mock = mock.Mock()
-        object_mock.filter = filter_mock
+        object_mock = _objects_mock(fake_model_with_credentials)
         FakeCredentialsModelMock.objects = object_mock
 
         storage = Storage(FakeCredentialsModelMock, self.key_name,
@@ -71,13 +96,14 @@ class TestStorage(unittest2.TestCase):
         credential = storage.locked_get()
         self.assertEqual(
             credential, fake_model_with_credentials.credentials)
+        object_mock.filter.assert_called_once_with(
+            **{self.key_name: self.key_value})
+        object_mock.filter.return_value.only.assert_called_once_with(
+            self.property_name)
 
     @mock.patch('django.db.models')
     def test_locked_get_no_entities(self, djangoModel):
-        entities = []
-        filter_mock = mock.Mock(return_value=entities)
-        object_mock = mock.Mock()
-        object_mock.filter = filter_mock
+        object_mock = _objects_mock(None)
         FakeCredentialsModelMock.objects = object_mock
 
         storage = Storage(FakeCredentialsModelMock, self.key_name,
@@ -88,12 +114,7 @@ class TestStorage(unittest2.TestCase):
     @mock.patch('django.db.models')
     def test_locked_get_no_set_store(self, djangoModel):
         fake_model_with_credentials = FakeCredentialsModelMockNoSet()
-        entities = [
-            fake_model_with_credentials
-        ]
-        filter_mock = mock.Mock(return_value=entities)
-        object_mock = mock.Mock()
-        object_mock.filter = filter_mock
+        object_mock = _objects_mock(fake_model_with_credentials)
         FakeCredentialsModelMockNoSet.objects = object_mock
 
         storage = Storage(FakeCredentialsModelMockNoSet, self.key_name,
@@ -134,6 +155,80 @@ class TestStorage(unittest2.TestCase):
         self.assertTrue(fake_entities.deleted)
 
 
+class TestStorageWithDatabase(TestWithDjangoEnvironment):
+
+    def setUp(self):
+        super(TestStorageWithDatabase, self).setUp()
+        self.users = [
+            User.objects.create_user(
+                username='user{0}'.format(i), password='hunter2')
+            for i in range(3)]
+
+    def _credentials(self, access_token):
+        return OAuth2Credentials(
+            access_token, 'client_id', 'client_secret', 'refresh_token',
+            None, GOOGLE_TOKEN_URI, 'user_agent')
+
+    def _storage(self, user):
+        return Storage(CredentialsModel, 'user_id', user, 'credentials')
+
+    def test_get_single_query(self):
+        self._storage(self.users[0]).put(self._credentials('token'))
+
+        storage = self._storage(self.users[0])
+        with _count_queries() as queries:
+            credentials = storage.get()
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(credentials.access_token, 'token')
+        self.assertIs(credentials.store, storage)
+
+        # Writes made elsewhere are seen by the next get().
+        self._storage(self.users[0]).put(self._credentials('new_token'))
+        self.assertEqual(storage.get().access_token, 'new_token')
+        self._storage(self.users[0]).delete()
+        self.assertIsNone(storage.get())
+
+    def test_get_many(self):
+        self._storage(self.users[0]).put(self._credentials('token0'))
+        self._storage(self.users[2]).put(self._credentials('token2'))
+
+        with _count_queries() as queries:
+            results = Storage.get_many(
+                CredentialsModel, 'user_id', self.users, 'credentials')
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(set(results), set([self.users[0], self.users[2]]))
+        self.assertEqual(results[self.users[2]].access_token, 'token2')
+        store = results[self.users[0]].store
+        self.assertEqual(store.key_value, self.users[0])
+        self.assertEqual(store.get().access_token, 'token0')
+
+        self.assertEqual(
+            Storage.get_many(CredentialsModel, 'user_id', [], 'credentials'),
+            {})
+
+    def test_put_many(self):
+        self._storage(self.users[0]).put(self._credentials('old0'))
+        self._storage(self.users[1]).put(self._credentials('old1'))
+
+        with _count_queries() as queries:
+            Storage.put_many(CredentialsModel, 'user_id', {
+                self.users[0]: self._credentials('token0'),
+                self.users[1]: self._credentials('token1'),
+                self.users[2]: self._credentials('token2'),
+            }, 'credentials')
+
+        statements = [query['sql'].split()[0] for query in queries]
+        self.assertEqual(statements.count('UPDATE'), 1)
+        self.assertEqual(statements.count('INSERT'), 1)
+        results = Storage.get_many(
+            CredentialsModel, 'user_id', self.users, 'credentials')
+        self.assertEqual(
+            dict((user.username, credentials.access_token)
+                 for user, credentials in results.items()),
+            {'user0': 'token0', 'user1': 'token1', 'user2': 'token2'})
+        self.assertEqual(CredentialsModel.objects.count(), 3)
+
+
 class CredentialWithSetStore(CredentialsField):
     def __init__(self):
         self.model = CredentialWithSetStore
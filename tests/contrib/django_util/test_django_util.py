@@ -18,13 +18,15 @@ import copy
 
 import django.conf
 from django.conf.urls import include, url
-from django.contrib.auth.models import AnonymousUser
+from django.contrib.auth.models import AnonymousUser, User
 from django.core import exceptions
 import mock
 from six.moves import reload_module
 from tests.contrib.django_util import TestWithDjangoEnvironment
+from tests.contrib.django_util.models import CredentialsModel
 import unittest2
 
+from oauth2client_latest import client
 from oauth2client_latest.contrib import django_util
 import oauth2client_latest.contrib.django_util
 from oauth2client_latest.contrib.django_util import (
@@ -114,6 +116,7 @@ class OAuth2SetupTest(unittest2.TestCase):
                          STORAGE_MODEL['user_property'])
         self.assertEqual(oauth2_settings.storage_model_credentials_property,
                          STORAGE_MODEL['credentials_property'])
+        self.assertIs(oauth2_settings.storage_model_class, CredentialsModel)
 
 
 class MockObjectWithSession(object):
@@ -144,6 +147,30 @@ class SessionStorageTest(TestWithDjangoEnvironment):
         django_storage = get_storage(request)
         django_storage.delete()
 
+    def test_credentials_loaded_once_per_request(self):
+        self.session[_CREDENTIALS_KEY] = _make_credentials('token').to_json()
+        request = self.factory.get('/test')
+        request.session = self.session
+
+        with mock.patch.object(client.OAuth2Credentials, 'from_json',
+                               wraps=client.OAuth2Credentials.from_json) as (
+                from_json):
+            oauth2 = UserOAuth2(request)
+            self.assertTrue(oauth2.has_credentials())
+            self.assertEqual(oauth2.scopes, set(_SCOPES))
+            self.assertEqual(oauth2.credentials.access_token, 'token')
+            self.assertIsNotNone(oauth2.http)
+        self.assertEqual(from_json.call_count, 1)
+
+
+_SCOPES = ['https://www.googleapis.com/auth/cloud-platform']
+
+
+def _make_credentials(access_token):
+    return client.OAuth2Credentials(
+        access_token, 'client_id', 'client_secret', 'refresh_token', None,
+        'https://example.com/token', 'user_agent', scopes=_SCOPES)
+
 
 class TestUserOAuth2Object(TestWithDjangoEnvironment):
 
@@ -170,3 +197,38 @@ class TestUserOAuth2Object(TestWithDjangoEnvironment):
         request.user = AnonymousUser()
         oauth2 = UserOAuth2(request)
         self.assertIsNone(oauth2.credentials)
+
+    def test_credentials_loaded_once_per_request(self):
+        user = User.objects.create_user(
+            username='bill', email='bill@example.com', password='hunter2')
+        CredentialsModel.objects.create(
+            user_id=user, credentials=_make_credentials('token'))
+        request = self.factory.get('/test')
+        request.session = self.session
+        request.user = user
+
+        locked_get = django_util.storage.DjangoORMStorage.locked_get
+        with mock.patch.object(django_util.storage.DjangoORMStorage,
+                               'locked_get', autospec=True,
+                               side_effect=locked_get) as reads:
+            oauth2 = UserOAuth2(request)
+            self.assertTrue(oauth2.has_credentials())
+            self.assertEqual(oauth2.scopes, set(_SCOPES))
+            self.assertIsNotNone(oauth2.http)
+            credentials = oauth2.credentials
+            self.assertEqual(reads.call_count, 1)
+
+            # Credentials written for the request replace the loaded ones.
+            new_credentials = _make_credentials('new_token')
+            credentials.store.put(new_credentials)
+            self.assertIs(UserOAuth2(request).credentials, new_credentials)
+            self.assertEqual(reads.call_count, 1)
+
+            # Loading them again for another user.
+            request.user = User.objects.create_user(
+                username='ted', email='ted@example.com', password='hunter2')
+            self.assertIsNone(oauth2.credentials)
+            self.assertEqual(reads.call_count, 2)
+
+        stored = CredentialsModel.objects.get(user_id=user).credentials
+        self.assertEqual(stored.access_token, 'new_token')
@@ -152,8 +152,8 @@ class Oauth2CallbackTest(TestWithDjangoEnvironment):
         self.user = User.objects.create_user(
             username='bill', email='bill@example.com', password='hunter2')
 
-    @mock.patch('oauth2client_latest.contrib.django_util.views.pickle')
-    def test_callback_works(self, pickle):
+    @mock.patch.object(OAuth2WebServerFlow, 'step2_exchange')
+    def test_callback_works(self, step2_exchange):
         request = self.factory.get('oauth2/oauth2callback', data={
             'state': json.dumps(self.fake_state),
             'code': 123
@@ -161,17 +161,9 @@ class Oauth2CallbackTest(TestWithDjangoEnvironment):
 
         self.session['google_oauth2_csrf_token'] = self.CSRF_TOKEN
 
-        flow = OAuth2WebServerFlow(
-            client_id='clientid',
-            client_secret='clientsecret',
-            scope=['email'],
-            state=json.dumps(self.fake_state),
-            redirect_uri=request.build_absolute_uri("oauth2/oauth2callback"))
-
         name = 'google_oauth2_flow_{0}'.format(self.CSRF_TOKEN)
-        self.session[name] = pickle.dumps(flow)
-        flow.step2_exchange = mock.Mock()
-        pickle.loads.return_value = flow
+        self.session[name] = json.dumps({'scope': 'email'})
+        step2_exchange.return_value = mock.Mock()
 
         request.session = self.session
         request.user = self.user
@@ -180,9 +172,10 @@ class Oauth2CallbackTest(TestWithDjangoEnvironment):
         self.assertEqual(
             response.status_code, django.http.HttpResponseRedirect.status_code)
         self.assertEqual(response['Location'], self.RETURN_URL)
+        step2_exchange.assert_called_once_with('123')
 
-    @mock.patch('oauth2client_latest.contrib.django_util.views.pickle')
-    def test_callback_handles_bad_flow_exchange(self, pickle):
+    @mock.patch.object(OAuth2WebServerFlow, 'step2_exchange')
+    def test_callback_handles_bad_flow_exchange(self, step2_exchange):
         request = self.factory.get('oauth2/oauth2callback', data={
             "state": json.dumps(self.fake_state),
             "code": 123
@@ -190,21 +183,10 @@ class Oauth2CallbackTest(TestWithDjangoEnvironment):
 
         self.session['google_oauth2_csrf_token'] = self.CSRF_TOKEN
 
-        flow = OAuth2WebServerFlow(
-            client_id='clientid',
-            client_secret='clientsecret',
-            scope=['email'],
-            state=json.dumps(self.fake_state),
-            redirect_uri=request.build_absolute_uri('oauth2/oauth2callback'))
-
         self.session['google_oauth2_flow_{0}'.format(self.CSRF_TOKEN)] \
-            = pickle.dumps(flow)
-
-        def local_throws(code):
-            raise FlowExchangeError('test')
+            = json.dumps({'scope': 'email'})
 
-        flow.step2_exchange = local_throws
-        pickle.loads.return_value = flow
+        step2_exchange.side_effect = FlowExchangeError('test')
 
         request.session = self.session
         response = views.oauth2_callback(request)
@@ -261,6 +243,28 @@ class Oauth2CallbackTest(TestWithDjangoEnvironment):
         self.assertIsInstance(response, http.HttpResponseBadRequest)
         self.assertEqual(response.content, b'Invalid CSRF token.')
 
+    def test_get_flow_for_token(self):
+        request = self.factory.get('oauth2/oauth2callback', data={
+            'state': json.dumps(self.fake_state),
+            'code': 123
+        })
+        request.session = self.session
+        flow = views._make_flow(request, ['email', 'profile'], '/return')
+        csrf_token = self.session['google_oauth2_csrf_token']
+        flow_state = self.session['google_oauth2_flow_{0}'.format(csrf_token)]
+        self.assertLess(len(flow_state), 100)
+
+        rebuilt = views._get_flow_for_token(csrf_token, request)
+        self.assertEqual(rebuilt.scope, flow.scope)
+        self.assertEqual(rebuilt.redirect_uri, flow.redirect_uri)
+        self.assertEqual(rebuilt.client_id, flow.client_id)
+        self.assertEqual(rebuilt.params['state'], request.GET['state'])
+
+        # Flows pickled into the session by older versions are ignored.
+        self.session['google_oauth2_flow_{0}'.format(csrf_token)] = (
+            b'\x80\x02pickled')
+        self.assertIsNone(views._get_flow_for_token(csrf_token, request))
+
     def test_no_saved_flow(self):
         request = self.factory.get('oauth2/oauth2callback', data={
             'state': json.dumps(self.fake_state),
@@ -0,0 +1,414 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for oauth2client_latest.contrib.asyncio_util."""
+
+import datetime
+import json
+import os
+import sys
+
+import mock
+from six.moves import http_client
+import unittest2
+
+if sys.version_info < (3, 5):  # pragma: NO COVER
+    raise unittest2.SkipTest('asyncio_util requires Python 3.5 or newer.')
+
+import asyncio  # noqa: E402
+
+from oauth2client_latest import client  # noqa: E402
+from oauth2client_latest import crypt  # noqa: E402
+from oauth2client_latest.contrib import asyncio_util  # noqa: E402
+from oauth2client_latest.contrib import dictionary_storage  # noqa: E402
+from oauth2client_latest.contrib import gce  # noqa: E402
+from . import asyncio_http_stub  # noqa: E402
+
+
+TOKEN_RESPONSE = (
+    http_client.OK, {'content-type': 'application/json'},
+    json.dumps({'access_token': 'new_token',
+                'expires_in': 3600}).encode('utf-8'))
+ERROR_RESPONSE = (
+    http_client.BAD_REQUEST, {'content-type': 'application/json'},
+    b'{"error": "invalid_grant"}')
+
+
+class AsyncioTestCase(unittest2.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(self.loop.close)
+        self.addCleanup(asyncio.set_event_loop, None)
+        self.server = asyncio_http_stub.StubServer({})
+        self._run(self.server.start())
+        self.addCleanup(self._run, self.server.stop())
+        self.request = asyncio_http_stub.make_request(self.server)
+
+    def _run(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def _make_credentials(self, access_token='old_token', expires_in=3600):
+        return client.OAuth2Credentials(
+            access_token, 'client_id', 'client_secret', 'refresh_token',
+            datetime.datetime.utcnow() + datetime.timedelta(
+                seconds=expires_in),
+            'http://localhost/token', 'user_agent',
+            revoke_uri='http://localhost/revoke',
+            token_info_uri='http://localhost/tokeninfo')
+
+    def _posts(self, path='/token'):
+        return [r for r in self.server.requests
+                if r['method'] == 'POST' and r['path'] == path]
+
+
+class TestRefresh(AsyncioTestCase):
+
+    def test_success(self):
+        self.server.responses['/token'] = TOKEN_RESPONSE
+        credentials = self._make_credentials()
+
+        self._run(asyncio_util.refresh(credentials, self.request))
+
+        self.assertEqual(credentials.access_token, 'new_token')
+        self.assertFalse(credentials.access_token_expired)
+        posts = self._posts()
+        self.assertEqual(len(posts), 1)
+        self.assertIn(b'grant_type=refresh_token', posts[0]['body'])
+        self.assertEqual(posts[0]['headers']['user-agent'], 'user_agent')
+        self.assertNotIn(credentials,
+                         asyncio_util._loop_refreshes(self.loop))
+
+    def test_failure(self):
+        self.server.responses['/token'] = ERROR_RESPONSE
+        credentials = self._make_credentials()
+
+        with self.assertRaises(client.HttpAccessTokenRefreshError) as exc:
+            self._run(asyncio_util.refresh(credentials, self.request))
+
+        self.assertEqual(exc.exception.status, http_client.BAD_REQUEST)
+        self.assertTrue(credentials.invalid)
+
+    def test_concurrent_refreshes_coalesce(self):
+        self.server.responses['/token'] = TOKEN_RESPONSE
+        credentials = self._make_credentials()
+
+        self._run(asyncio.gather(*[
+            asyncio_util.refresh(credentials, self.request)
+            for _ in range(10)]))
+
+        self.assertEqual(len(self._posts()), 1)
+        self.assertEqual(credentials.access_token, 'new_token')
+
+    def test_concurrent_refreshes_share_failure(self):
+        self.server.responses['/token'] = ERROR_RESPONSE
+        credentials = self._make_credentials()
+
+        results = self._run(asyncio.gather(*[
+            asyncio_util.refresh(credentials, self.request)
+            for _ in range(10)], return_exceptions=True))
+
+        self.assertEqual(len(self._posts()), 1)
+        for result in results:
+            self.assertIsInstance(result, client.HttpAccessTokenRefreshError)
+
+    def test_refreshes_in_other_event_loop(self):
+        self.server.responses['/token'] = TOKEN_RESPONSE
+        credentials = self._make_credentials()
+        pending = self.loop.create_task(
+            asyncio_util.refresh(credentials, self.request))
+        self._run(asyncio.sleep(0))
+        self.assertFalse(pending.done())
+
+        other_loop = asyncio.new_event_loop()
+        self.addCleanup(other_loop.close)
+
+        def request(uri, method='GET', body=None, headers=None):
+            future = asyncio.Future(loop=other_loop)
+            future.set_result((http_client.OK, {}, json.dumps({
+                'access_token': 'other_token',
+                'expires_in': 3600}).encode('utf-8')))
+            return future
+
+        other_loop.run_until_complete(
+            asyncio_util.refresh(credentials, request))
+        self.assertEqual(credentials.access_token, 'other_token')
+
+        self._run(pending)
+        self.assertEqual(len(self._posts()), 1)
+
+    def test_cancelled_caller_does_not_cancel_refresh(self):
+        self.server.responses['/token'] = TOKEN_RESPONSE
+        credentials = self._make_credentials()
+        first = self.loop.create_task(
+            asyncio_util.refresh(credentials, self.request))
+        second = self.loop.create_task(
+            asyncio_util.refresh(credentials, self.request))
+        self._run(asyncio.sleep(0))
+
+        first.cancel()
+        self._run(second)
+
+        self.assertTrue(first.cancelled())
+        self.assertEqual(credentials.access_token, 'new_token')
+        self.assertEqual(len(self._posts()), 1)
+
+    def test_store(self):
+        self.server.responses['/token'] = TOKEN_RESPONSE
+        credentials = self._make_credentials()
+        store = dictionary_storage.DictionaryStorage({}, 'key')
+        credentials.set_store(store)
+
+        self._run(asyncio_util.refresh(credentials, self.request))
+
+        self.assertEqual(store.get().access_token, 'new_token')
+
+    def test_store_has_newer_token(self):
+        credentials = self._make_credentials()
+        store = dictionary_storage.DictionaryStorage({}, 'key')
+        store.put(self._make_credentials(access_token='stored_token'))
+        credentials.set_store(store)
+
+        self._run(asyncio_util.refresh(credentials, self.request))
+
+        self.assertEqual(credentials.access_token, 'stored_token')
+        self.assertEqual(self.server.requests, [])
+
+    def test_access_token_credentials(self):
+        credentials = client.AccessTokenCredentials('token', 'user_agent')
+        with self.assertRaises(client.AccessTokenCredentialsError):
+            self._run(asyncio_util.refresh(credentials, self.request))
+
+    @mock.patch('oauth2client_latest.client._UTCNOW',
+                return_value=datetime.datetime.min)
+    def test_gce(self, unused_utcnow):
+        self.server.responses.update({
+            '/computeMetadata/v1/instance/service-accounts/default/': (
+                http_client.OK, {'content-type': 'application/json'},
+                json.dumps({'email': 'a@example.com',
+                            'scopes': ['one', 'two']}).encode('utf-8')),
+            '/computeMetadata/v1/instance/service-accounts/'
+            'a@example.com/token': (
+                http_client.OK, {'content-type': 'application/json'},
+                json.dumps({'access_token': 'gce_token',
+                            'expires_in': 100}).encode('utf-8')),
+        })
+        credentials = gce.AppAssertionCredentials()
+
+        self._run(asyncio_util.refresh(credentials, self.request))
+
+        self.assertEqual(credentials.access_token, 'gce_token')
+        self.assertEqual(
+            credentials.token_expiry,
+            datetime.datetime.min + datetime.timedelta(seconds=100))
+        self.assertEqual(credentials.service_account_email, 'a@example.com')
+        self.assertEqual(credentials.scopes, ['one', 'two'])
+        for request in self.server.requests:
+            self.assertEqual(request['headers']['metadata-flavor'], 'Google')
+
+    def test_gce_failure(self):
+        credentials = gce.AppAssertionCredentials()
+        with self.assertRaises(client.HttpAccessTokenRefreshError):
+            self._run(asyncio_util.refresh(credentials, self.request))
+
+
+class TestAuthorize(AsyncioTestCase):
+
+    def _echo_authorization(self, request):
+        authorization = request['headers']['authorization']
+        if authorization == 'Bearer old_token':
+            return http_client.UNAUTHORIZED, {}, b''
+        return http_client.OK, {}, authorization.encode('utf-8')
+
+    def test_refresh_on_401(self):
+        self.server.responses.update({
+            '/token': TOKEN_RESPONSE,
+            '/api': self._echo_authorization,
+        })
+        credentials = self._make_credentials()
+        authed_request = asyncio_util.authorize(credentials, self.request)
+
+        status, headers, content = self._run(
+            authed_request('http://localhost/api', headers={'foo': 'bar'}))
+
+        self.assertIs(authed_request.credentials, credentials)
+        self.assertEqual(status, http_client.OK)
+        self.assertEqual(content, b'Bearer new_token')
+        self.assertEqual(len(self._posts()), 1)
+        self.assertEqual(self.server.requests[-1]['headers']['foo'], 'bar')
+        self.assertEqual(
+            self.server.requests[-1]['headers']['user-agent'], 'user_agent')
+
+    def test_concurrent_401s_refresh_once(self):
+        self.server.responses.update({
+            '/token': TOKEN_RESPONSE,
+            '/api': self._echo_authorization,
+        })
+        credentials = self._make_credentials()
+        authed_request = asyncio_util.authorize(credentials, self.request)
+
+        results = self._run(asyncio.gather(*[
+            authed_request('http://localhost/api') for _ in range(10)]))
+
+        self.assertEqual(len(self._posts()), 1)
+        for status, unused_headers, content in results:
+            self.assertEqual(status, http_client.OK)
+            self.assertEqual(content, b'Bearer new_token')
+
+    def test_expired_token_refreshed_first(self):
+        self.server.responses.update({
+            '/token': TOKEN_RESPONSE,
+            '/api': self._echo_authorization,
+        })
+        credentials = self._make_credentials(expires_in=-10)
+        authed_request = asyncio_util.authorize(credentials, self.request)
+
+        status, headers, content = self._run(
+            authed_request('http://localhost/api'))
+
+        self.assertEqual(content, b'Bearer new_token')
+        self.assertEqual(
+            [r['path'] for r in self.server.requests], ['/token', '/api'])
+
+
+class TestGetAccessToken(AsyncioTestCase):
+
+    def test_valid(self):
+        credentials = self._make_credentials()
+        info = self._run(
+            asyncio_util.get_access_token(credentials, self.request))
+        self.assertEqual(info.access_token, 'old_token')
+        self.assertEqual(self.server.requests, [])
+
+    def test_expired(self):
+        self.server.responses['/token'] = TOKEN_RESPONSE
+        credentials = self._make_credentials(expires_in=-10)
+        info = self._run(
+            asyncio_util.get_access_token(credentials, self.request))
+        self.assertEqual(info.access_token, 'new_token')
+        self.assertGreater(info.expires_in, 3500)
+
+
+class TestRevoke(AsyncioTestCase):
+
+    def test_success(self):
+        self.server.responses['/revoke'] = (http_client.OK, {}, b'')
+        credentials = self._make_credentials()
+        store = dictionary_storage.DictionaryStorage({}, 'key')
+        store.put(credentials)
+        credentials.set_store(store)
+
+        self._run(asyncio_util.revoke(credentials, self.request))
+
+        self.assertTrue(credentials.invalid)
+        self.assertIsNone(store.get())
+        self.assertEqual(self.server.requests[0]['query'],
+                         {'token': 'refresh_token'})
+
+    def test_failure(self):
+        self.server.responses['/revoke'] = (
+            http_client.BAD_REQUEST, {}, b'{"error": "invalid_token"}')
+        credentials = self._make_credentials()
+
+        with self.assertRaises(client.TokenRevokeError) as exc:
+            self._run(asyncio_util.revoke(credentials, self.request))
+
+        self.assertEqual(str(exc.exception), 'invalid_token')
+        self.assertFalse(credentials.invalid)
+
+
+class TestRetrieveScopes(AsyncioTestCase):
+
+    def test_success(self):
+        self.server.responses['/tokeninfo'] = (
+            http_client.OK, {}, b'{"scope": "one two"}')
+        credentials = self._make_credentials()
+
+        scopes = self._run(
+            asyncio_util.retrieve_scopes(credentials, self.request))
+
+        self.assertEqual(scopes, set(['one', 'two']))
+        self.assertEqual(self.server.requests[0]['query'],
+                         {'access_token': 'old_token', 'fields': 'scope'})
+
+    def test_failure(self):
+        self.server.responses['/tokeninfo'] = (
+            http_client.BAD_REQUEST, {},
+            b'{"error_description": "Invalid token"}')
+        credentials = self._make_credentials()
+
+        with self.assertRaises(client.Error) as exc:
+            self._run(asyncio_util.retrieve_scopes(credentials, self.request))
+
+        self.assertEqual(str(exc.exception), 'Invalid token')
+
+
+class TestVerifyIdToken(AsyncioTestCase):
+
+    CERT_URI = 'http://localhost/certs'
+
+    def setUp(self):
+        super(TestVerifyIdToken, self).setUp()
+        certs_path = os.path.join(
+            os.path.dirname(os.path.dirname(__file__)), 'data', 'certs.json')
+        with open(certs_path, 'rb') as file_obj:
+            self.certs = file_obj.read()
+        patcher = mock.patch.object(client, '_certificate_sets', new={})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @mock.patch('oauth2client_latest.crypt.verify_signed_jwt_with_certs',
+                return_value={'sub': 'user'})
+    def test_success(self, verify):
+        self.server.responses['/certs'] = (
+            http_client.OK, {'cache-control': 'max-age=600'}, self.certs)
+
+        for unused_i in range(2):
+            result = self._run(asyncio_util.verify_id_token(
+                'id_token', 'audience', self.request,
+                cert_uri=self.CERT_URI))
+            self.assertEqual(result, verify.return_value)
+
+        # The parsed certificates are reused by the second call.
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(verify.call_count, 2)
+        id_token, verifiers, audience = verify.call_args[0]
+        self.assertEqual((id_token, audience), ('id_token', 'audience'))
+        self.assertEqual(list(verifiers), ['foo'])
+        self.assertIsInstance(verifiers['foo'], crypt.Verifier)
+
+    def test_failure(self):
+        with self.assertRaises(client.VerifyJwtTokenError):
+            self._run(asyncio_util.verify_id_token(
+                'id_token', 'audience', self.request,
+                cert_uri=self.CERT_URI))
+
+
+class TestAiohttpRequest(AsyncioTestCase):
+
+    def test_request(self):
+        session = asyncio_http_stub.FakeAiohttpSession(
+            http_client.OK, {'Content-Type': 'text/plain'}, b'content')
+        request = asyncio_util.aiohttp_request(session)
+
+        result = self._run(request('http://example.com', 'POST', b'body',
+                                   {'foo': 'bar'}))
+
+        self.assertEqual(
+            result, (http_client.OK, {'content-type': 'text/plain'},
+                     b'content'))
+        self.assertEqual(session.requests, [
+            ('POST', 'http://example.com',
+             {'data': b'body', 'headers': {'foo': 'bar'}})])
@@ -179,6 +179,26 @@ class FlaskOAuth2Tests(unittest2.TestCase):
             flow = oauth2._make_flow()
             self.assertEqual(flow.params['extra_arg'], 'test')
 
+    def test_flow_state(self):
+        with self.app.test_request_context():
+            flow = self.oauth2._make_flow(
+                return_url='/return_url', scopes=['one'], extra_arg='test')
+            csrf_token = flask.session['google_oauth2_csrf_token']
+            flow_state = flask.session[
+                'google_oauth2_flow_{0}'.format(csrf_token)]
+            self.assertLess(len(flow_state), 100)
+
+            flow_state = flask_util._get_flow_state_for_token(csrf_token)
+            self.assertEqual(flow_state, {
+                'scope': flow.scope,
+                'kwargs': {'extra_arg': 'test'},
+            })
+            self.assertIsNone(flask_util._get_flow_state_for_token(csrf_token))
+
+            flask.session['google_oauth2_flow_{0}'.format(csrf_token)] = (
+                b'\x80\x02pickled')
+            self.assertIsNone(flask_util._get_flow_state_for_token(csrf_token))
+
     def test_authorize_view(self):
         with self.app.test_client() as client:
             response = client.get('/oauth2authorize')
@@ -211,17 +231,14 @@ class FlaskOAuth2Tests(unittest2.TestCase):
             # transaction for some reason, so, set up the flow here,
             # then apply it to the session in the transaction.
             if not kwargs:
-                self.oauth2._make_flow(return_url='/return_url')
+                flow = self.oauth2._make_flow(return_url='/return_url')
             else:
-                self.oauth2._make_flow(**kwargs)
+                flow = self.oauth2._make_flow(**kwargs)
 
             with client.session_transaction() as session:
                 session.update(flask.session)
-                csrf_token = session['google_oauth2_csrf_token']
-                flow = flask_util._get_flow_for_token(csrf_token)
-                state = flow.params['state']
 
-        return state
+        return flow.params['state']
 
     def test_callback_view(self):
         self.oauth2.storage = mock.Mock()
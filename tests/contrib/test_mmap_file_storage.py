@@ -0,0 +1,222 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for oauth2client_latest.contrib.mmap_file_storage."""
+
+import datetime
+import json
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+
+import mock
+import unittest2
+
+from oauth2client_latest import client
+from oauth2client_latest.contrib import mmap_file_storage
+from ..http_mock import HttpMockSequence
+
+
+NOW = datetime.datetime(2016, 1, 1)
+
+
+def _create_test_credentials(access_token='foo', expires_in=3600):
+    if expires_in is None:
+        token_expiry = None
+    else:
+        token_expiry = NOW + datetime.timedelta(seconds=expires_in)
+    return client.OAuth2Credentials(
+        access_token, 'test-client-id', 'cOuDdkfjxxnv+', '1/0/a.df219fjls0',
+        token_expiry, 'https://www.google.com/accounts/o8/oauth2/token',
+        'refresh_checker/1.0')
+
+
+class MmapFileStorageTests(unittest2.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.filename = os.path.join(self.directory, 'credentials')
+        patcher = mock.patch.object(client, '_UTCNOW', return_value=NOW)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _other_process(self):
+        """Gets a backend separate from the one of this process."""
+        return mmap_file_storage._MmapFileBackend(
+            os.path.abspath(self.filename), 4)
+
+    def test_put_get_delete(self):
+        store = mmap_file_storage.MmapFileStorage(self.filename, 'key')
+        self.assertIsNone(store.get())
+        self.assertIsNone(store.get_access_token())
+        self.assertFalse(os.path.exists(self.filename))
+
+        credentials = _create_test_credentials()
+        store.put(credentials)
+        retrieved = store.get()
+        self.assertIs(retrieved, credentials)
+        self.assertIs(retrieved.store, store)
+        self.assertEqual(store.get_access_token(),
+                         client.AccessTokenInfo('foo', 3600))
+
+        backend = self._other_process()
+        retrieved = backend.get('key')
+        self.assertEqual(retrieved.to_json(), credentials.to_json())
+        # The credentials are only built again when they change.
+        self.assertIs(backend.get('key'), retrieved)
+        self.assertIsNone(backend.get('other'))
+
+        store.delete()
+        self.assertIsNone(store.get())
+        self.assertIsNone(backend.get('key'))
+        self.assertIsNone(backend.get_access_token('key'))
+
+    def test_get_access_token(self):
+        store = mmap_file_storage.MmapFileStorage(self.filename, 'key')
+        store.put(_create_test_credentials(expires_in=None))
+        self.assertEqual(store.get_access_token(),
+                         client.AccessTokenInfo('foo', None))
+
+        store.put(_create_test_credentials(expires_in=-1))
+        self.assertIsNone(store.get_access_token())
+
+        store.put(_create_test_credentials(access_token=None))
+        self.assertIsNone(store.get_access_token())
+
+    def test_refresh_seen_by_other_processes(self):
+        store = mmap_file_storage.MmapFileStorage(self.filename, 'key')
+        credentials = _create_test_credentials(expires_in=-1)
+        store.put(credentials)
+        credentials.set_store(store)
+        backend = self._other_process()
+        old_credentials = backend.get('key')
+
+        http = HttpMockSequence([
+            ({'status': '200'}, json.dumps({
+                'access_token': 'new_token',
+                'expires_in': 3600,
+            })),
+        ])
+        credentials.refresh(http)
+
+        self.assertEqual(backend.get_access_token('key'),
+                         client.AccessTokenInfo('new_token', 3600))
+        new_credentials = backend.get('key')
+        self.assertIsNot(new_credentials, old_credentials)
+        self.assertEqual(new_credentials.access_token, 'new_token')
+
+    def test_keys_use_separate_slots(self):
+        store1 = mmap_file_storage.MmapFileStorage(
+            self.filename, 'key1', num_slots=2)
+        store2 = mmap_file_storage.MmapFileStorage(self.filename, 'key2')
+        store1.put(_create_test_credentials(access_token='token1'))
+        store2.put(_create_test_credentials(access_token='token2'))
+
+        backend = self._other_process()
+        self.assertEqual(backend.get('key1').access_token, 'token1')
+        self.assertEqual(backend.get('key2').access_token, 'token2')
+
+        store3 = mmap_file_storage.MmapFileStorage(self.filename, 'key3')
+        with self.assertRaises(ValueError):
+            store3.put(_create_test_credentials())
+        # Deleting keeps the slot for the key.
+        store1.delete()
+        with self.assertRaises(ValueError):
+            store3.put(_create_test_credentials())
+
+    def test_put_too_long(self):
+        store = mmap_file_storage.MmapFileStorage(self.filename, 'key')
+        credentials = _create_test_credentials(
+            access_token='a' * (mmap_file_storage.ACCESS_TOKEN_MAX_BYTES + 1))
+        with self.assertRaises(ValueError):
+            store.put(credentials)
+
+        credentials = _create_test_credentials()
+        credentials.user_agent = 'a' * (
+            mmap_file_storage.CREDENTIALS_JSON_MAX_BYTES)
+        with self.assertRaises(ValueError):
+            store.put(credentials)
+
+    @unittest2.skipIf(os.name == 'nt', 'No POSIX file permissions.')
+    def test_new_file_permissions(self):
+        old_umask = os.umask(0)
+        self.addCleanup(os.umask, old_umask)
+        store = mmap_file_storage.MmapFileStorage(self.filename, 'key')
+        store.put(_create_test_credentials())
+        self.assertEqual(stat.S_IMODE(os.stat(self.filename).st_mode), 0o600)
+
+    def test_concurrent_readers_map_once(self):
+        mmap_file_storage.MmapFileStorage(self.filename, 'key').put(
+            _create_test_credentials())
+        backend = self._other_process()
+        real_mmap = mmap_file_storage.mmap.mmap
+
+        def slow_mmap(*args):
+            time.sleep(0.01)
+            return real_mmap(*args)
+
+        results = []
+        with mock.patch.object(mmap_file_storage.mmap, 'mmap',
+                               side_effect=slow_mmap) as mmap_mock:
+            threads = [
+                threading.Thread(
+                    target=lambda: results.append(backend.get('key')))
+                for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(mmap_mock.call_count, 1)
+        self.assertEqual([credentials.access_token for credentials in results],
+                         ['foo'] * 8)
+
+    @mock.patch.object(mmap_file_storage, 'logger')
+    def test_invalid_file_overwritten(self, logger):
+        with open(self.filename, 'wb') as credentials_file:
+            credentials_file.write(b'{"file_version": 2}')
+
+        store = mmap_file_storage.MmapFileStorage(self.filename, 'key')
+        self.assertIsNone(store.get())
+        store.put(_create_test_credentials())
+        self.assertEqual(logger.warning.call_count, 1)
+        self.assertEqual(self._other_process().get('key').access_token, 'foo')
+
+    def test_half_written_slot(self):
+        store = mmap_file_storage.MmapFileStorage(self.filename, 'key')
+        store.put(_create_test_credentials())
+        backend = self._other_process()
+        backend.get('key')
+
+        # A writer dies in the middle of writing the slot.
+        index = backend._slots['key']
+        offset = backend._slot_offset(index)
+        sequence = mmap_file_storage._SEQUENCE.unpack_from(
+            backend._mmap, offset)[0]
+        mmap_file_storage._SEQUENCE.pack_into(
+            backend._mmap, offset, sequence + 1)
+
+        with mock.patch.object(mmap_file_storage, '_MAX_READ_ATTEMPTS',
+                               new=10):
+            self.assertIsNone(backend.get_access_token('key'))
+        self.assertIsNone(store.locked_get())
+
+        store.put(_create_test_credentials(access_token='bar'))
+        self.assertEqual(backend.get('key').access_token, 'bar')
+        self.assertEqual(mmap_file_storage._SEQUENCE.unpack_from(
+            backend._mmap, offset)[0] % 2, 0)
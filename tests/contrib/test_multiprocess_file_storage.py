@@ -20,6 +20,8 @@ import json
 import multiprocessing
 import os
 import tempfile
+import threading
+import time
 
 import fasteners
 import mock
@@ -104,6 +106,7 @@ class MultiprocessStorageBehaviorTests(unittest2.TestCase):
 
         # Reset internal cache, ensure credentials were saved.
         store._backend._credentials = {}
+        store._backend._file_stamp = None
         credentials = store.get()
 
         self.assertIsNotNone(credentials)
@@ -165,7 +168,8 @@ class MultiprocessStorageBehaviorTests(unittest2.TestCase):
         with scoped_child_process(child_process_func, check_event=check_event):
             # The lock should be currently held by the child process.
             self.assertFalse(
-                store._backend._process_lock.acquire(blocking=False))
+                store._backend._process_lock.acquire_write_lock(
+                    blocking=False))
             check_event.set()
 
             # The child process will refresh first, so we should end up
@@ -199,6 +203,34 @@ class MultiprocessStorageBehaviorTests(unittest2.TestCase):
         # These credentials should still be in the store's memory-only cache.
         self.assertIsNotNone(store.get())
 
+    def test_get_shares_lock(self):
+        credentials = _create_test_credentials()
+        store = multiprocess_file_storage.MultiprocessFileStorage(
+            self.filename, 'shared-lock')
+        store.put(credentials)
+        store._backend._credentials = {}
+        store._backend._file_stamp = None
+
+        # Hold a read lock in another process. Reading doesn't wait for it,
+        # but writing does.
+        def child_process(die_event, ready_event):  # pragma: NO COVER
+            lock = fasteners.InterProcessReaderWriterLock(
+                '{0}.lock'.format(self.filename))
+            with lock.read_lock():
+                ready_event.set()
+                die_event.wait()
+
+        with scoped_child_process(child_process):
+            with mock.patch.object(multiprocess_file_storage,
+                                   'INTERPROCESS_LOCK_DEADLINE', new=0):
+                retrieved = store.get()
+                self.assertEqual(retrieved.access_token, 'foo')
+                self.assertIs(retrieved.store, store)
+                self.assertFalse(store._backend._read_only)
+
+                store.put(credentials)
+                self.assertTrue(store._backend._read_only)
+
 
 class MultiprocessStorageUnitTests(unittest2.TestCase):
 
@@ -223,6 +255,40 @@ class MultiprocessStorageUnitTests(unittest2.TestCase):
         self.assertTrue(
             os.path.exists(self.filename))
 
+    def test__read_write_lock(self):
+        lock = multiprocess_file_storage._ReadWriteLock()
+        events = []
+
+        def write():
+            lock.acquire()
+            events.append('write')
+            lock.release()
+
+        def read():
+            lock.acquire_read()
+            events.append('read')
+            lock.release_read()
+
+        # Readers share the lock.
+        lock.acquire_read()
+        reader = threading.Thread(target=read)
+        reader.start()
+        reader.join()
+        self.assertEqual(events, ['read'])
+
+        # A waiting writer goes before new readers.
+        writer = threading.Thread(target=write)
+        writer.start()
+        while not lock._waiting_writers:
+            time.sleep(0.001)
+        reader = threading.Thread(target=read)
+        reader.start()
+        self.assertEqual(events, ['read'])
+        lock.release_read()
+        writer.join()
+        reader.join()
+        self.assertEqual(events, ['read', 'write', 'read'])
+
     def test__get_backend(self):
         backend_one = multiprocess_file_storage._get_backend('file_a')
         backend_two = multiprocess_file_storage._get_backend('file_a')
@@ -238,25 +304,61 @@ class MultiprocessStorageUnitTests(unittest2.TestCase):
         multiprocess_file_storage._write_credentials_file(
             contents, {'key': credentials})
 
-        contents.seek(0)
-        data = json.load(contents)
-        self.assertEqual(data['file_version'], 2)
-        self.assertTrue(data['credentials']['key'])
+        lines = contents.getvalue().split('\n')
+        self.assertEqual(json.loads(lines[0]), {'file_version': 3})
+        self.assertEqual(len(lines), 2)
+        record = json.loads(lines[1])
+        self.assertEqual(record['key'], 'key')
+        self.assertTrue(record['credential'])
 
         # Read it back.
-        contents.seek(0)
+        results, num_records = (
+            multiprocess_file_storage._read_credentials_file(contents))
+        self.assertEqual(num_records, 1)
+        self.assertEqual(results, {'key': record['credential']})
+
+        # Add an invalid credential and a partially written record and try
+        # reading it back. It should ignore them but still load the valid
+        # one.
+        contents.write('\n{"key": "invalid", "credential": "123"}')
+        contents.write('\n{"key": "partial", "cred')
         results = multiprocess_file_storage._load_credentials_file(contents)
+        self.assertEqual(list(results), ['key'])
         self.assertEqual(
             results['key'].access_token, credentials.access_token)
 
-        # Add an invalid credential and try reading it back. It should ignore
-        # the invalid one but still load the valid one.
-        data['credentials']['invalid'] = '123'
-        results = multiprocess_file_storage._load_credentials_file(
-            StringIO(json.dumps(data)))
-        self.assertNotIn('invalid', results)
-        self.assertEqual(
-            results['key'].access_token, credentials.access_token)
+    def test__append_credential(self):
+        credentials = _create_test_credentials()
+        contents = StringIO()
+        multiprocess_file_storage._write_credentials_file(contents, {})
+
+        multiprocess_file_storage._append_credential(
+            contents, 'a', credentials)
+        multiprocess_file_storage._append_credential(
+            contents, 'b', credentials)
+        multiprocess_file_storage._append_credential(contents, 'a', None)
+
+        results, num_records = (
+            multiprocess_file_storage._read_credentials_file(contents))
+        self.assertEqual(num_records, 3)
+        self.assertEqual(list(results), ['b'])
+
+    def test__read_credentials_file_version_2(self):
+        credentials = _create_test_credentials()
+        data = {
+            'file_version': 2,
+            'credentials': {
+                'key': multiprocess_file_storage._encode_credential(
+                    credentials),
+                'invalid': '123',
+            },
+        }
+        results, num_records = (
+            multiprocess_file_storage._read_credentials_file(
+                StringIO(json.dumps(data))))
+        # The file has to be rewritten before it can be appended to.
+        self.assertIsNone(num_records)
+        self.assertEqual(results, data['credentials'])
 
     def test__load_credentials_file_invalid_json(self):
         contents = StringIO('{[')
@@ -283,7 +385,7 @@ class MultiprocessStorageUnitTests(unittest2.TestCase):
         backend = multiprocess_file_storage._get_backend(self.filename)
         os.unlink(self.filename)
         backend._process_lock = mock.Mock()
-        backend._process_lock.acquire.return_value = False
+        backend._process_lock.acquire_write_lock.return_value = False
         backend.acquire_lock()
         self.assertIsNone(backend._file)
 
@@ -294,6 +396,204 @@ class MultiprocessStorageUnitTests(unittest2.TestCase):
         backend._thread_lock.acquire()
         backend.release_lock()
 
+    def test_put_appends(self):
+        credentials = _create_test_credentials()
+        store = multiprocess_file_storage.MultiprocessFileStorage(
+            self.filename, 'append')
+        backend = store._backend
+        # Empty file, rewritten by the first write.
+        store.put(credentials)
+        self.assertEqual(backend._num_records, 1)
+
+        for unused_i in range(3):
+            store.put(credentials)
+        store.delete()
+        self.assertEqual(backend._num_records, 5)
+        with open(self.filename) as credentials_file:
+            self.assertEqual(len(credentials_file.read().split('\n')), 6)
+
+        backend._credentials = {}
+        backend._file_stamp = None
+        self.assertIsNone(store.get())
+
+    @mock.patch.object(multiprocess_file_storage, 'COMPACTION_MIN_RECORDS',
+                       new=4)
+    def test_put_compacts(self):
+        credentials = _create_test_credentials()
+        store = multiprocess_file_storage.MultiprocessFileStorage(
+            self.filename, 'compact')
+        other_store = multiprocess_file_storage.MultiprocessFileStorage(
+            self.filename, 'other')
+        other_store.put(credentials)
+
+        for unused_i in range(4):
+            store.put(credentials)
+        # 1 + 4 records, compacted into 2 by the fifth write.
+        self.assertEqual(store._backend._num_records, 2)
+        with open(self.filename) as credentials_file:
+            results, num_records = (
+                multiprocess_file_storage._read_credentials_file(
+                    credentials_file))
+        self.assertEqual(num_records, 2)
+        self.assertEqual(sorted(results), ['compact', 'other'])
+
+    def test_migrates_version_2(self):
+        credentials = _create_test_credentials()
+        with open(self.filename, 'w') as credentials_file:
+            json.dump({
+                'file_version': 2,
+                'credentials': {
+                    'old': multiprocess_file_storage._encode_credential(
+                        credentials),
+                },
+            }, credentials_file)
+
+        store = multiprocess_file_storage.MultiprocessFileStorage(
+            self.filename, 'new')
+        store._backend._credentials = {}
+        store._backend._file_stamp = None
+        store.put(credentials)
+
+        with open(self.filename) as credentials_file:
+            self.assertEqual(json.loads(credentials_file.readline()),
+                             {'file_version': 3})
+            results = multiprocess_file_storage._load_credentials_file(
+                credentials_file)
+        self.assertEqual(sorted(results), ['new', 'old'])
+
+    def test__load_credentials_skipped_when_unchanged(self):
+        credentials = _create_test_credentials()
+        store = multiprocess_file_storage.MultiprocessFileStorage(
+            self.filename, 'unchanged')
+        store.put(credentials)
+        read_credentials_file = (
+            multiprocess_file_storage._read_credentials_file)
+
+        with mock.patch.object(multiprocess_file_storage,
+                               '_read_credentials_file',
+                               wraps=read_credentials_file) as read_mock:
+            store.put(credentials)
+            self.assertIsNotNone(store.get())
+            self.assertEqual(read_mock.call_count, 0)
+
+        # Another process writes to the file.
+        other_backend = multiprocess_file_storage._MultiprocessStorageBackend(
+            self.filename)
+        other_backend.acquire_lock()
+        other_backend.locked_put('other', credentials)
+        other_backend.release_lock()
+
+        with mock.patch.object(multiprocess_file_storage,
+                               '_read_credentials_file',
+                               wraps=read_credentials_file) as read_mock:
+            other_store = multiprocess_file_storage.MultiprocessFileStorage(
+                self.filename, 'other')
+            self.assertIsNotNone(other_store.get())
+            self.assertEqual(read_mock.call_count, 1)
+
+    def test_delete_seen_by_other_process(self):
+        credentials = _create_test_credentials()
+        backend_a = multiprocess_file_storage._MultiprocessStorageBackend(
+            self.filename)
+        backend_b = multiprocess_file_storage._MultiprocessStorageBackend(
+            self.filename)
+        for backend in (backend_a, backend_b):
+            backend.acquire_lock()
+            backend.locked_put('deleted', credentials)
+            backend.locked_put('kept', credentials)
+            backend.release_lock()
+
+        backend_a.acquire_lock()
+        backend_a.locked_delete('deleted')
+        backend_a.release_lock()
+
+        # B compacts the file after seeing the deletion.
+        backend_b.acquire_lock()
+        backend_b._num_records = None
+        backend_b.locked_put('kept', credentials)
+        backend_b.release_lock()
+
+        self.assertIsNone(backend_b.get('deleted'))
+        backend_a._file_stamp = None
+        self.assertIsNone(backend_a.get('deleted'))
+        self.assertIsNotNone(backend_a.get('kept'))
+        with open(self.filename) as credentials_file:
+            results, unused_num_records = (
+                multiprocess_file_storage._read_credentials_file(
+                    credentials_file))
+        self.assertEqual(sorted(results), ['kept'])
+
+    def test_readers_load_file_in_parallel(self):
+        credentials = _create_test_credentials()
+        store = multiprocess_file_storage.MultiprocessFileStorage(
+            self.filename, 'parallel')
+        store.put(credentials)
+        backend = multiprocess_file_storage._MultiprocessStorageBackend(
+            self.filename)
+        read_credentials_file = (
+            multiprocess_file_storage._read_credentials_file)
+        reading = []
+        both_reading = threading.Event()
+
+        def read(credentials_file):
+            reading.append(credentials_file)
+            if len(reading) == 2:
+                both_reading.set()
+            # Only returns once both readers are reading the file.
+            both_reading.wait(5)
+            return read_credentials_file(credentials_file)
+
+        results = []
+        with mock.patch.object(multiprocess_file_storage,
+                               '_read_credentials_file', side_effect=read):
+            threads = [
+                threading.Thread(
+                    target=lambda: results.append(backend.get('parallel')))
+                for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertTrue(both_reading.is_set())
+        self.assertEqual([result.access_token for result in results],
+                         ['foo', 'foo'])
+
+    def test_credentials_decoded_when_used(self):
+        credentials = _create_test_credentials()
+        with open(self.filename, 'w') as credentials_file:
+            multiprocess_file_storage._write_credentials_file(
+                credentials_file,
+                {'used': credentials, 'unused': credentials,
+                 'invalid': '123'})
+
+        store = multiprocess_file_storage.MultiprocessFileStorage(
+            self.filename, 'used')
+        with mock.patch.object(
+                multiprocess_file_storage, '_decode_credential',
+                wraps=multiprocess_file_storage._decode_credential) as (
+                    decode_mock):
+            self.assertEqual(store.get().access_token,
+                             credentials.access_token)
+            self.assertIsNotNone(store.get())
+        self.assertEqual(decode_mock.call_count, 1)
+
+        invalid_store = multiprocess_file_storage.MultiprocessFileStorage(
+            self.filename, 'invalid')
+        self.assertIsNone(invalid_store.get())
+
+        # Compaction writes the unused credentials as they were read and
+        # drops the invalid ones.
+        encoded_unused = store._backend._encoded_credentials['unused']
+        store._backend._num_records = None
+        store.put(credentials)
+        with open(self.filename) as credentials_file:
+            results, unused_num_records = (
+                multiprocess_file_storage._read_credentials_file(
+                    credentials_file))
+        self.assertEqual(sorted(results), ['unused', 'used'])
+        self.assertEqual(results['unused'], encoded_unused)
+
     def test__refresh_predicate(self):
         backend = multiprocess_file_storage._get_backend(self.filename)
 
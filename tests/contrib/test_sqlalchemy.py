@@ -13,7 +13,9 @@
 # limitations under the License.
 
 import datetime
+import json
 
+import mock
 import sqlalchemy
 import sqlalchemy.ext.declarative
 import sqlalchemy.orm
@@ -22,6 +24,7 @@ import unittest2
 import oauth2client_latest
 import oauth2client_latest.client
 import oauth2client_latest.contrib.sqlalchemy
+from ..http_mock import HttpMockSequence
 
 Base = sqlalchemy.ext.declarative.declarative_base()
 
@@ -36,10 +39,20 @@ class DummyModel(Base):
         oauth2client_latest.contrib.sqlalchemy.CredentialsType)
 
 
+class DummyJSONModel(Base):
+    __tablename__ = 'dummy_json'
+
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    key = sqlalchemy.Column(sqlalchemy.Integer)
+    credentials = sqlalchemy.Column(
+        oauth2client_latest.contrib.sqlalchemy.CredentialsJSONType)
+
+
 class TestSQLAlchemyStorage(unittest2.TestCase):
     def setUp(self):
         engine = sqlalchemy.create_engine('sqlite://')
         Base.metadata.create_all(engine)
+        self.engine = engine
 
         self.session = sqlalchemy.orm.sessionmaker(bind=engine)
         self.credentials = oauth2client_latest.client.OAuth2Credentials(
@@ -47,14 +60,16 @@ class TestSQLAlchemyStorage(unittest2.TestCase):
             client_id='client_id',
             client_secret='client_secret',
             refresh_token='refresh_token',
-            token_expiry=datetime.datetime.utcnow(),
+            # JSON keeps the expiry to the second.
+            token_expiry=datetime.datetime.utcnow().replace(microsecond=0),
             token_uri=oauth2client_latest.GOOGLE_TOKEN_URI,
             user_agent='DummyAgent',
         )
 
     def tearDown(self):
         session = self.session()
-        session.query(DummyModel).filter_by(key=1).delete()
+        session.query(DummyModel).delete()
+        session.query(DummyJSONModel).delete()
         session.commit()
 
     def compare_credentials(self, result):
@@ -117,3 +132,170 @@ class TestSQLAlchemyStorage(unittest2.TestCase):
         ).delete()
         session.commit()
         self.assertIsNone(query.first())
+
+    def test_json_type(self):
+        session = self.session()
+        storage = oauth2client_latest.contrib.sqlalchemy.Storage(
+            session=session,
+            model_class=DummyJSONModel,
+            key_name='key',
+            key_value=1,
+            property_name='credentials',
+        )
+        storage.put(self.credentials)
+        session.commit()
+
+        stored = session.execute(
+            sqlalchemy.text('SELECT credentials FROM dummy_json')).scalar()
+        self.assertEqual(stored, self.credentials.to_json())
+        session.expire_all()
+        self.compare_credentials(storage.get())
+
+        session.add(DummyJSONModel(key=2))
+        session.commit()
+        self.assertIsNone(oauth2client_latest.contrib.sqlalchemy.Storage(
+            session, DummyJSONModel, 'key', 2, 'credentials').get())
+
+    def _count_statements(self):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        sqlalchemy.event.listen(self.engine, 'before_cursor_execute',
+                                before_cursor_execute)
+        self.addCleanup(sqlalchemy.event.remove, self.engine,
+                        'before_cursor_execute', before_cursor_execute)
+        return statements
+
+    def test_get_many(self):
+        session = self.session()
+        for key in range(1, 4):
+            session.add(DummyJSONModel(key=key, credentials=self.credentials))
+        session.add(DummyJSONModel(key=4))
+        session.commit()
+
+        statements = self._count_statements()
+        result = oauth2client_latest.contrib.sqlalchemy.get_many(
+            session, DummyJSONModel, 'key', [1, 3, 4, 5], 'credentials')
+
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(sorted(result), [1, 3])
+        self.compare_credentials(result[3])
+        self.assertIsNone(result[3].store)
+
+        result = oauth2client_latest.contrib.sqlalchemy.get_many(
+            session, DummyJSONModel, 'key', [3], 'credentials',
+            with_storage=True)
+        storage = result[3].store
+        self.assertIsInstance(storage,
+                              oauth2client_latest.contrib.sqlalchemy.Storage)
+        self.assertEqual(storage.key_value, 3)
+        self.assertEqual(storage.key_name, 'key')
+
+    @mock.patch.object(oauth2client_latest.contrib.sqlalchemy,
+                       '_MAX_KEYS_PER_QUERY', new=2)
+    def test_put_many(self):
+        session = self.session()
+        old_credentials = oauth2client_latest.client.OAuth2Credentials(
+            'old', 'client_id', 'client_secret', 'refresh_token', None,
+            oauth2client_latest.GOOGLE_TOKEN_URI, 'DummyAgent')
+        session.add(DummyModel(key=1, credentials=old_credentials))
+        session.add(DummyModel(key=2, credentials=old_credentials))
+        session.commit()
+
+        statements = self._count_statements()
+        oauth2client_latest.contrib.sqlalchemy.put_many(
+            session, DummyModel, 'key',
+            dict((key, self.credentials) for key in range(1, 5)),
+            'credentials')
+        session.commit()
+
+        # Two queries for the existing keys, then an UPDATE and an INSERT.
+        self.assertEqual(len(statements), 4)
+        entities = session.query(DummyModel).order_by(DummyModel.key).all()
+        self.assertEqual([entity.key for entity in entities], [1, 2, 3, 4])
+        for entity in entities:
+            self.compare_credentials(entity.credentials)
+
+    def _select_for_update_storage(self, session):
+        return oauth2client_latest.contrib.sqlalchemy.Storage(
+            session=session,
+            model_class=DummyJSONModel,
+            key_name='key',
+            key_value=1,
+            property_name='credentials',
+            select_for_update=True,
+        )
+
+    @mock.patch.object(sqlalchemy.orm.Query, 'with_for_update',
+                       autospec=True,
+                       side_effect=sqlalchemy.orm.Query.with_for_update)
+    def test_select_for_update_refresh(self, with_for_update):
+        session = self.session()
+        storage = self._select_for_update_storage(session)
+        storage.put(self.credentials)
+        self.assertEqual(with_for_update.call_count, 0)
+
+        credentials = storage.get()
+        self.assertEqual(with_for_update.call_count, 0)
+        http = HttpMockSequence([
+            ({'status': '200'}, json.dumps({
+                'access_token': 'new_token',
+                'expires_in': 3600,
+            })),
+        ])
+        credentials.refresh(http)
+
+        self.assertEqual(with_for_update.call_count, 1)
+        self.assertEqual(len(http.requests), 1)
+        # Releasing the lock committed the new token.
+        other_session = self.session()
+        self.assertEqual(
+            self._select_for_update_storage(other_session).get().access_token,
+            'new_token')
+        other_session.close()
+
+    def test_select_for_update_refreshed_elsewhere(self):
+        session = self.session()
+        storage = self._select_for_update_storage(session)
+        storage.put(self.credentials)
+        credentials = storage.get()
+
+        # Another server refreshes the credentials first.
+        other_session = self.session()
+        other_credentials = self._select_for_update_storage(
+            other_session).get()
+        other_credentials.access_token = 'other_token'
+        other_credentials.token_expiry = (
+            datetime.datetime.utcnow() + datetime.timedelta(seconds=3600))
+        self._select_for_update_storage(other_session).put(other_credentials)
+        other_session.close()
+
+        http = HttpMockSequence([])
+        credentials.refresh(http)
+        self.assertEqual(credentials.access_token, 'other_token')
+        self.assertEqual(http.requests, [])
+
+    def test_select_for_update_refreshed_elsewhere_entity_loaded(self):
+        session = self.session()
+        storage = self._select_for_update_storage(session)
+        storage.put(self.credentials)
+        credentials = storage.get()
+        # The entity stays in the identity map of the session.
+        entity = session.query(DummyJSONModel).filter_by(key=1).one()
+
+        other_session = self.session()
+        other_storage = self._select_for_update_storage(other_session)
+        other_credentials = other_storage.get()
+        other_credentials.access_token = 'other_token'
+        other_credentials.token_expiry = (
+            datetime.datetime.utcnow() + datetime.timedelta(seconds=3600))
+        other_storage.put(other_credentials)
+        other_session.close()
+
+        http = HttpMockSequence([])
+        credentials.refresh(http)
+        self.assertEqual(credentials.access_token, 'other_token')
+        self.assertEqual(http.requests, [])
+        self.assertEqual(entity.credentials.access_token, 'other_token')
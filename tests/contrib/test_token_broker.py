@@ -0,0 +1,258 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import json
+import threading
+import time
+
+import mock
+from six.moves import http_client
+from six.moves import urllib
+import unittest2
+
+from oauth2client_latest import client
+from oauth2client_latest.contrib import dictionary_storage
+from oauth2client_latest.contrib import token_broker
+from .. import http_mock
+
+
+NOW = datetime.datetime(2016, 1, 1)
+
+
+class _TokenHttp(object):
+    """Thread-safe stand-in for the token endpoint.
+
+    Hands out tokens named after the refresh token and a counter, or
+    responds with the ``(status, content)`` in ``failing`` for a refresh
+    token.
+    """
+
+    def __init__(self, expires_in=3600):
+        self.expires_in = expires_in
+        self.failing = {}
+        self.refreshed = []
+        self._lock = threading.Lock()
+
+    def request(self, uri, method='GET', body=None, headers=None,
+                redirections=None, connection_type=None):
+        refresh_token = urllib.parse.parse_qs(body)['refresh_token'][0]
+        with self._lock:
+            self.refreshed.append(refresh_token)
+            count = len(self.refreshed)
+        if refresh_token in self.failing:
+            status, content = self.failing[refresh_token]
+            return http_mock.ResponseMock({'status': status}), content
+        content = json.dumps({
+            'access_token': '{0}-{1}'.format(refresh_token, count),
+            'expires_in': self.expires_in,
+        })
+        return http_mock.ResponseMock(), content.encode('utf-8')
+
+
+def _make_credentials(name, expires_in=None):
+    if expires_in is None:
+        access_token = token_expiry = None
+    else:
+        access_token = name + '-initial'
+        token_expiry = NOW + datetime.timedelta(seconds=expires_in)
+    return client.OAuth2Credentials(
+        access_token, 'client_id', 'client_secret', name, token_expiry,
+        'https://example.com/token', None)
+
+
+class TestRateLimiter(unittest2.TestCase):
+
+    @mock.patch('time.time')
+    def test_acquire_and_delay(self, time_mock):
+        time_mock.return_value = 100.0
+        limiter = token_broker._RateLimiter(2, 3)
+        self.assertEqual(limiter.acquire(5), 3)
+        self.assertEqual(limiter.acquire(1), 0)
+        self.assertEqual(limiter.delay(), 0.5)
+
+        time_mock.return_value = 101.0
+        self.assertEqual(limiter.delay(), 0)
+        self.assertEqual(limiter.acquire(5), 2)
+
+        time_mock.return_value = 1000.0
+        self.assertEqual(limiter.acquire(5), 3)
+
+
+class TestTokenBroker(unittest2.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(client, '_UTCNOW', return_value=NOW)
+        self.utcnow = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.http = _TokenHttp()
+        self.broker = token_broker.TokenBroker(
+            http=self.http, refresh_ahead_secs=300,
+            max_refreshes_per_sec=1000, max_batch_size=10)
+
+    def _advance(self, seconds):
+        self.utcnow.return_value += datetime.timedelta(seconds=seconds)
+
+    def test_add_remove(self):
+        credentials = _make_credentials('a', 3600)
+        self.broker.add('a', credentials)
+        self.assertIn('a', self.broker)
+        self.assertEqual(len(self.broker), 1)
+        self.assertIs(self.broker.get_credentials('a'), credentials)
+
+        self.broker.remove('a')
+        self.broker.remove('a')
+        self.assertNotIn('a', self.broker)
+        self.assertIsNone(self.broker.refresh_due())
+        with self.assertRaises(KeyError):
+            self.broker.get_access_token('a')
+
+    def test_refresh_due_in_expiry_order(self):
+        self.broker.add('a', _make_credentials('a', 1000))
+        self.broker.add('b', _make_credentials('b', 400))
+        self.broker.add('c', _make_credentials('c'))
+        self.broker.add('d', mock.Mock(access_token='d', invalid=False,
+                                       token_expiry=None))
+
+        # Only the credentials without a token are due. Those expiring in
+        # less than twice refresh_ahead_secs are due halfway to expiry.
+        self.assertEqual(self.broker.refresh_due(), 200)
+        self.assertEqual(self.http.refreshed, ['c'])
+
+        self._advance(200)
+        self.assertEqual(self.broker.refresh_due(), 500)
+        self.assertEqual(self.http.refreshed, ['c', 'b'])
+        self.assertEqual(self.broker.get_access_token('b'),
+                         client.AccessTokenInfo('b-2', 3600))
+
+        self._advance(500)
+        self.broker.refresh_due()
+        self.assertEqual(self.http.refreshed, ['c', 'b', 'a'])
+        self.assertEqual(self.broker.get_access_token('a').access_token,
+                         'a-3')
+
+    def test_get_access_token_refreshes_expired(self):
+        self.broker.add('a', _make_credentials('a', 3600))
+        self.assertEqual(self.broker.get_access_token('a'),
+                         client.AccessTokenInfo('a-initial', 3600))
+        self.assertEqual(self.http.refreshed, [])
+
+        self._advance(3600)
+        self.assertEqual(self.broker.get_access_token('a'),
+                         client.AccessTokenInfo('a-1', 3600))
+        # The refresh rescheduled the credentials.
+        self.assertEqual(self.broker.refresh_due(), 3300)
+
+    def test_short_lived_tokens(self):
+        self.http.expires_in = 60
+        self.broker.add('a', _make_credentials('a'))
+        self.broker.add('b', _make_credentials('b', 3600))
+
+        # Refreshed halfway through the token lifetime, not right away.
+        self.assertEqual(self.broker.refresh_due(), 30)
+        self.assertEqual(self.broker.refresh_due(), 30)
+        self.assertEqual(self.http.refreshed, ['a'])
+
+        self._advance(30)
+        self.assertEqual(self.broker.refresh_due(), 30)
+        self.assertEqual(self.http.refreshed, ['a', 'a'])
+
+    def test_tokens_expired_when_obtained(self):
+        self.http.expires_in = 0
+        self.broker.add('a', _make_credentials('a'))
+
+        self.assertEqual(self.broker.refresh_due(),
+                         token_broker._MIN_REFRESH_INTERVAL_SECS)
+        self.assertEqual(self.http.refreshed, ['a'])
+
+    @mock.patch('time.time')
+    def test_rate_limit(self, time_mock):
+        time_mock.return_value = 100.0
+        broker = token_broker.TokenBroker(
+            http=self.http, max_refreshes_per_sec=2, max_batch_size=3)
+        for name in 'abcde':
+            broker.add(name, _make_credentials(name))
+
+        self.assertEqual(broker.refresh_due(), 0.5)
+        self.assertEqual(self.http.refreshed, ['a', 'b', 'c'])
+
+        time_mock.return_value = 101.0
+        self.assertIsNotNone(broker.refresh_due())
+        self.assertEqual(self.http.refreshed, ['a', 'b', 'c', 'd', 'e'])
+
+    @mock.patch('time.sleep')
+    @mock.patch('time.time')
+    def test_get_access_token_rate_limited(self, time_mock, sleep_mock):
+        time_mock.return_value = 100.0
+        sleep_mock.side_effect = lambda secs: setattr(
+            time_mock, 'return_value', time_mock.return_value + secs)
+        broker = token_broker.TokenBroker(
+            http=self.http, max_refreshes_per_sec=2, max_batch_size=3)
+        for name in 'abc':
+            broker.add(name, _make_credentials(name))
+        broker.refresh_due()
+        broker.add('d', _make_credentials('d'))
+
+        self.assertEqual(broker.get_access_token('d').access_token, 'd-4')
+        sleep_mock.assert_called_once_with(0.5)
+
+    @mock.patch.object(token_broker, 'logger')
+    def test_failed_refresh_retried(self, logger):
+        self.http.failing['a'] = (http_client.INTERNAL_SERVER_ERROR,
+                                  b'Internal error')
+        self.broker.add('a', _make_credentials('a'))
+
+        self.assertEqual(self.broker.refresh_due(), token_broker.RETRY_SECS)
+        self.assertEqual(logger.warning.call_count, 1)
+
+        del self.http.failing['a']
+        self._advance(token_broker.RETRY_SECS)
+        self.broker.refresh_due()
+        self.assertEqual(self.http.refreshed, ['a', 'a'])
+        self.assertEqual(self.broker.get_access_token('a').access_token,
+                         'a-2')
+
+    @mock.patch.object(token_broker, 'logger')
+    def test_invalid_credentials_not_retried(self, logger):
+        self.http.failing['a'] = (http_client.BAD_REQUEST,
+                                  b'{"error": "invalid_grant"}')
+        self.broker.add('a', _make_credentials('a'))
+
+        self.assertIsNone(self.broker.refresh_due())
+        self.assertTrue(self.broker.get_credentials('a').invalid)
+        self.assertEqual(logger.warning.call_count, 1)
+
+    def test_refresh_writes_to_storage(self):
+        storage = dictionary_storage.DictionaryStorage({}, 'key')
+        storage.put(_make_credentials('a'))
+        self.broker.add('a', storage.get())
+
+        self.broker.refresh_due()
+        self.assertEqual(storage.get().access_token, 'a-1')
+
+    def test_background_thread(self):
+        self.broker.start()
+        self.addCleanup(self.broker.stop)
+        # Starting twice is harmless.
+        self.broker.start()
+        for name in 'abcdefghijkl':
+            self.broker.add(name, _make_credentials(name))
+
+        deadline = time.time() + 10
+        while len(self.http.refreshed) < 12 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(sorted(self.http.refreshed), list('abcdefghijkl'))
+
+        self.broker.stop()
+        self.assertIsNone(self.broker._thread)
@@ -0,0 +1,136 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import json
+
+import httplib2
+import mock
+from six.moves import http_client
+import unittest2
+import urllib3
+
+from oauth2client_latest import client
+from oauth2client_latest import transport
+from oauth2client_latest.contrib import urllib3_http
+
+
+def _pool_manager_mock(*responses):
+    pool_manager = mock.Mock(spec=urllib3.PoolManager)
+    pool_manager.urlopen.side_effect = [
+        urllib3.HTTPResponse(body=content, headers=headers,
+                             status=int(status), preload_content=False)
+        for status, headers, content in responses]
+    return pool_manager
+
+
+class TestPooledHttp(unittest2.TestCase):
+
+    def test_constructor_default_pool(self):
+        http1 = urllib3_http.PooledHttp()
+        http2 = urllib3_http.PooledHttp()
+        self.assertIsInstance(http1.pool_manager, urllib3.PoolManager)
+        self.assertIs(http1.pool_manager, http2.pool_manager)
+        self.assertIsNone(http1.timeout)
+
+    def test_constructor_explicit(self):
+        pool_manager = mock.sentinel.pool_manager
+        http = urllib3_http.PooledHttp(pool_manager=pool_manager, timeout=5)
+        self.assertIs(http.pool_manager, pool_manager)
+        self.assertEqual(http.timeout, 5)
+
+    def test_request(self):
+        pool_manager = _pool_manager_mock(
+            (http_client.OK, {'Content-Type': 'application/json'}, b'{}'))
+        http = urllib3_http.PooledHttp(pool_manager=pool_manager, timeout=5)
+
+        resp, content = http.request(
+            'http://example.com', method='POST', body='foo',
+            headers={b'Authorization': b'Bearer bar'}, redirections=3)
+
+        self.assertIsInstance(resp, httplib2.Response)
+        self.assertEqual(resp.status, http_client.OK)
+        self.assertEqual(resp['status'], '200')
+        self.assertEqual(resp['content-type'], 'application/json')
+        self.assertEqual(content, b'{}')
+
+        pool_manager.urlopen.assert_called_once_with(
+            'POST', 'http://example.com', body='foo',
+            headers={'Authorization': 'Bearer bar'},
+            retries=mock.ANY, timeout=5)
+        retries = pool_manager.urlopen.call_args[1]['retries']
+        self.assertEqual(retries.redirect, 3)
+        self.assertFalse(retries.read)
+        self.assertFalse(retries.raise_on_redirect)
+
+    def test_request_defaults(self):
+        pool_manager = _pool_manager_mock(
+            (http_client.NOT_FOUND, {}, b'Not Found'))
+        http = urllib3_http.PooledHttp(pool_manager=pool_manager)
+
+        resp, content = http.request('http://example.com')
+
+        self.assertEqual(resp.status, http_client.NOT_FOUND)
+        self.assertEqual(content, b'Not Found')
+        pool_manager.urlopen.assert_called_once_with(
+            'GET', 'http://example.com', body=None, headers=None,
+            retries=mock.ANY, timeout=urllib3.Timeout.DEFAULT_TIMEOUT)
+        retries = pool_manager.urlopen.call_args[1]['retries']
+        self.assertEqual(retries.redirect, httplib2.DEFAULT_MAX_REDIRECTS)
+
+    def test_request_too_many_redirects(self):
+        pool_manager = _pool_manager_mock(
+            (http_client.FOUND, {'Location': 'http://example.com/next'},
+             b'Moved'))
+        http = urllib3_http.PooledHttp(pool_manager=pool_manager)
+
+        with self.assertRaises(httplib2.RedirectLimit) as context:
+            http.request('http://example.com', redirections=0)
+
+        resp = context.exception.response
+        self.assertEqual(resp.status, http_client.FOUND)
+        self.assertEqual(resp['location'], 'http://example.com/next')
+        self.assertEqual(context.exception.content, b'Moved')
+
+    def test_authorize_refreshes_through_pool(self):
+        token_response = json.dumps({
+            'access_token': 'new_token',
+            'expires_in': 3600,
+        }).encode('utf-8')
+        pool_manager = _pool_manager_mock(
+            (http_client.OK, {}, token_response),
+            (http_client.OK, {}, b'data'))
+        credentials = client.OAuth2Credentials(
+            None, 'client_id', 'client_secret', 'refresh_token',
+            datetime.datetime.utcnow(), 'http://example.com/token', None)
+
+        http = credentials.authorize(
+            urllib3_http.PooledHttp(pool_manager=pool_manager))
+        resp, content = http.request('http://example.com/data')
+
+        self.assertEqual(content, b'data')
+        self.assertEqual(credentials.access_token, 'new_token')
+        self.assertEqual(pool_manager.urlopen.call_count, 2)
+        refresh_call, data_call = pool_manager.urlopen.call_args_list
+        self.assertEqual(refresh_call[0],
+                         ('POST', 'http://example.com/token'))
+        self.assertEqual(data_call[1]['headers']['Authorization'],
+                         'Bearer new_token')
+
+    @mock.patch.object(transport, '_HTTP_FACTORY',
+                       new=urllib3_http.PooledHttp)
+    def test_as_http_factory(self):
+        http = transport.get_http_object(timeout=5)
+        self.assertIsInstance(http, urllib3_http.PooledHttp)
+        self.assertEqual(http.timeout, 5)
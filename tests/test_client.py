@@ -26,10 +26,14 @@ import os
 import socket
 import sys
 import tempfile
+import threading
 
+import httplib2
 import mock
 import six
+from six.moves import BaseHTTPServer
 from six.moves import http_client
+from six.moves import socketserver
 from six.moves import urllib
 import unittest2
 
@@ -210,6 +214,26 @@ class CredentialsTests(unittest2.TestCase):
         with self.assertRaises(AttributeError):
             client.Credentials.new_from_json(json_data)
 
+    def test_new_from_json_class_cache(self):
+        for kls in (client.OAuth2Credentials, client.GoogleCredentials,
+                    service_account.ServiceAccountCredentials):
+            key = (kls.__module__, kls.__name__)
+            self.assertIs(client._CREDENTIALS_CLASSES[key], kls)
+
+        key = ('oauth2client_latest.googleapiclient.client', 'Credentials')
+        json_data = json.dumps({'_module': key[0], '_class': key[1]})
+        with mock.patch.dict(client._CREDENTIALS_CLASSES):
+            client._CREDENTIALS_CLASSES.pop(key, None)
+            client.Credentials.new_from_json(json_data)
+            self.assertIs(client._CREDENTIALS_CLASSES[key], client.Credentials)
+
+            # Remembered classes are used without importing their module.
+            kls = mock.Mock()
+            client._CREDENTIALS_CLASSES[key] = kls
+            self.assertIs(client.Credentials.new_from_json(json_data),
+                          kls.from_json.return_value)
+            kls.from_json.assert_called_once_with(json_data)
+
     def test_from_json(self):
         unused_data = {}
         credentials = client.Credentials.from_json(unused_data)
@@ -873,7 +897,8 @@ class BasicCredentialsTests(unittest2.TestCase):
         client_id = 'some_client_id'
         client_secret = 'cOuDdkfjxxnv+'
         refresh_token = '1/0/a.df219fjls0'
-        token_expiry = datetime.datetime.utcnow()
+        token_expiry = (datetime.datetime.utcnow() +
+                        datetime.timedelta(seconds=3600))
         user_agent = 'refresh_checker/1.0'
         self.credentials = client.OAuth2Credentials(
             access_token, client_id, client_secret,
@@ -938,6 +963,39 @@ class BasicCredentialsTests(unittest2.TestCase):
             self.assertTrue(self.credentials.access_token_expired)
             self.assertEqual(None, self.credentials.token_response)
 
+    def test_expired_token_refreshed_before_request(self):
+        self.credentials.token_expiry = datetime.datetime.utcnow()
+        token_response = {'access_token': '1/3w', 'expires_in': 3600}
+        http = http_mock.HttpMockSequence([
+            ({'status': http_client.OK},
+             json.dumps(token_response).encode('utf-8')),
+            ({'status': http_client.OK}, 'echo_request_headers'),
+        ])
+        http = self.credentials.authorize(http)
+        resp, content = http.request('http://example.com')
+        self.assertEqual(b'Bearer 1/3w', content[b'Authorization'])
+        self.assertEqual(self.credentials.token_response, token_response)
+
+    def test_token_refreshed_concurrently(self):
+        http = http_mock.HttpMockSequence([
+            ({'status': http_client.UNAUTHORIZED}, b''),
+            ({'status': http_client.OK}, 'echo_request_headers'),
+        ])
+        orig_request = http.request
+
+        def request(*args, **kwargs):
+            result = orig_request(*args, **kwargs)
+            # Another thread refreshes while this request is in flight.
+            self.credentials.access_token = 'refreshed'
+            return result
+
+        http.request = request
+        http = self.credentials.authorize(http)
+        with mock.patch.object(self.credentials, '_refresh') as refresh:
+            resp, content = http.request('http://example.com')
+        refresh.assert_not_called()
+        self.assertEqual(b'Bearer refreshed', content[b'Authorization'])
+
     def test_token_revoke_success(self):
         _token_revoke_test_helper(
             self, '200', revoke_raise=False,
@@ -972,6 +1030,44 @@ class BasicCredentialsTests(unittest2.TestCase):
 
         self.assertEqual(instance.__dict__, self.credentials.__dict__)
 
+    def test_to_from_compact_json(self):
+        self.credentials.token_response = {'access_token': 'foo'}
+        self.credentials.id_token = {'sub': '123'}
+        self.credentials.invalid = True
+        compact = self.credentials.to_compact_json()
+        self.assertLess(len(compact), len(self.credentials.to_json()))
+        self.assertEqual(json.loads(compact)[:2],
+                         [client.COMPACT_JSON_VERSION, 'oauth2'])
+
+        instance = client.Credentials.new_from_json(compact)
+        self.assertEqual(client.OAuth2Credentials, type(instance))
+        self.assertEqual(instance.token_expiry,
+                         self.credentials.token_expiry.replace(microsecond=0))
+        instance.token_expiry = self.credentials.token_expiry
+        self.assertEqual(instance.__dict__, self.credentials.__dict__)
+
+        compact = self.credentials.to_compact_json(strip_token_response=True)
+        instance = client.Credentials.new_from_json(compact.encode('utf-8'))
+        self.assertIsNone(instance.token_response)
+        self.assertEqual(instance.id_token, {'sub': '123'})
+
+    def test_to_compact_json_fallback(self):
+        # Subclasses are written by to_json(), as they may add members.
+        credentials = client.GoogleCredentials(
+            'foo', 'client_id', 'client_secret', 'refresh_token', None,
+            oauth2client_latest.GOOGLE_TOKEN_URI, 'user_agent')
+        self.assertEqual(credentials.to_compact_json(), credentials.to_json())
+
+    def test_new_from_json_compact_unsupported(self):
+        compact = json.loads(self.credentials.to_compact_json())
+        compact[0] = client.COMPACT_JSON_VERSION + 1
+        with self.assertRaises(ValueError):
+            client.Credentials.new_from_json(json.dumps(compact))
+
+        compact[:2] = [client.COMPACT_JSON_VERSION, 'nope']
+        with self.assertRaises(ValueError):
+            client.Credentials.new_from_json(json.dumps(compact))
+
     def test_from_json_token_expiry(self):
         data = json.loads(self.credentials.to_json())
         data['token_expiry'] = None
@@ -989,7 +1085,8 @@ class BasicCredentialsTests(unittest2.TestCase):
         client_id = u'some_client_id'
         client_secret = u'cOuDdkfjxxnv+'
         refresh_token = u'1/0/a.df219fjls0'
-        token_expiry = str(datetime.datetime.utcnow())
+        token_expiry = (datetime.datetime.utcnow() +
+                        datetime.timedelta(seconds=3600))
         token_uri = str(oauth2client_latest.GOOGLE_TOKEN_URI)
         revoke_uri = str(oauth2client_latest.GOOGLE_REVOKE_URI)
         user_agent = u'refresh_checker/1.0'
@@ -1019,7 +1116,8 @@ class BasicCredentialsTests(unittest2.TestCase):
         client_id = u'some_client_id'
         client_secret = u'cOuDdkfjxxnv+'
         refresh_token = u'1/0/a.df219fjls0'
-        token_expiry = str(datetime.datetime.utcnow())
+        token_expiry = (datetime.datetime.utcnow() +
+                        datetime.timedelta(seconds=3600))
         token_uri = str(oauth2client_latest.GOOGLE_TOKEN_URI)
         revoke_uri = str(oauth2client_latest.GOOGLE_REVOKE_URI)
         user_agent = u'refresh_checker/1.0'
@@ -1469,6 +1567,377 @@ class BasicCredentialsTests(unittest2.TestCase):
             self.assertEqual(self.credentials.id_token, body)
 
 
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn,
+                           BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class _TokenEndpointHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Stub token endpoint that counts refresh POSTs."""
+
+    def do_POST(self):
+        server = self.server
+        with server.lock:
+            server.refresh_posts += 1
+        self.rfile.read(int(self.headers['content-length']))
+        server.before_response()
+        self.send_response(server.status)
+        self.send_header('content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(server.content)
+
+    def do_GET(self):
+        self.send_response(http_client.OK)
+        self.send_header('content-length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class _JoinCountingEvent(object):
+    """Wraps a refresh call's Event to signal each thread that joins it."""
+
+    def __init__(self, event, joined):
+        self._event = event
+        self._joined = joined
+
+    def set(self):
+        self._event.set()
+
+    def wait(self):
+        self._joined.release()
+        self._event.wait()
+
+
+class RefreshFlightTests(unittest2.TestCase):
+
+    num_threads = 64
+
+    def setUp(self):
+        self.server = _ThreadingHTTPServer(('localhost', 0),
+                                           _TokenEndpointHandler)
+        self.server.lock = threading.Lock()
+        self.server.refresh_posts = 0
+        self.server.before_response = self._wait_for_joiners
+        server_thread = threading.Thread(target=self.server.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+
+        self.base_uri = 'http://localhost:{0}'.format(
+            self.server.server_address[1])
+        self.credentials = client.OAuth2Credentials(
+            'old_token', 'client_id', 'client_secret', 'refresh_token',
+            datetime.datetime.utcnow(), self.base_uri + '/token',
+            'user_agent')
+        self.flight = client._get_refresh_flight(self.credentials)
+
+        self.joined = threading.Semaphore(0)
+        refresh_call = client._RefreshCall
+
+        def counting_refresh_call():
+            call = refresh_call()
+            call.done = _JoinCountingEvent(call.done, self.joined)
+            return call
+
+        patcher = mock.patch.object(client, '_RefreshCall',
+                                    counting_refresh_call)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _wait_for_joiners(self):
+        # Hold the refresh open until every other thread has joined it.
+        for _ in range(self.num_threads - 1):
+            self.joined.acquire()
+
+    def _run_concurrently(self, func):
+        errors = []
+
+        def target():
+            try:
+                func()
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=target)
+                   for _ in range(self.num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def _refresh_concurrently(self):
+        return self._run_concurrently(
+            lambda: self.credentials._refresh(httplib2.Http().request))
+
+    def _set_token_response(self):
+        self.server.status = http_client.OK
+        self.server.content = json.dumps(
+            {'access_token': 'new_token', 'expires_in': 3600}).encode('utf-8')
+
+    def test_single_refresh_request(self):
+        self._set_token_response()
+
+        errors = self._refresh_concurrently()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(self.server.refresh_posts, 1)
+        self.assertEqual(self.credentials.access_token, 'new_token')
+        self.assertFalse(self.credentials.access_token_expired)
+        self.assertIsNone(self.flight._call)
+
+    def test_single_refresh_request_failure(self):
+        self.server.status = http_client.BAD_REQUEST
+        self.server.content = b'{"error": "invalid_grant"}'
+
+        errors = self._refresh_concurrently()
+
+        self.assertEqual(self.server.refresh_posts, 1)
+        self.assertEqual(len(errors), self.num_threads)
+        for error in errors:
+            self.assertIsInstance(error, client.HttpAccessTokenRefreshError)
+            self.assertEqual(error.status, http_client.BAD_REQUEST)
+        self.assertTrue(self.credentials.invalid)
+        self.assertIsNone(self.flight._call)
+
+    def test_authorized_requests_refresh_once(self):
+        # Threads that only start refreshing after the first refresh has
+        # finished must not send another one, however they are scheduled.
+        self._set_token_response()
+        self.server.before_response = lambda: None
+
+        def request():
+            http = self.credentials.authorize(httplib2.Http())
+            resp, _ = http.request(self.base_uri + '/resource')
+            self.assertEqual(resp.status, http_client.OK)
+
+        errors = self._run_concurrently(request)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(self.server.refresh_posts, 1)
+        self.assertEqual(self.credentials.access_token, 'new_token')
+
+    def test_refresh_after_flight_finished(self):
+        self._set_token_response()
+        self.server.before_response = lambda: None
+        http = httplib2.Http()
+        self.credentials._refresh(http.request)
+        self.assertEqual(self.server.refresh_posts, 1)
+
+        # A thread that saw the expired token before that refresh finished.
+        self.credentials._refresh_if(
+            http.request, lambda: self.credentials.access_token_expired)
+        self.assertEqual(self.server.refresh_posts, 1)
+
+        self.credentials._refresh_if(http.request, lambda: True)
+        self.assertEqual(self.server.refresh_posts, 2)
+
+    def test_sequential_refreshes(self):
+        self._set_token_response()
+        self.server.before_response = lambda: None
+
+        http = httplib2.Http()
+        self.credentials._refresh(http.request)
+        self.credentials._refresh(http.request)
+
+        self.assertEqual(self.server.refresh_posts, 2)
+
+    def test_flight_not_serialized(self):
+        self.assertIs(client._get_refresh_flight(self.credentials),
+                      self.flight)
+        self.assertNotIn('_RefreshFlight', self.credentials.to_json())
+        self.assertNotIn('flight', self.credentials.__getstate__())
+
+
+class RefreshAheadTests(unittest2.TestCase):
+
+    def setUp(self):
+        self.now = datetime.datetime(2016, 1, 1)
+        utcnow_patch = mock.patch('oauth2client_latest.client._UTCNOW',
+                                  return_value=self.now)
+        utcnow_patch.start()
+        self.addCleanup(utcnow_patch.stop)
+        timer_patch = mock.patch.object(client.threading, 'Timer')
+        self.timer = timer_patch.start()
+        self.addCleanup(timer_patch.stop)
+
+        self.credentials = client.OAuth2Credentials(
+            'old_token', 'client_id', 'client_secret', 'refresh_token',
+            self.now + datetime.timedelta(seconds=3600),
+            oauth2client_latest.GOOGLE_TOKEN_URI, 'user_agent')
+        self.addCleanup(self.credentials.disable_refresh_ahead)
+
+    def _refresh_ahead(self):
+        return client._refresh_aheads[self.credentials]
+
+    def test_enable(self):
+        self.credentials.enable_refresh_ahead(skew_secs=300)
+        refresh_ahead = self._refresh_ahead()
+        self.timer.assert_called_once_with(3300, refresh_ahead._run)
+        self.assertTrue(self.timer.return_value.daemon)
+        self.timer.return_value.start.assert_called_once_with()
+
+    def test_enable_default_skew(self):
+        self.credentials.enable_refresh_ahead()
+        self.timer.assert_called_once_with(
+            3600 - client.REFRESH_AHEAD_SECS, self._refresh_ahead()._run)
+
+    def test_enable_no_expiry(self):
+        self.credentials.token_expiry = None
+        self.credentials.enable_refresh_ahead()
+        self.timer.assert_not_called()
+
+    def test_enable_no_access_token(self):
+        self.credentials.access_token = None
+        self.credentials.enable_refresh_ahead()
+        self.timer.assert_called_once_with(0, self._refresh_ahead()._run)
+
+    def test_enable_invalid(self):
+        self.credentials.invalid = True
+        self.credentials.enable_refresh_ahead()
+        self.timer.assert_not_called()
+
+    def test_disable(self):
+        self.credentials.enable_refresh_ahead()
+        self.credentials.disable_refresh_ahead()
+        self.timer.return_value.cancel.assert_called_once_with()
+        self.assertNotIn(self.credentials, client._refresh_aheads)
+
+    def test_run_refreshes_through_store(self):
+        store = mock.Mock(spec=client.Storage)
+        store.locked_get.return_value = None
+        self.credentials.set_store(store)
+        token_response = {'access_token': 'new_token', 'expires_in': 3600}
+        http = http_mock.HttpMock(
+            data=json.dumps(token_response).encode('utf-8'))
+        self.credentials.enable_refresh_ahead(http=http, skew_secs=300)
+        refresh_ahead = self._refresh_ahead()
+        self.timer.reset_mock()
+        self.credentials.token_expiry = self.now
+
+        refresh_ahead._run()
+
+        self.assertEqual(self.credentials.access_token, 'new_token')
+        self.assertEqual(http.uri, oauth2client_latest.GOOGLE_TOKEN_URI)
+        store.locked_put.assert_called_once_with(self.credentials)
+        self.timer.assert_called_once_with(3300, refresh_ahead._run)
+
+    def test_run_short_lived_token(self):
+        token_response = {'access_token': 'new_token', 'expires_in': 60}
+        http = http_mock.HttpMock(
+            data=json.dumps(token_response).encode('utf-8'))
+        self.credentials.enable_refresh_ahead(http=http, skew_secs=300)
+        refresh_ahead = self._refresh_ahead()
+        self.timer.reset_mock()
+        self.credentials.token_expiry = self.now
+
+        refresh_ahead._run()
+
+        # Refreshed halfway through the token lifetime, not right away.
+        self.assertEqual(self.credentials.access_token, 'new_token')
+        self.timer.assert_called_once_with(30, refresh_ahead._run)
+        self.timer.reset_mock()
+        with mock.patch.object(self.credentials, '_refresh') as refresh:
+            refresh_ahead._run()
+        refresh.assert_not_called()
+        self.timer.assert_called_once_with(30, refresh_ahead._run)
+
+    def test_run_token_expired_when_obtained(self):
+        token_response = {'access_token': 'new_token', 'expires_in': 0}
+        http = http_mock.HttpMock(
+            data=json.dumps(token_response).encode('utf-8'))
+        self.credentials.enable_refresh_ahead(http=http, skew_secs=300)
+        refresh_ahead = self._refresh_ahead()
+        self.timer.reset_mock()
+        self.credentials.token_expiry = self.now
+
+        refresh_ahead._run()
+
+        self.timer.assert_called_once_with(
+            client._REFRESH_AHEAD_MIN_INTERVAL_SECS, refresh_ahead._run)
+
+    def test_run_already_refreshed(self):
+        self.credentials.enable_refresh_ahead(skew_secs=300)
+        refresh_ahead = self._refresh_ahead()
+        self.timer.reset_mock()
+
+        with mock.patch.object(self.credentials, '_refresh') as refresh:
+            refresh_ahead._run()
+
+        refresh.assert_not_called()
+        self.timer.assert_called_once_with(3300, refresh_ahead._run)
+
+    def test_run_failure_retries(self):
+        self.credentials.enable_refresh_ahead(http=object())
+        refresh_ahead = self._refresh_ahead()
+        self.timer.reset_mock()
+        self.credentials.token_expiry = self.now
+
+        with mock.patch.object(self.credentials, '_refresh',
+                               side_effect=client.HttpAccessTokenRefreshError):
+            refresh_ahead._run()
+
+        self.timer.assert_called_once_with(
+            client._REFRESH_AHEAD_RETRY_SECS, refresh_ahead._run)
+
+    def test_run_failure_invalid(self):
+        self.credentials.enable_refresh_ahead(http=mock.Mock())
+        refresh_ahead = self._refresh_ahead()
+        self.timer.reset_mock()
+        self.credentials.token_expiry = self.now
+
+        def refresh(http_request):
+            self.credentials.invalid = True
+            raise client.HttpAccessTokenRefreshError
+
+        with mock.patch.object(self.credentials, '_refresh',
+                               side_effect=refresh) as refresh_mock:
+            refresh_ahead._run()
+
+        refresh_mock.assert_called_once_with(mock.ANY)
+        self.timer.assert_not_called()
+
+    def test_run_invalid(self):
+        self.credentials.enable_refresh_ahead(http=mock.Mock())
+        refresh_ahead = self._refresh_ahead()
+        self.timer.reset_mock()
+        self.credentials.invalid = True
+
+        with mock.patch.object(self.credentials, '_refresh') as refresh:
+            refresh_ahead._run()
+
+        refresh.assert_not_called()
+        self.timer.assert_not_called()
+
+    def test_run_after_disable(self):
+        self.credentials.enable_refresh_ahead()
+        refresh_ahead = self._refresh_ahead()
+        self.credentials.disable_refresh_ahead()
+        self.timer.reset_mock()
+
+        with mock.patch.object(self.credentials, '_refresh') as refresh:
+            refresh_ahead._run()
+
+        refresh.assert_not_called()
+        self.timer.assert_not_called()
+
+    def test_credentials_not_kept_alive(self):
+        credentials = client.OAuth2Credentials(
+            'old_token', 'client_id', 'client_secret', 'refresh_token',
+            self.now, oauth2client_latest.GOOGLE_TOKEN_URI, 'user_agent')
+        credentials.enable_refresh_ahead()
+        refresh_ahead = client._refresh_aheads[credentials]
+        del credentials
+
+        refresh_ahead._run()
+        self.assertEqual(self.timer.call_count, 1)
+
+
 class AccessTokenCredentialsTests(unittest2.TestCase):
 
     def setUp(self):
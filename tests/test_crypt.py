@@ -144,6 +144,30 @@ class Test__verify_signature(unittest2.TestCase):
             verifier.verify.assert_called_once_with(message, signature)
 
 
+class Test__get_key_id(unittest2.TestCase):
+
+    def test_success(self):
+        header = _helpers._urlsafe_b64encode(b'{"alg": "RS256", "kid": "a"}')
+        self.assertEqual(crypt._get_key_id(header), 'a')
+
+    def test_missing_kid(self):
+        header = _helpers._urlsafe_b64encode(b'{"alg": "RS256"}')
+        self.assertIsNone(crypt._get_key_id(header))
+
+    def test_non_string_kid(self):
+        header = _helpers._urlsafe_b64encode(b'{"kid": ["a"]}')
+        self.assertIsNone(crypt._get_key_id(header))
+
+    def test_not_a_dict(self):
+        header = _helpers._urlsafe_b64encode(b'["a"]')
+        self.assertIsNone(crypt._get_key_id(header))
+
+    def test_bad_json(self):
+        header = _helpers._urlsafe_b64encode(b'{BADJSON')
+        self.assertIsNone(crypt._get_key_id(header))
+        self.assertIsNone(crypt._get_key_id(b'header'))
+
+
 class Test__check_audience(unittest2.TestCase):
 
     def test_null_audience(self):
@@ -311,3 +335,39 @@ class Test_verify_signed_jwt_with_certs(unittest2.TestCase):
         verify_time.assert_called_once_with(payload_dict)
         check_aud.assert_called_once_with(payload_dict, audience)
         certs.values.assert_called_once_with()
+
+    @mock.patch('oauth2client_latest.crypt._check_audience')
+    @mock.patch('oauth2client_latest.crypt._verify_time_range')
+    @mock.patch('oauth2client_latest.crypt._verify_signature')
+    def _check_key_id(self, key_id, expected_certs, verify_sig,
+                      verify_time, check_aud):
+        certs = {'a': 'cert-a', 'b': 'cert-b'}
+        header = _helpers._urlsafe_b64encode(
+            _helpers._json_encode({'alg': 'RS256', 'kid': key_id}))
+        payload = _helpers._urlsafe_b64encode(b'{"a": "b"}')
+        jwt = b'.'.join([header, payload, b'c2lnbmF0dXJl'])
+
+        crypt.verify_signed_jwt_with_certs(jwt, certs)
+
+        verify_sig.assert_called_once_with(
+            header + b'.' + payload, b'signature', mock.ANY)
+        self.assertEqual(sorted(verify_sig.call_args[0][2]), expected_certs)
+
+    def test_known_key_id(self):
+        self._check_key_id('b', ['cert-b'])
+
+    def test_unknown_key_id(self):
+        self._check_key_id('c', ['cert-a', 'cert-b'])
+
+    def test_key_id_failure(self):
+        # When the header names a certificate, the others are not tried.
+        verifiers = {'a': mock.Mock(), 'b': mock.Mock()}
+        verifiers['a'].verify.return_value = True
+        verifiers['b'].verify.return_value = False
+        header = _helpers._urlsafe_b64encode(b'{"kid": "b"}')
+        payload = _helpers._urlsafe_b64encode(b'{"a": "b"}')
+        jwt = b'.'.join([header, payload, b'c2lnbmF0dXJl'])
+
+        with self.assertRaises(crypt.AppIdentityError):
+            crypt.verify_signed_jwt_with_certs(jwt, verifiers)
+        self.assertFalse(verifiers['a'].verify.called)
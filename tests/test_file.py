@@ -20,10 +20,12 @@ Unit tests for oauth2client_latest.file
 import copy
 import datetime
 import json
+import multiprocessing
 import os
 import pickle
 import stat
 import tempfile
+import time
 import warnings
 
 import mock
@@ -257,3 +259,201 @@ class oauth2client_latestFileTests(unittest2.TestCase):
         if os.name == 'posix':  # pragma: NO COVER
             mode = os.stat(FILENAME).st_mode
             self.assertEquals('0o600', oct(stat.S_IMODE(mode)))
+
+    def test_put_replaces_file(self):
+        storage = file.Storage(FILENAME)
+        storage.put(self._create_test_credentials(client_id='old'))
+        if os.name == 'posix':  # pragma: NO COVER
+            os.chmod(FILENAME, 0o640)
+
+        # A reader that opened the file before the write still reads the
+        # old credentials in full.
+        with open(FILENAME, 'rb') as old_file:
+            storage.put(self._create_test_credentials(client_id='new'))
+            old_credentials = client.Credentials.new_from_json(
+                old_file.read())
+        self.assertEqual(old_credentials.client_id, 'old')
+        self.assertEqual(storage.get().client_id, 'new')
+
+        if os.name == 'posix':  # pragma: NO COVER
+            mode = os.stat(FILENAME).st_mode
+            self.assertEquals('0o640', oct(stat.S_IMODE(mode)))
+        directory, basename = os.path.split(FILENAME)
+        self.assertEqual(
+            [name for name in os.listdir(directory)
+             if name.startswith('.' + basename)], [])
+
+    def test_put_failure_keeps_file(self):
+        storage = file.Storage(FILENAME)
+        storage.put(self._create_test_credentials(client_id='old'))
+        credentials = mock.Mock()
+        credentials.to_json.side_effect = ValueError
+
+        with self.assertRaises(ValueError):
+            storage.put(credentials)
+
+        self.assertEqual(storage.get().client_id, 'old')
+        directory, basename = os.path.split(FILENAME)
+        self.assertEqual(
+            [name for name in os.listdir(directory)
+             if name.startswith('.' + basename)], [])
+
+    def test_put_directory_not_writable(self):
+        storage = file.Storage(FILENAME)
+        storage.put(self._create_test_credentials(client_id='old'))
+        inode = os.stat(FILENAME).st_ino
+
+        with mock.patch('tempfile.mkstemp', side_effect=OSError):
+            storage.put(self._create_test_credentials(client_id='new'))
+
+        self.assertEqual(storage.get().client_id, 'new')
+        self.assertEqual(os.stat(FILENAME).st_ino, inode)
+
+    def test_put_new_file_directory_not_writable(self):
+        if os.path.exists(FILENAME):
+            os.unlink(FILENAME)
+        storage = file.Storage(FILENAME)
+        with mock.patch('tempfile.mkstemp', side_effect=OSError):
+            with self.assertRaises(OSError):
+                storage.put(self._create_test_credentials())
+        self.assertFalse(os.path.exists(FILENAME))
+
+    def test_put_keeps_hard_links(self):
+        storage = file.Storage(FILENAME)
+        storage.put(self._create_test_credentials(client_id='old'))
+        link = FILENAME + '.link'
+        os.link(FILENAME, link)
+        self.addCleanup(os.unlink, link)
+
+        storage.put(self._create_test_credentials(client_id='new'))
+
+        self.assertEqual(file.Storage(link).get().client_id, 'new')
+        self.assertEqual(os.stat(link).st_ino, os.stat(FILENAME).st_ino)
+
+    @unittest2.skipIf(os.name != 'posix' or os.geteuid() != 0,
+                      'Changing the owner of a file requires root.')
+    def test_put_keeps_owner(self):  # pragma: NO COVER
+        storage = file.Storage(FILENAME)
+        storage.put(self._create_test_credentials(client_id='old'))
+        os.chown(FILENAME, 12345, 23456)
+
+        storage.put(self._create_test_credentials(client_id='new'))
+
+        file_stat = os.stat(FILENAME)
+        self.assertEqual((file_stat.st_uid, file_stat.st_gid),
+                         (12345, 23456))
+        self.assertEqual(storage.get().client_id, 'new')
+
+    @unittest2.skipIf(os.name != 'posix' or os.geteuid() != 0,
+                      'Changing the owner of a file requires root.')
+    def test_put_owner_not_kept_in_place(self):  # pragma: NO COVER
+        storage = file.Storage(FILENAME)
+        storage.put(self._create_test_credentials(client_id='old'))
+        os.chown(FILENAME, 12345, 23456)
+        inode = os.stat(FILENAME).st_ino
+
+        with mock.patch('os.chown', side_effect=OSError):
+            storage.put(self._create_test_credentials(client_id='new'))
+
+        self.assertEqual(os.stat(FILENAME).st_ino, inode)
+        self.assertEqual(os.stat(FILENAME).st_uid, 12345)
+        self.assertEqual(storage.get().client_id, 'new')
+        directory, basename = os.path.split(FILENAME)
+        self.assertEqual(
+            [name for name in os.listdir(directory)
+             if name.startswith('.' + basename)], [])
+
+    @mock.patch('os.fsync')
+    def test_put_fsync_every_write(self, fsync):
+        storage = file.Storage(FILENAME, fsync_interval=0)
+        storage.put(self._create_test_credentials())
+        # The file, then the directory on POSIX.
+        self.assertGreaterEqual(fsync.call_count, 1)
+        self.assertEqual(storage.get().client_id, 'some_client_id')
+
+    @mock.patch('os.fsync')
+    @mock.patch('threading.Timer')
+    def test_put_fsync_batched(self, timer, fsync):
+        storage = file.Storage(FILENAME, fsync_interval=5)
+        for unused_i in range(3):
+            storage.put(self._create_test_credentials())
+        self.assertEqual(fsync.call_count, 0)
+        timer.assert_called_once_with(5, storage._fsync)
+        timer.return_value.start.assert_called_once_with()
+
+        storage._fsync()
+        self.assertGreaterEqual(fsync.call_count, 1)
+        # The next write schedules another flush.
+        storage.put(self._create_test_credentials())
+        self.assertEqual(timer.call_count, 2)
+
+    @mock.patch('os.fsync', side_effect=OSError)
+    def test_fsync_failure_logged(self, fsync):
+        storage = file.Storage(FILENAME, fsync_interval=5)
+        with mock.patch.object(file, 'logger') as logger:
+            storage._fsync()
+        self.assertEqual(logger.warning.call_count, 1)
+
+    def test_interprocess_refresh_waits_for_other_process(self):
+        credentials = self._create_test_credentials()
+        storage = file.Storage(FILENAME, interprocess_lock=True,
+                               lock_timeout=10)
+        storage.put(credentials)
+        credentials.set_store(storage)
+        ready_event = multiprocessing.Event()
+
+        def refresh_in_child():  # pragma: NO COVER
+            child_storage = file.Storage(FILENAME, interprocess_lock=True)
+            child_storage.acquire_lock()
+            ready_event.set()
+            time.sleep(0.2)
+            new_credentials = self._create_test_credentials(
+                expiration=datetime.datetime.utcnow() +
+                datetime.timedelta(seconds=3600))
+            new_credentials.access_token = 'child_token'
+            child_storage.locked_put(new_credentials)
+            child_storage.release_lock()
+
+        child = multiprocessing.Process(target=refresh_in_child)
+        child.start()
+        try:
+            ready_event.wait()
+            http = mock.Mock()
+            credentials.refresh(http)
+        finally:
+            child.join(5)
+
+        self.assertFalse(http.request.called)
+        self.assertEqual(credentials.access_token, 'child_token')
+        self.assertFalse(storage._read_only)
+
+    def test_interprocess_lock_timeout_read_only(self):
+        storage = file.Storage(FILENAME, interprocess_lock=True,
+                               lock_timeout=0)
+        storage.put(self._create_test_credentials(client_id='old'))
+        ready_event = multiprocessing.Event()
+        die_event = multiprocessing.Event()
+
+        def hold_lock():  # pragma: NO COVER
+            child_storage = file.Storage(FILENAME, interprocess_lock=True)
+            child_storage.acquire_lock()
+            ready_event.set()
+            die_event.wait()
+            child_storage.release_lock()
+
+        child = multiprocessing.Process(target=hold_lock)
+        child.start()
+        try:
+            ready_event.wait()
+            with mock.patch.object(file, 'logger') as logger:
+                storage.put(self._create_test_credentials(client_id='new'))
+                storage.delete()
+            self.assertEqual(logger.warning.call_count, 2)
+        finally:
+            die_event.set()
+            child.join(5)
+
+        self.assertFalse(storage._read_only)
+        self.assertEqual(storage.get().client_id, 'old')
+        storage.put(self._create_test_credentials(client_id='new'))
+        self.assertEqual(storage.get().client_id, 'new')
@@ -14,10 +14,15 @@
 
 """Unit tests for JWT related methods in oauth2client_latest."""
 
+import datetime
+import json
+from multiprocessing import pool as multiprocessing_pool
 import os
 import tempfile
+import threading
 import time
 
+import httplib2
 import mock
 import unittest2
 
@@ -114,6 +119,15 @@ class CryptTests(unittest2.TestCase):
         self.assertEqual('billy bob', contents['user'])
         self.assertEqual('data', contents['metadata']['meta'])
 
+    def test_verify_id_token_with_verifiers(self):
+        jwt = self._create_signed_jwt()
+        verifier = self.verifier.from_string(datafile('public_cert.pem'),
+                                             is_x509_cert=True)
+        audience = 'some_audience_address@testing.gserviceaccount.com'
+        contents = crypt.verify_signed_jwt_with_certs(
+            jwt, {'foo': verifier}, audience)
+        self.assertEqual('billy bob', contents['user'])
+
     def test_verify_id_token_with_certs_uri(self):
         jwt = self._create_signed_jwt()
 
@@ -232,6 +246,304 @@ class PEMCryptTestsOpenSSL(CryptTests):
         self.verifier = crypt.OpenSSLVerifier
 
 
+class CertificateSetTests(unittest2.TestCase):
+
+    NOW = datetime.datetime(2016, 1, 1)
+
+    def setUp(self):
+        self.certificate_set = client._CertificateSet('http://example.com')
+        patcher = mock.patch.object(client, '_UTCNOW', return_value=self.NOW)
+        self.utcnow = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _advance(self, seconds):
+        self.utcnow.return_value += datetime.timedelta(seconds=seconds)
+
+    def test_reused_within_max_age(self):
+        http = HttpMockSequence([
+            ({'status': '200', 'cache-control': 'public, max-age=3600'},
+             datafile('certs.json')),
+        ])
+        verifiers = self.certificate_set.get_verifiers(http)
+        self.assertEqual(list(verifiers), ['foo'])
+        self.assertIsInstance(verifiers['foo'], crypt.Verifier)
+
+        self._advance(3000)
+        self.assertIs(self.certificate_set.get_verifiers(http), verifiers)
+        self.assertEqual(len(http.requests), 1)
+        self.assertEqual(http.requests[0]['uri'], 'http://example.com')
+
+    def test_refetched_without_max_age(self):
+        http = HttpMockSequence([
+            ({'status': '200'}, datafile('certs.json')),
+            ({'status': '200'}, datafile('certs.json')),
+        ])
+        verifiers = self.certificate_set.get_verifiers(http)
+        self.assertIsNone(self.certificate_set.cached_verifiers())
+        # Unchanged certificates are not parsed again.
+        self.assertIs(self.certificate_set.get_verifiers(http), verifiers)
+        self.assertEqual(len(http.requests), 2)
+
+    def test_refetched_after_max_age(self):
+        http = HttpMockSequence([
+            ({'status': '200', 'cache-control': 'max-age=60'},
+             datafile('certs.json')),
+            ({'status': '200', 'cache-control': 'max-age=60'},
+             b'{"bar": ' + json.dumps(
+                 datafile('public_cert.pem').decode('ascii')).encode('ascii')
+             + b'}'),
+        ])
+        self.certificate_set.get_verifiers(http)
+        self._advance(60)
+        verifiers = self.certificate_set.get_verifiers(http)
+        self.assertEqual(list(verifiers), ['bar'])
+        self.assertEqual(len(http.requests), 2)
+
+    def test_bad_status(self):
+        http = HttpMockSequence([({'status': '404'}, b'')])
+        with self.assertRaises(client.VerifyJwtTokenError):
+            self.certificate_set.get_verifiers(http)
+
+    @mock.patch('threading.Thread')
+    def test_background_refetch(self, thread_class):
+        http = HttpMockSequence([
+            ({'status': '200', 'cache-control': 'max-age=3600'},
+             datafile('certs.json')),
+            ({'status': '200', 'cache-control': 'max-age=7200'},
+             datafile('certs.json')),
+        ])
+        verifiers = self.certificate_set.get_verifiers(http)
+        self._advance(3600 - 300)
+        self.assertIs(self.certificate_set.get_verifiers(http), verifiers)
+        # Only one refetch is started at a time.
+        self.assertIs(self.certificate_set.get_verifiers(http), verifiers)
+        thread_class.assert_called_once_with(
+            target=self.certificate_set._refetch)
+        thread_class.return_value.start.assert_called_once_with()
+
+        self.assertEqual(len(http.requests), 1)
+        # Other http objects than httplib2.Http are reused as they are.
+        self.certificate_set._refetch()
+        self.assertEqual(len(http.requests), 2)
+        self.assertFalse(self.certificate_set._refetching)
+        self._advance(3600)
+        self.assertIs(self.certificate_set.cached_verifiers(), verifiers)
+
+    def test_background_http(self):
+        proxy_info = httplib2.ProxyInfo(
+            httplib2.socks.PROXY_TYPE_HTTP, 'proxy.example.com', 8080)
+        http = httplib2.Http(timeout=5, proxy_info=proxy_info,
+                             ca_certs='ca.pem',
+                             disable_ssl_certificate_validation=True)
+        background_http = client._background_http(http)
+        # httplib2.Http objects are not shared with the background thread.
+        self.assertIsNot(background_http, http)
+        self.assertIsInstance(background_http, httplib2.Http)
+        self.assertEqual(background_http.timeout, 5)
+        self.assertIs(background_http.proxy_info, proxy_info)
+        self.assertEqual(background_http.ca_certs, 'ca.pem')
+        self.assertTrue(background_http.disable_ssl_certificate_validation)
+
+        pooled_http = object()
+        self.assertIs(client._background_http(pooled_http), pooled_http)
+
+    @mock.patch('oauth2client_latest.client.logger')
+    def test_background_refetch_failure(self, logger):
+        self.certificate_set._http = HttpMockSequence(
+            [({'status': '500'}, b'')])
+        self.certificate_set._refetching = True
+        self.certificate_set._refetch()
+        self.assertFalse(self.certificate_set._refetching)
+        logger.exception.assert_called_once_with(
+            'Background refetch of %s failed', 'http://example.com')
+
+    def test_concurrent_callers_fetch_once(self):
+        fetching = threading.Event()
+        release = threading.Event()
+        requests = []
+
+        def request(uri, **kwargs):
+            requests.append(uri)
+            fetching.set()
+            release.wait(5)
+            return (httplib2.Response(
+                {'status': '200', 'cache-control': 'max-age=3600'}),
+                datafile('certs.json'))
+
+        http = mock.Mock(request=request)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                self.certificate_set.get_verifiers(http)))
+            for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        fetching.wait(5)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(requests, ['http://example.com'])
+        self.assertEqual(len(results), 16)
+        for verifiers in results:
+            self.assertIs(verifiers, results[0])
+
+    def test_verify_id_token_shares_certificate_set(self):
+        with mock.patch.object(client, '_certificate_sets', new={}):
+            certificate_set = client._get_certificate_set('http://example.com')
+            self.assertIs(client._get_certificate_set('http://example.com'),
+                          certificate_set)
+            self.assertIsNot(client._get_certificate_set('http://other.com'),
+                             certificate_set)
+
+
+class VerifyIdTokensTests(unittest2.TestCase):
+
+    AUDIENCE = 'some_audience_address@testing.gserviceaccount.com'
+
+    def setUp(self):
+        patcher = mock.patch.object(client, '_certificate_sets', new={})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.http = HttpMockSequence([
+            ({'status': '200'}, datafile('certs.json')),
+        ])
+
+    def _create_signed_jwt(self, key_id='foo', audience=AUDIENCE):
+        signer = crypt.Signer.from_string(datafile('privatekey.pem'))
+        now = int(time.time())
+        return crypt.make_signed_jwt(signer, {
+            'aud': audience,
+            'iat': now,
+            'exp': now + 300,
+            'user': 'billy bob',
+        }, key_id=key_id)
+
+    def test_results_in_order(self):
+        id_tokens = [
+            self._create_signed_jwt(),
+            self._create_signed_jwt(audience='somebody else'),
+            'foo.bar.baz',
+            self._create_signed_jwt(key_id=None),
+        ]
+
+        results = client.verify_id_tokens(id_tokens, self.AUDIENCE,
+                                          http=self.http)
+
+        self.assertEqual(len(results), 4)
+        self.assertEqual(results[0].payload['user'], 'billy bob')
+        self.assertIsNone(results[0].error)
+        self.assertIsNone(results[1].payload)
+        self.assertIn('Wrong recipient', str(results[1].error))
+        self.assertIsInstance(results[2].error, crypt.AppIdentityError)
+        self.assertEqual(results[3].payload['user'], 'billy bob')
+        self.assertEqual(len(self.http.requests), 1)
+
+    def test_not_a_string(self):
+        results = client.verify_id_tokens(
+            [None, self._create_signed_jwt()], self.AUDIENCE, http=self.http)
+
+        self.assertIsNone(results[0].payload)
+        self.assertIsInstance(results[0].error, ValueError)
+        self.assertEqual(results[1].payload['user'], 'billy bob')
+
+    def test_pems_match_verifiers(self):
+        pool = mock.Mock(spec=multiprocessing_pool.Pool)
+        pool.map.side_effect = lambda func, chunks: list(map(func, chunks))
+        headers = {'cache-control': 'max-age=3600'}
+        certificate_set = client._CertificateSet('http://example.com')
+        certificate_set.update(200, headers, datafile('certs.json'))
+
+        def refetch():
+            # A background refetch replaces the certificates meanwhile.
+            certificate_set.update(200, headers, b'{"bar": ' + json.dumps(
+                datafile('public_cert.pem').decode('ascii')).encode('ascii')
+                + b'}')
+
+        with mock.patch.object(client, '_get_certificate_set',
+                               return_value=certificate_set):
+            with mock.patch.object(certificate_set, '_maybe_refetch',
+                                   side_effect=refetch):
+                results = client.verify_id_tokens(
+                    [self._create_signed_jwt()], self.AUDIENCE,
+                    http=self.http, pool=pool)
+
+        self.assertEqual(results[0].payload['user'], 'billy bob')
+        (unused_tokens, unused_key_id, certs, unused_audience), = (
+            pool.map.call_args[0][1])
+        self.assertEqual(list(certs), ['foo'])
+
+    def test_bad_status(self):
+        http = HttpMockSequence([({'status': '404'}, b'')])
+        with self.assertRaises(client.VerifyJwtTokenError):
+            client.verify_id_tokens([self._create_signed_jwt()],
+                                    self.AUDIENCE, http=http)
+
+    @mock.patch.object(client, '_VERIFY_ID_TOKENS_CHUNK_SIZE', new=2)
+    def test_chunks_grouped_by_key_id(self):
+        id_tokens = [self._create_signed_jwt(key_id=key_id)
+                     for key_id in ('foo', None, 'foo', 'unknown', 'foo')]
+        pool = mock.Mock()
+        pool.map.side_effect = lambda func, chunks: list(map(func, chunks))
+
+        results = client.verify_id_tokens(id_tokens, self.AUDIENCE,
+                                          http=self.http, pool=pool)
+
+        self.assertTrue(all(result.error is None for result in results))
+        chunks = pool.map.call_args[0][1]
+        by_size = sorted(chunks, key=lambda chunk: len(chunk[0]))
+        self.assertEqual([len(chunk[0]) for chunk in by_size], [1, 2, 2])
+        # Tokens without a known key ID are verified against all the certs.
+        for tokens, key_id, certs, audience in chunks:
+            self.assertIn(key_id, ('foo', None))
+            self.assertEqual(list(certs), ['foo'])
+            self.assertIsInstance(certs['foo'], crypt.Verifier)
+            self.assertEqual(audience, self.AUDIENCE)
+
+    def test_process_pool_gets_pems(self):
+        pool = mock.Mock(spec=multiprocessing_pool.Pool)
+        pool.map.side_effect = lambda func, chunks: list(map(func, chunks))
+
+        results = client.verify_id_tokens([self._create_signed_jwt()],
+                                          self.AUDIENCE, http=self.http,
+                                          pool=pool)
+
+        self.assertEqual(results[0].payload['user'], 'billy bob')
+        (unused_tokens, unused_key_id, certs, unused_audience), = (
+            pool.map.call_args[0][1])
+        self.assertEqual(certs, json.loads(
+            datafile('certs.json').decode('utf-8')))
+
+    @mock.patch.object(client, '_VERIFY_ID_TOKENS_CHUNK_SIZE', new=1)
+    @mock.patch.object(client, '_pem_verifiers', new={})
+    def test_process_pool_parses_pems_once(self):
+        pool = mock.Mock(spec=multiprocessing_pool.Pool)
+        pool.map.side_effect = lambda func, chunks: list(map(func, chunks))
+        id_tokens = [self._create_signed_jwt() for _ in range(3)]
+
+        with mock.patch.object(crypt.Verifier, 'from_string',
+                               wraps=crypt.Verifier.from_string) as parse:
+            results = client.verify_id_tokens(id_tokens, self.AUDIENCE,
+                                              http=self.http, pool=pool)
+
+        self.assertTrue(all(result.error is None for result in results))
+        self.assertEqual(len(pool.map.call_args[0][1]), 3)
+        # Once for the certificate set, and once for all the chunks.
+        self.assertEqual(parse.call_count, 2)
+        self.assertEqual(len(client._pem_verifiers), 1)
+
+    def test_headers_decoded_once(self):
+        id_tokens = [self._create_signed_jwt() for _ in range(3)]
+
+        with mock.patch.object(crypt, '_get_key_id',
+                               wraps=crypt._get_key_id) as get_key_id:
+            results = client.verify_id_tokens(id_tokens, self.AUDIENCE,
+                                              http=self.http)
+
+        self.assertTrue(all(result.error is None for result in results))
+        self.assertEqual(get_key_id.call_count, len(id_tokens))
+
+
 class SignedJwtAssertionCredentialsTests(unittest2.TestCase):
 
     def setUp(self):
@@ -75,6 +75,37 @@ class ServiceAccountCredentialsTests(unittest2.TestCase):
         expected_serialized.update(to_serialize)
         self.assertEqual(serialized_data, expected_serialized)
 
+    def test_to_from_compact_json(self):
+        self.credentials._private_key_pkcs8_pem = self.private_key.decode(
+            'ascii')
+        self.credentials._kwargs = {'sub': 'user@example.com'}
+        self.credentials.access_token = 'token'
+        self.credentials.token_expiry = datetime.datetime(2016, 1, 1)
+        compact = self.credentials.to_compact_json()
+        self.assertLess(len(compact), len(self.credentials.to_json()))
+
+        with mock.patch.object(service_account.crypt.Signer, 'from_string',
+                               return_value=self.signer) as from_string:
+            credentials = client.Credentials.new_from_json(compact)
+        from_string.assert_called_once_with(
+            self.credentials._private_key_pkcs8_pem)
+        self.assertIsInstance(credentials,
+                              service_account.ServiceAccountCredentials)
+        self.assertEqual(
+            json.loads(credentials.to_json()),
+            json.loads(self.credentials.to_json()))
+
+        # The PKCS#12 key is base64 encoded like by to_json().
+        self.credentials._private_key_pkcs8_pem = None
+        self.credentials._private_key_pkcs12 = b'\x00key'
+        self.credentials._private_key_password = 'notasecret'
+        with mock.patch.object(service_account.crypt.Signer, 'from_string',
+                               return_value=self.signer) as from_string:
+            credentials = client.Credentials.new_from_json(
+                self.credentials.to_compact_json())
+        from_string.assert_called_once_with(b'\x00key', 'notasecret')
+        self.assertEqual(credentials._private_key_pkcs12, b'\x00key')
+
     def test_sign_blob(self):
         private_key_id, signature = self.credentials.sign_blob('Google')
         self.assertEqual(self.private_key_id, private_key_id)
@@ -534,6 +565,72 @@ class JWTAccessCredentialsTests(unittest2.TestCase):
         # Ensure we do not cache the token
         self.assertIsNone(jwt.access_token)
 
+    @mock.patch('oauth2client_latest.client._UTCNOW')
+    def test_authorize_no_aud_reuses_token(self, utcnow):
+        utcnow.return_value = T1_DATE
+        jwt = service_account._JWTAccessCredentials(
+            self.service_account_email, self.signer,
+            private_key_id=self.private_key_id, client_id=self.client_id)
+        h = HttpMockSequence([({'status': '200'}, b'')] * 4)
+        jwt.authorize(h)
+
+        with mock.patch.object(jwt, '_create_token',
+                               wraps=jwt._create_token) as create_token:
+            h.request(self.url + '?a=1')
+            h.request(self.url + '?a=2')
+            h.request('https://other.url.com')
+            self.assertEqual(create_token.mock_calls, [
+                mock.call({'aud': self.url}),
+                mock.call({'aud': 'https://other.url.com'}),
+            ])
+
+            # Tokens close to expiring are replaced.
+            utcnow.return_value = T1_DATE + datetime.timedelta(
+                seconds=jwt._MAX_TOKEN_LIFETIME_SECS -
+                service_account._AUDIENCE_TOKEN_REFRESH_SECS)
+            h.request(self.url)
+            self.assertEqual(create_token.call_count, 3)
+
+        tokens = [request['headers'][b'Authorization'] for request in
+                  h.requests]
+        self.assertEqual(tokens[0], tokens[1])
+        self.assertNotEqual(tokens[0], tokens[2])
+        self.assertNotEqual(tokens[0], tokens[3])
+        self.assertIsNone(jwt.access_token)
+        self.assertNotIn('_audience', jwt.to_json())
+
+    @mock.patch('oauth2client_latest.client._UTCNOW')
+    def test_authorize_no_aud_401(self, utcnow):
+        utcnow.return_value = T1_DATE
+        jwt = service_account._JWTAccessCredentials(
+            self.service_account_email, self.signer,
+            private_key_id=self.private_key_id, client_id=self.client_id)
+        h = HttpMockSequence([
+            ({'status': '401'}, b''),
+            ({'status': '200'}, b''),
+            ({'status': '200'}, b''),
+        ])
+        jwt.authorize(h)
+
+        self.assertEqual(h.request(self.url)[0].status, 401)
+        utcnow.return_value = T2_DATE
+        h.request(self.url)
+        h.request(self.url)
+
+        tokens = [request['headers'][b'Authorization'] for request in
+                  h.requests]
+        # The rejected token is not reused.
+        self.assertNotEqual(tokens[0], tokens[1])
+        self.assertEqual(tokens[1], tokens[2])
+
+    def test_invalidate_audience_token_other_token(self):
+        self.jwt._get_audience_cache().set('aud', ('token', T1_EXPIRY_DATE))
+        self.jwt._invalidate_audience_token('aud', 'old_token')
+        self.assertEqual(self.jwt._get_audience_cache().get('aud'),
+                         ('token', T1_EXPIRY_DATE))
+        self.jwt._invalidate_audience_token('aud', 'token')
+        self.assertIsNone(self.jwt._get_audience_cache().get('aud'))
+
     @mock.patch('oauth2client_latest.client._UTCNOW')
     def test_authorize_stale_token(self, utcnow):
         utcnow.return_value = T1_DATE
@@ -12,6 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import datetime
+import threading
+
 import httplib2
 import mock
 import unittest2
@@ -31,6 +34,91 @@ class TestMemoryCache(unittest2.TestCase):
         cache.delete('foo')
         self.assertIsNone(cache.get('foo'))
 
+    def test_counters(self):
+        cache = transport.MemoryCache()
+        cache.set('foo', 'bar')
+        cache.get('foo')
+        cache.get('foo')
+        cache.get('baz')
+        self.assertEqual(cache.hits, 2)
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(cache.evictions, 0)
+
+    def test_evicts_least_recently_used(self):
+        cache = transport.MemoryCache(max_entries=2)
+        cache.set('a', '1')
+        cache.set('b', '2')
+        cache.get('a')
+        cache.set('c', '3')
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.evictions, 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), '1')
+        self.assertEqual(cache.get('c'), '3')
+
+    def test_set_existing_key_does_not_evict(self):
+        cache = transport.MemoryCache(max_entries=2)
+        cache.set('a', '1')
+        cache.set('b', '2')
+        cache.set('a', '3')
+        self.assertEqual(cache.evictions, 0)
+        self.assertEqual(cache.get('a'), '3')
+        self.assertEqual(cache.get('b'), '2')
+
+    @mock.patch('time.time')
+    def test_max_age_expiry(self, time_mock):
+        time_mock.return_value = 1000.0
+        cache = transport.MemoryCache()
+        cache.set('foo', (b'status: 200\r\n'
+                          b'cache-control: public, max-age=60\r\n'
+                          b'\r\ncontent'))
+        cache.set('bar', b'status: 200\r\n\r\nmax-age=0')
+
+        time_mock.return_value = 1059.0
+        self.assertIsNotNone(cache.get('foo'))
+        time_mock.return_value = 1060.0
+        self.assertIsNone(cache.get('foo'))
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(len(cache), 1)
+        # Only the headers are looked at.
+        self.assertIsNotNone(cache.get('bar'))
+
+    def test_threads(self):
+        cache = transport.MemoryCache(max_entries=10)
+
+        def worker(prefix):
+            for i in range(200):
+                key = '{0}{1}'.format(prefix, i % 20)
+                cache.set(key, key)
+                cache.get(key)
+                cache.delete(key)
+
+        threads = [threading.Thread(target=worker, args=(str(n),))
+                   for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.hits + cache.misses, 8 * 200)
+
+
+class Test__cache_max_age(unittest2.TestCase):
+
+    def test_max_age(self):
+        value = (b'status: 200\r\ncontent-type: application/json\r\n'
+                 b'Cache-Control: public, max-age=21093, '
+                 b'must-revalidate\r\n\r\n{}')
+        self.assertEqual(transport._cache_max_age(value), 21093)
+
+    def test_no_max_age(self):
+        value = b'status: 200\r\ncache-control: no-cache\r\n\r\n{}'
+        self.assertIsNone(transport._cache_max_age(value))
+        self.assertIsNone(transport._cache_max_age(b'status: 200\r\n\r\n'))
+
+    def test_not_bytes(self):
+        self.assertIsNone(transport._cache_max_age(u'max-age=10'))
+
 
 class Test_get_cached_http(unittest2.TestCase):
 
@@ -60,6 +148,51 @@ class Test_get_http_object(unittest2.TestCase):
         self.assertEqual(result, http_klass.return_value)
         http_klass.assert_called_once_with(1, 2, foo='bar')
 
+    @mock.patch.object(transport, '_HTTP_FACTORY', new=None)
+    def test_with_factory(self):
+        factory = mock.Mock(return_value=object())
+        transport.set_http_factory(factory)
+        result = transport.get_http_object(foo='bar')
+        self.assertEqual(result, factory.return_value)
+        factory.assert_called_once_with(foo='bar')
+
+        transport.set_http_factory(None)
+        self.assertIsNone(transport._HTTP_FACTORY)
+
+    @mock.patch.object(transport, '_LOGGER')
+    @mock.patch.object(transport, '_HTTP_FACTORY')
+    def test_factory_without_httplib2_args(self, factory, logger):
+        result = transport.get_http_object(
+            timeout=5, ca_certs='certs.pem', cache=None)
+        self.assertEqual(result, factory.return_value)
+        factory.assert_called_once_with(timeout=5)
+        logger.warning.assert_called_once_with(
+            mock.ANY, 'ca_certs, cache')
+
+    @mock.patch.object(transport, '_LOGGER')
+    @mock.patch.object(transport, '_HTTP_FACTORY')
+    def test_factory_with_positional_args(self, factory, logger):
+        cache = object()
+        result = transport.get_http_object(cache, 5)
+        self.assertEqual(result, factory.return_value)
+        factory.assert_called_once_with(timeout=5)
+        logger.warning.assert_called_once_with(mock.ANY, 'cache')
+
+    @mock.patch.object(transport, '_HTTP_FACTORY')
+    def test_factory_with_bad_positional_args(self, factory):
+        with self.assertRaises(TypeError):
+            transport.get_http_object(*range(8))
+        with self.assertRaises(TypeError):
+            transport.get_http_object(None, 5, timeout=5)
+        self.assertFalse(factory.called)
+
+    @mock.patch.object(transport, '_LOGGER')
+    @mock.patch.object(httplib2, 'Http', return_value=object())
+    def test_httplib2_args_without_factory(self, http_klass, logger):
+        transport.get_http_object(ca_certs='certs.pem')
+        http_klass.assert_called_once_with(ca_certs='certs.pem')
+        self.assertFalse(logger.warning.called)
+
 
 class Test__initialize_headers(unittest2.TestCase):
 
@@ -126,6 +259,44 @@ class Test_clean_headers(unittest2.TestCase):
         self.assertEqual(result, header_str)
 
 
+class Test__token_needs_refresh(unittest2.TestCase):
+
+    def _make_credentials(self, access_token='token', expires_in=3600):
+        token_expiry = None
+        if expires_in is not None:
+            token_expiry = (datetime.datetime.utcnow() +
+                            datetime.timedelta(seconds=expires_in))
+        return client.OAuth2Credentials(
+            access_token, 'client_id', 'client_secret', 'refresh_token',
+            token_expiry, 'token_uri', 'user_agent')
+
+    def test_valid(self):
+        credentials = self._make_credentials()
+        self.assertFalse(transport._token_needs_refresh(credentials))
+
+    def test_no_expiry(self):
+        credentials = self._make_credentials(expires_in=None)
+        self.assertFalse(transport._token_needs_refresh(credentials))
+
+    def test_no_access_token(self):
+        credentials = self._make_credentials(access_token=None)
+        self.assertTrue(transport._token_needs_refresh(credentials))
+
+    def test_invalid(self):
+        credentials = self._make_credentials()
+        credentials.invalid = True
+        self.assertTrue(transport._token_needs_refresh(credentials))
+
+    def test_expired(self):
+        credentials = self._make_credentials(expires_in=-10)
+        self.assertTrue(transport._token_needs_refresh(credentials))
+
+    def test_within_margin(self):
+        credentials = self._make_credentials(
+            expires_in=transport.EXPIRY_MARGIN_SECS - 5)
+        self.assertTrue(transport._token_needs_refresh(credentials))
+
+
 class Test_wrap_http_for_auth(unittest2.TestCase):
 
     def test_wrap(self):